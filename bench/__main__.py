@@ -0,0 +1,345 @@
+"""
+Benchmark das conversões (texto, DOCX e planilha) sobre um corpus sintético.
+
+Uso:
+    python -m bench run --pipelines text,excel --pages 1,10,100 --out antes.json
+    python -m bench run --modes load --concurrency 16 --out carga.json
+    python -m bench compare antes.json depois.json
+
+Modos:
+    inprocess  chama o processor direto (sem HTTP), um documento de cada vez
+    asgi       envia o PDF pela aplicação FastAPI com httpx, um de cada vez
+    load       vários clientes ao mesmo tempo pela aplicação, para ver a
+               vazão e o quanto o event loop fica bloqueado
+
+O cache de resultados fica desligado (a não ser com --with-cache) e cada
+request sai de um IP diferente, para não esbarrar no rate limiter.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+from bench.corpus import KINDS, DEFAULT_PAGE_COUNTS, build_corpus
+from bench.measure import LoopLagMonitor, PeakRSS, Stopwatch, latency_summary
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = ("inprocess", "asgi", "load")
+
+# Conversão -> (módulo do processor, função, rota, PDF gravado em disco)
+PIPELINES = {
+    "text": ("modules.pdf_to_text.processor", "convert_pdf_to_text", "/pdf-to-text/", False),
+    "docx": ("modules.pdf_to_docx.processor", "convert_pdf_to_docx", "/pdf-to-docx/", True),
+    "excel": ("modules.pdf_to_excel.processor", "convert_pdf_to_excel", "/pdf-to-excel/", True)
+}
+
+
+def _csv_list(value: str) -> list:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _client_ip(counter: int) -> str:
+    return f"10.{(counter >> 16) & 255}.{(counter >> 8) & 255}.{counter & 255}"
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Runner:
+    """Executa os casos (modo, conversão, documento) e junta os resultados."""
+
+    def __init__(self, args):
+        self.args = args
+        self.request_counter = 0
+        self._client = None
+
+    # Uma conversão
+
+    async def run_inprocess(self, pipeline: str, data: bytes) -> int:
+        from fastapi import HTTPException
+        from core.common import UploadedPDF, clean_up_temp_directory
+
+        module_name, function_name, _, spool = PIPELINES[pipeline]
+        convert = getattr(importlib.import_module(module_name), function_name)
+        upload = UploadedPDF.from_bytes("bench.pdf", data, spool=spool)
+        try:
+            result = await convert(upload)
+            # FileResponse: a limpeza normalmente roda depois do envio
+            path = getattr(result, "path", None)
+            if path and os.path.dirname(path) != upload.temp_dir:
+                clean_up_temp_directory(os.path.dirname(path))
+            return 200
+        except HTTPException as e:
+            return e.status_code
+        finally:
+            upload.cleanup()
+
+    async def client(self):
+        if self._client is None:
+            import httpx
+            from main import app
+
+            self._client = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app), base_url="http://localhost", timeout=None
+            )
+        return self._client
+
+    async def run_asgi(self, pipeline: str, data: bytes) -> int:
+        client = await self.client()
+        self.request_counter += 1
+        response = await client.post(
+            PIPELINES[pipeline][2],
+            files={"file": ("bench.pdf", data, "application/pdf")},
+            headers={"x-forwarded-for": _client_ip(self.request_counter)}
+        )
+        await response.aread()
+        return response.status_code
+
+    # Um caso
+
+    async def sequential_case(self, mode: str, pipeline: str, pages: int, data: bytes) -> dict:
+        run = self.run_inprocess if mode == "inprocess" else self.run_asgi
+        for _ in range(self.args.warmup):
+            await run(pipeline, data)
+
+        statuses = Counter()
+        latencies = []
+        monitor = LoopLagMonitor()
+        if self.args.tracemalloc:
+            tracemalloc.start()
+
+        with PeakRSS() as rss:
+            monitor.start()
+            for _ in range(self.args.repeat):
+                with Stopwatch() as watch:
+                    status = await run(pipeline, data)
+                statuses[status] += 1
+                if status == 200:
+                    latencies.append(watch.seconds)
+            loop_lag = await monitor.stop()
+
+        result = {
+            "runs": self.args.repeat,
+            "statuses": {str(status): count for status, count in statuses.items()},
+            "latency": latency_summary(latencies),
+            "pages_per_sec": round(pages * len(latencies) / sum(latencies), 2) if latencies else 0.0,
+            "rss_peak_mb": rss.self_mb,
+            "workers_rss_peak_mb": rss.workers_mb,
+            "loop_lag": loop_lag
+        }
+        if self.args.tracemalloc:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            # Só o processo principal; o que roda nos pools não aparece aqui
+            result["alloc_peak_mb"] = round(peak / (1024 * 1024), 1)
+        return result
+
+    async def load_case(self, pipeline: str, pages: int, data: bytes) -> dict:
+        for _ in range(self.args.warmup):
+            await self.run_asgi(pipeline, data)
+
+        statuses = Counter()
+        latencies = []
+        remaining = [self.args.load_requests]
+
+        async def worker():
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                with Stopwatch() as watch:
+                    status = await self.run_asgi(pipeline, data)
+                statuses[status] += 1
+                if status == 200:
+                    latencies.append(watch.seconds)
+
+        monitor = LoopLagMonitor()
+        with PeakRSS() as rss, Stopwatch() as wall:
+            monitor.start()
+            await asyncio.gather(*[worker() for _ in range(self.args.concurrency)])
+            loop_lag = await monitor.stop()
+
+        return {
+            "runs": self.args.load_requests,
+            "concurrency": self.args.concurrency,
+            "statuses": {str(status): count for status, count in statuses.items()},
+            "latency": latency_summary(latencies),
+            "wall_seconds": round(wall.seconds, 3),
+            "requests_per_sec": round(len(latencies) / wall.seconds, 2) if wall.seconds else 0.0,
+            "pages_per_sec": round(pages * len(latencies) / wall.seconds, 2) if wall.seconds else 0.0,
+            "rss_peak_mb": rss.self_mb,
+            "workers_rss_peak_mb": rss.workers_mb,
+            "loop_lag": loop_lag
+        }
+
+    async def run(self, documents) -> list:
+        results = []
+        for mode in self.args.modes:
+            for pipeline in self.args.pipelines:
+                for kind, pages, path in documents:
+                    with open(path, "rb") as pdf_file:
+                        data = pdf_file.read()
+
+                    if mode == "load":
+                        measured = await self.load_case(pipeline, pages, data)
+                    else:
+                        measured = await self.sequential_case(mode, pipeline, pages, data)
+
+                    case = {"mode": mode, "pipeline": pipeline, "kind": kind, "pages": pages,
+                            "size_bytes": len(data), **measured}
+                    results.append(case)
+                    print(
+                        f"{mode:9} {pipeline:5} {kind:5} {pages:5}p  "
+                        f"p50 {case['latency']['p50_ms']:9.1f}ms  p99 {case['latency']['p99_ms']:9.1f}ms  "
+                        f"{case['pages_per_sec']:8.1f} pág/s  rss {case['rss_peak_mb']:7.1f}MB  "
+                        f"loop máx {case['loop_lag']['max_ms']:7.1f}ms  {case['statuses']}",
+                        file=sys.stderr
+                    )
+        return results
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+
+async def run_benchmark(args) -> dict:
+    documents = build_corpus(args.corpus_dir, args.kinds, args.pages, args.seed)
+    runner = Runner(args)
+    started = time.time()
+    try:
+        results = await runner.run(documents)
+    finally:
+        await runner.close()
+        from core.executor import conversion_executor, extraction_executor
+        conversion_executor.shutdown()
+        extraction_executor.shutdown()
+
+    return {
+        "meta": {
+            "revision": _git_revision(),
+            "started_at": started,
+            "duration_seconds": round(time.time() - started, 1),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key != "func"}
+        },
+        "results": results
+    }
+
+
+def command_run(args):
+    for name, allowed in (("modes", MODES), ("pipelines", PIPELINES), ("kinds", KINDS)):
+        invalid = [value for value in getattr(args, name) if value not in allowed]
+        if invalid:
+            sys.exit(f"Valores inválidos em --{name}: {', '.join(invalid)}")
+
+    # Medir a conversão, não o cache nem o pré-carregamento em segundo plano
+    if not args.with_cache:
+        os.environ.setdefault("PDFFACIL_CACHE_MEMORY_ENTRIES", "0")
+        os.environ.setdefault("PDFFACIL_CACHE_DISK_MB", "0")
+    os.environ.setdefault("PDFFACIL_PRELOAD", "0")
+    # main (modos asgi e load) refaz os handlers do logging ao ser importado
+    # (core.logs), então o nível também vai pelo ambiente
+    os.environ["PDFFACIL_LOG_LEVEL"] = args.log_level.upper()
+    logging.basicConfig(level=args.log_level.upper())
+    sys.path.insert(0, REPO_ROOT)
+
+    report = asyncio.run(run_benchmark(args))
+    with open(args.out, "w", encoding="utf-8") as out_file:
+        json.dump(report, out_file, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {args.out}", file=sys.stderr)
+
+
+def _case_key(case: dict) -> tuple:
+    return case["mode"], case["pipeline"], case["kind"], case["pages"]
+
+
+def _change(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+
+def command_compare(args):
+    with open(args.before, encoding="utf-8") as before_file:
+        before = {_case_key(case): case for case in json.load(before_file)["results"]}
+    with open(args.after, encoding="utf-8") as after_file:
+        after = json.load(after_file)["results"]
+
+    regressions = 0
+    print(f"{'caso':34} {'p50 antes':>11} {'p50 depois':>11} {'Δ':>8} {'pág/s Δ':>9} {'rss Δ':>8}")
+    for case in after:
+        old = before.get(_case_key(case))
+        if old is None:
+            continue
+        latency_change = _change(old["latency"]["p50_ms"], case["latency"]["p50_ms"])
+        throughput_change = _change(old["pages_per_sec"], case["pages_per_sec"])
+        rss_change = _change(old["rss_peak_mb"], case["rss_peak_mb"])
+
+        flag = ""
+        if latency_change > args.threshold:
+            flag = "  PIOR"
+            regressions += 1
+        elif latency_change < -args.threshold:
+            flag = "  MELHOR"
+
+        name = "/".join(str(part) for part in _case_key(case))
+        print(
+            f"{name:34} {old['latency']['p50_ms']:9.1f}ms {case['latency']['p50_ms']:9.1f}ms "
+            f"{latency_change:+7.1f}% {throughput_change:+8.1f}% {rss_change:+7.1f}%{flag}"
+        )
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__.split("\n\n")[0].strip())
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Executa o benchmark e grava o JSON")
+    run.add_argument("--modes", type=_csv_list, default=["inprocess", "asgi"],
+                     help="inprocess, asgi e/ou load (padrão: inprocess,asgi)")
+    run.add_argument("--pipelines", type=_csv_list, default=list(PIPELINES), help="text, docx e/ou excel")
+    run.add_argument("--kinds", type=_csv_list, default=list(KINDS), help="text, table e/ou image")
+    run.add_argument("--pages", type=lambda value: [int(item) for item in _csv_list(value)],
+                     default=list(DEFAULT_PAGE_COUNTS), help="Tamanhos dos documentos (padrão: 1,10,100)")
+    run.add_argument("--repeat", type=int, default=5, help="Execuções medidas por caso")
+    run.add_argument("--warmup", type=int, default=1, help="Execuções descartadas antes de medir")
+    run.add_argument("--concurrency", type=int, default=8, help="Clientes simultâneos no modo load")
+    run.add_argument("--load-requests", type=int, default=32, help="Requests por caso no modo load")
+    run.add_argument("--tracemalloc", action="store_true", help="Medir alocações do processo principal (mais lento)")
+    run.add_argument("--with-cache", action="store_true", help="Não desligar o cache de resultados")
+    run.add_argument("--seed", type=int, default=0, help="Semente do corpus")
+    run.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "pdffacil-bench-corpus"))
+    run.add_argument("--out", default="bench-results.json")
+    run.add_argument("--log-level", default="error", help="Nível de log da aplicação durante o benchmark")
+    run.set_defaults(func=command_run)
+
+    compare = commands.add_parser("compare", help="Compara dois resultados")
+    compare.add_argument("before")
+    compare.add_argument("after")
+    compare.add_argument("--threshold", type=float, default=10.0, help="Variação de p50 (%%) considerada relevante")
+    compare.add_argument("--fail-on-regression", action="store_true", help="Sair com código 1 se algo piorou")
+    compare.set_defaults(func=command_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
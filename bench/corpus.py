@@ -0,0 +1,125 @@
+import os
+import random
+import numpy as np
+import pymupdf
+
+# Tipos de documento do corpus sintético
+KINDS = ("text", "table", "image")
+
+# Tamanhos padrão (páginas); 1000 fica de fora por ser lento para gerar
+DEFAULT_PAGE_COUNTS = (1, 10, 100)
+
+# Metadados fixos, para que o mesmo documento gere sempre os mesmos bytes
+FIXED_METADATA = {
+    "title": "pdffacil bench",
+    "author": "pdffacil",
+    "creator": "bench/corpus.py",
+    "producer": "PyMuPDF",
+    "creationDate": "D:20240101000000Z",
+    "modDate": "D:20240101000000Z"
+}
+
+WORDS = (
+    "processamento documento arquivo página texto tabela relatório valor total "
+    "estado município receita despesa contrato análise resultado período anual "
+    "mensal dados informação sistema serviço público pagamento nota fiscal "
+    "empresa cliente fornecedor produto quantidade preço unidade registro"
+).split()
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+
+
+def _paragraph(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _text_page(doc, rng, page_num):
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    page.insert_text((50, 60), f"Seção {page_num + 1}", fontsize=16)
+    paragraphs = "\n\n".join(_paragraph(rng, rng.randint(40, 90)) for _ in range(6))
+    page.insert_textbox(pymupdf.Rect(50, 80, PAGE_WIDTH - 50, PAGE_HEIGHT - 50), paragraphs, fontsize=10)
+
+
+def _table_page(doc, rng, page_num, rows_per_page=40):
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    writer = pymupdf.TextWriter(page.rect)
+    columns = (50, 200, 330, 460)
+    y = 60
+    if page_num == 0:
+        for x, name in zip(columns, ("Estado", "População", "Representantes", "Mudança")):
+            writer.append((x, y), name, fontsize=10)
+        y += 18
+    for row in range(rows_per_page):
+        index = page_num * rows_per_page + row
+        values = (
+            f"Estado {index}",
+            f"{rng.randint(10_000, 9_999_999):,}".replace(",", "."),
+            str(rng.randint(1, 70)),
+            str(rng.randint(-5, 5))
+        )
+        for x, value in zip(columns, values):
+            writer.append((x, y), value, fontsize=10)
+        y += 18
+    writer.write_text(page)
+
+
+def _image_page(doc, rng, page_num, width=400, height=300):
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    # Gradiente com deslocamento por página, gravado como JPEG (como uma foto escaneada)
+    offset = rng.randint(0, 255)
+    y, x = np.mgrid[0:height, 0:width]
+    samples = np.stack(((x + offset) % 256, (y + offset) % 256, (x + y) % 256), axis=-1).astype(np.uint8)
+    pixmap = pymupdf.Pixmap(pymupdf.csRGB, width, height, samples.tobytes(), False)
+    page.insert_image(pymupdf.Rect(95, 100, 95 + width, 100 + height), stream=pixmap.tobytes("jpg", jpg_quality=75))
+    page.insert_text((95, 440), f"Figura {page_num + 1}: {_paragraph(rng, 12)}", fontsize=10)
+
+
+GENERATORS = {
+    "text": _text_page,
+    "table": _table_page,
+    "image": _image_page
+}
+
+
+def generate(kind: str, pages: int, seed: int = 0) -> bytes:
+    """
+    Gera um PDF sintético, sempre com os mesmos bytes para os mesmos argumentos.
+
+    Args:
+        kind: "text", "table" ou "image"
+        pages: Número de páginas
+        seed: Semente do conteúdo
+
+    Returns:
+        bytes: PDF gerado
+    """
+    rng = random.Random(f"{kind}:{pages}:{seed}")
+    doc = pymupdf.open()
+    try:
+        for page_num in range(pages):
+            GENERATORS[kind](doc, rng, page_num)
+        doc.set_metadata(FIXED_METADATA)
+        return doc.tobytes(garbage=3, deflate=True, no_new_id=True)
+    finally:
+        doc.close()
+
+
+def build_corpus(out_dir: str, kinds=KINDS, page_counts=DEFAULT_PAGE_COUNTS, seed: int = 0) -> list:
+    """
+    Gera (ou reaproveita) os PDFs do corpus em out_dir.
+
+    Returns:
+        list: (tipo, páginas, caminho) de cada documento
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    documents = []
+    for kind in kinds:
+        for pages in page_counts:
+            path = os.path.join(out_dir, f"{kind}-{pages}-s{seed}.pdf")
+            if not os.path.exists(path):
+                with open(f"{path}.partial", "wb") as pdf_file:
+                    pdf_file.write(generate(kind, pages, seed))
+                os.replace(f"{path}.partial", path)
+            documents.append((kind, pages, path))
+    return documents
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import resource
+import time
+
+
+def percentile(values, fraction: float) -> float:
+    """Percentil por interpolação linear (0 se não há valores)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def latency_summary(seconds) -> dict:
+    """p50/p95/p99, média, mínimo e máximo, em milissegundos."""
+    values = [value * 1000 for value in seconds]
+    return {
+        "p50_ms": round(percentile(values, 0.50), 3),
+        "p95_ms": round(percentile(values, 0.95), 3),
+        "p99_ms": round(percentile(values, 0.99), 3),
+        "mean_ms": round(sum(values) / len(values), 3) if values else 0.0,
+        "min_ms": round(min(values), 3) if values else 0.0,
+        "max_ms": round(max(values), 3) if values else 0.0
+    }
+
+
+def _read_status_kb(pid, field: str) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def child_pids(pid: int = None) -> list:
+    """PIDs dos filhos diretos (workers dos pools de conversão), lidos de /proc."""
+    pid = pid or os.getpid()
+    children = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return children
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                # O nome do processo pode ter espaços; o ppid vem depois do ")"
+                fields = stat.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+class PeakRSS:
+    """
+    Pico de memória residente do processo e dos workers durante um trecho.
+
+    No Linux o pico (VmHWM) é zerado no início com /proc/<pid>/clear_refs;
+    sem /proc, cai para ru_maxrss, que é o pico desde o início do processo.
+    """
+
+    def __init__(self):
+        self.self_mb = 0.0
+        self.workers_mb = 0.0
+
+    @staticmethod
+    def _reset(pid):
+        try:
+            with open(f"/proc/{pid}/clear_refs", "w") as clear_refs:
+                clear_refs.write("5")
+        except OSError:
+            pass
+
+    def __enter__(self):
+        for pid in ["self"] + child_pids():
+            self._reset(pid)
+        return self
+
+    def __exit__(self, *exc_info):
+        self_kb = _read_status_kb("self", "VmHWM") or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.self_mb = round(self_kb / 1024, 1)
+        self.workers_mb = round(sum(_read_status_kb(pid, "VmHWM") for pid in child_pids()) / 1024, 1)
+        return False
+
+
+class LoopLagMonitor:
+    """
+    Mede quanto o event loop atrasa para acordar uma tarefa que dorme em
+    intervalos curtos; atrasos grandes indicam código bloqueando o loop.
+
+    Args:
+        interval: Intervalo do sono, em segundos
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.lags = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        self.lags = []
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> dict:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        lags_ms = [lag * 1000 for lag in self.lags]
+        return {
+            "max_ms": round(max(lags_ms), 3) if lags_ms else 0.0,
+            "p99_ms": round(percentile(lags_ms, 0.99), 3),
+            # Tempo total em que o loop ficou parado mais de 50ms seguidos
+            "blocked_ms": round(sum(lag for lag in lags_ms if lag > 50), 3),
+            "samples": len(lags_ms)
+        }
+
+
+class Stopwatch:
+    """Cronômetro de parede para um trecho (with Stopwatch() as watch: ...)."""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.seconds = 0.0
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self.start
+        return False
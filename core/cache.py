@@ -0,0 +1,265 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from core.common import get_env_int
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """
+    Cache de resultados de conversão, endereçado pelo conteúdo do PDF.
+
+    Dois níveis:
+        - memória (LRU por número de entradas) para o JSON de texto
+        - disco (LRU limitado em bytes) para arquivos .docx/.xlsx gerados,
+          com os headers X-* da resposta em um arquivo <chave>.meta ao lado
+    """
+
+    def __init__(self):
+        # Entradas de JSON mantidas em memória
+        self.memory_max_entries = get_env_int("PDFFACIL_CACHE_MEMORY_ENTRIES", 256)
+
+        # Diretório e tamanho máximo do nível em disco
+        self.disk_dir = os.environ.get(
+            "PDFFACIL_CACHE_DIR",
+            os.path.join(tempfile.gettempdir(), "pdffacil-cache")
+        )
+        self.disk_max_bytes = get_env_int("PDFFACIL_CACHE_DISK_MB", 512) * 1024 * 1024
+
+        # Se um acerto no cache ainda conta para o limite diário do IP
+        self.hits_count_against_limit = os.environ.get("PDFFACIL_CACHE_HITS_COUNT", "1") == "1"
+
+        self._memory = OrderedDict()
+        self._disk = OrderedDict()  # chave -> (caminho, tamanho)
+        self._disk_bytes = 0
+        self._disk_loaded = False
+
+        self.stats = {
+            "memory_hits": 0,
+            "memory_misses": 0,
+            "memory_evictions": 0,
+            "disk_hits": 0,
+            "disk_misses": 0,
+            "disk_evictions": 0
+        }
+
+    @staticmethod
+    def make_key(content, kind: str, options: dict = None) -> str:
+        """
+        Gera a chave do cache: SHA-256 do PDF + tipo de conversão + opções.
+
+        Args:
+            content: Bytes do PDF enviado
+            kind: Tipo de conversão ("pdf_to_text", "pdf_to_docx", ...)
+            options: Opções que alteram o resultado
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        return ResultCache.make_key_from_digest(digest, kind, options)
+
+    @staticmethod
+    def make_key_from_digest(digest: str, kind: str, options: dict = None) -> str:
+        """Gera a chave a partir de um SHA-256 já calculado."""
+        options_part = json.dumps(options or {}, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{digest}|{kind}|{options_part}".encode()).hexdigest()
+
+    def should_check_rate_limit(self, hit: bool) -> bool:
+        """Indica se o request deve passar pelo rate limiter."""
+        return not hit or self.hits_count_against_limit
+
+    # Nível em memória
+
+    def get_json(self, key: str):
+        """Retorna uma cópia rasa do resultado em cache, ou None."""
+        value = self._memory.get(key)
+        if value is None:
+            self.stats["memory_misses"] += 1
+            return None
+
+        self._memory.move_to_end(key)
+        self.stats["memory_hits"] += 1
+        return dict(value)
+
+    def put_json(self, key: str, value: dict):
+        """Armazena um resultado JSON, descartando os menos usados."""
+        if self.memory_max_entries <= 0:
+            return
+
+        self._memory[key] = dict(value)
+        self._memory.move_to_end(key)
+
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+            self.stats["memory_evictions"] += 1
+
+    # Nível em disco
+
+    def _load_disk_index(self):
+        """Reconstrói o índice do disco a partir dos arquivos existentes."""
+        self._disk_loaded = True
+        os.makedirs(self.disk_dir, exist_ok=True)
+
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            key, _, extension = name.partition(".")
+            if not extension or extension == "meta" or name.endswith(".partial"):
+                continue
+            if not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, key, path, stat.st_size))
+
+        for _, key, path, size in sorted(entries):
+            self._disk[key] = (path, size)
+            self._disk_bytes += size
+
+        self._evict_disk()
+
+    def _evict_disk(self):
+        while self._disk and self._disk_bytes > self.disk_max_bytes:
+            _, (path, size) = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.stats["disk_evictions"] += 1
+            for evicted_path in (path, self._meta_path(path)):
+                try:
+                    os.remove(evicted_path)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _meta_path(path: str) -> str:
+        return f"{os.path.splitext(path)[0]}.meta"
+
+    def get_file(self, key: str):
+        """Retorna o caminho do arquivo em cache, ou None."""
+        if not self._disk_loaded:
+            self._load_disk_index()
+
+        entry = self._disk.get(key)
+        if entry is None or not os.path.exists(entry[0]):
+            if entry is not None:
+                del self._disk[key]
+                self._disk_bytes -= entry[1]
+            self.stats["disk_misses"] += 1
+            return None
+
+        self._disk.move_to_end(key)
+        self.stats["disk_hits"] += 1
+        try:
+            os.utime(entry[0])
+        except OSError:
+            pass
+        return entry[0]
+
+    def get_file_headers(self, key: str) -> dict:
+        """Headers X-* guardados com o arquivo em cache ({} se não houver)."""
+        entry = self._disk.get(key)
+        if entry is None:
+            return {}
+        try:
+            with open(self._meta_path(entry[0]), encoding="utf-8") as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return {}
+
+    def put_file(self, key: str, source_path: str, extension: str, headers=None):
+        """
+        Copia um arquivo gerado para o cache em disco.
+
+        Args:
+            key: Chave do cache
+            source_path: Arquivo gerado pela conversão
+            extension: Extensão do arquivo (.docx, .xlsx)
+            headers: Headers da resposta; os X-* voltam nos acertos (get_file_headers)
+        """
+        if self.disk_max_bytes <= 0:
+            return
+        if not self._disk_loaded:
+            self._load_disk_index()
+
+        size = os.path.getsize(source_path)
+        if size > self.disk_max_bytes:
+            return
+
+        path = os.path.join(self.disk_dir, f"{key}{extension}")
+        try:
+            # Copiar para um nome temporário e renomear (atômico)
+            partial_path = f"{path}.partial"
+            shutil.copyfile(source_path, partial_path)
+            os.replace(partial_path, path)
+
+            meta_path = self._meta_path(path)
+            if headers is not None:
+                kept = {name: value for name, value in headers.items() if name.lower().startswith("x-")}
+                with open(f"{meta_path}.partial", "w", encoding="utf-8") as meta_file:
+                    json.dump(kept, meta_file)
+                os.replace(f"{meta_path}.partial", meta_path)
+            elif os.path.exists(meta_path):
+                os.remove(meta_path)
+        except OSError as e:
+            logger.warning("Falha ao gravar resultado no cache: %s", e)
+            return
+
+        previous = self._disk.pop(key, None)
+        if previous is not None:
+            self._disk_bytes -= previous[1]
+
+        self._disk[key] = (path, size)
+        self._disk_bytes += size
+        self._evict_disk()
+
+    def get_stats(self) -> dict:
+        """Retorna contadores e ocupação do cache."""
+        return {
+            **self.stats,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+            "disk_max_bytes": self.disk_max_bytes
+        }
+
+
+# Instância global do cache de resultados
+result_cache = ResultCache()
+
+
+def _hit_ratios():
+    ratios = {}
+    for level in ("memory", "disk"):
+        hits = result_cache.stats[f"{level}_hits"]
+        total = hits + result_cache.stats[f"{level}_misses"]
+        ratios[(level,)] = hits / total if total else 0
+    return ratios
+
+
+registry.counter(
+    "pdffacil_cache_lookups_total", "Consultas ao cache de resultados", ["level", "result"],
+    collect=lambda: {
+        tuple(name.split("_")): value for name, value in result_cache.stats.items()
+        if not name.endswith("_evictions")
+    }
+)
+registry.counter(
+    "pdffacil_cache_evictions_total", "Entradas descartadas pelo LRU", ["level"],
+    collect=lambda: {
+        (level,): result_cache.stats[f"{level}_evictions"] for level in ("memory", "disk")
+    }
+)
+registry.gauge(
+    "pdffacil_cache_hit_ratio", "Fração das consultas atendidas pelo cache", ["level"],
+    collect=_hit_ratios
+)
+registry.gauge(
+    "pdffacil_cache_entries", "Entradas guardadas no cache", ["level"],
+    collect=lambda: {("memory",): len(result_cache._memory), ("disk",): len(result_cache._disk)}
+)
+registry.gauge(
+    "pdffacil_cache_disk_bytes", "Bytes ocupados pelo cache em disco",
+    collect=lambda: {(): result_cache._disk_bytes}
+)
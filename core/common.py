@@ -1,16 +1,116 @@
-import tempfile
+import asyncio
+import hashlib
+import logging
+import re
 import os
 import shutil
+import zipfile
+from fastapi import HTTPException, Request
 from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+from core.metrics import stage, timed_stage
+
+logger = logging.getLogger(__name__)
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+def get_env_int(name, default):
+    """Lê um inteiro de variável de ambiente, com valor padrão (também se o valor for inválido)."""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning("Valor inválido em %s: %r, usando %s", name, value, default)
+        return default
+
+def get_env_float(name, default):
+    """Lê um número decimal de variável de ambiente, como get_env_int."""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning("Valor inválido em %s: %r, usando %s", name, value, default)
+        return default
+
+def parse_page_ranges(spec):
+    """
+    Interpreta a seleção de páginas do usuário, numeradas a partir de 1.
+    
+    Aceita listas e faixas separadas por vírgula: "1-3,5,10-" (faixa aberta
+    vai até a última página).
+    
+    Args:
+        spec: Texto do parâmetro pages= (ou None)
+        
+    Returns:
+        list: Faixas (primeira, última ou None), ou None para o documento inteiro
+    """
+    if spec is None or not spec.strip():
+        return None
+    
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        
+        match = re.fullmatch(r"(\d+)(?:\s*-\s*(\d*))?", part)
+        if not match:
+            raise HTTPException(status_code=400, detail=f"Seleção de páginas inválida: '{part}'")
+        
+        first = int(match.group(1))
+        if match.group(2) is None:
+            last = first
+        elif match.group(2) == "":
+            last = None
+        else:
+            last = int(match.group(2))
+        
+        if first < 1 or (last is not None and last < first):
+            raise HTTPException(status_code=400, detail=f"Seleção de páginas inválida: '{part}'")
+        
+        ranges.append((first, last))
+    
+    return ranges or None
+
+def format_page_ranges(ranges):
+    """Forma canônica da seleção de páginas (usada na chave do cache)."""
+    if ranges is None:
+        return None
+    return ",".join(f"{first}-{'' if last is None else last}" for first, last in ranges)
+
+def select_pages(ranges, num_pages):
+    """
+    Converte as faixas pedidas em índices de página (a partir de 0), em ordem.
+    
+    Páginas além do fim do documento são ignoradas; a lista pode ficar vazia.
+    """
+    if ranges is None:
+        return list(range(num_pages))
+    
+    selected = set()
+    for first, last in ranges:
+        last = num_pages if last is None else min(last, num_pages)
+        selected.update(range(first - 1, last))
+    return sorted(selected)
 
 def create_temp_directory():
-    """Cria um diretório temporário para processamento de arquivos."""
-    return tempfile.mkdtemp()
+    """Cria um diretório temporário para processamento de arquivos (ver core.scratch)."""
+    # core.scratch usa get_env_int deste módulo: importado aqui para evitar o ciclo
+    from core.scratch import scratch_space
+    return scratch_space.create()
 
 def clean_up_temp_directory(temp_dir):
     """Limpa um diretório temporário."""
-    if os.path.exists(temp_dir):
-        shutil.rmtree(temp_dir, ignore_errors=True)
+    from core.scratch import scratch_space
+    scratch_space.release(temp_dir)
 
 def create_file_response(file_path, original_filename, new_extension, media_type):
     """
@@ -34,3 +134,380 @@ def create_file_response(file_path, original_filename, new_extension, media_type
     )
     
     return response
+
+def link_file(source_path, file_path):
+    """Liga (hardlink) source_path em file_path, ou copia se não der (outro sistema de arquivos)."""
+    try:
+        os.link(source_path, file_path)
+    except OSError:
+        shutil.copyfile(source_path, file_path)
+
+def link_to_temp_directory(source_path):
+    """
+    Liga (hardlink) ou copia um arquivo para um diretório temporário próprio.
+    
+    Returns:
+        tuple: (diretório temporário, caminho da cópia)
+    """
+    temp_dir = create_temp_directory()
+    try:
+        file_path = os.path.join(temp_dir, os.path.basename(source_path))
+        link_file(source_path, file_path)
+    except Exception:
+        clean_up_temp_directory(temp_dir)
+        raise
+    return temp_dir, file_path
+
+def clone_file_response(response, original_filename, new_extension):
+    """
+    Cópia de um FileResponse em um diretório temporário próprio.
+    
+    Usada para entregar a mesma conversão a outro request (core.singleflight):
+    o arquivo é ligado (hardlink) ou copiado, os headers X-* são mantidos e o
+    diretório novo é removido depois do envio.
+    """
+    temp_dir, file_path = link_to_temp_directory(response.path)
+    
+    clone = create_file_response(file_path, original_filename, new_extension, response.media_type)
+    for name, value in response.headers.items():
+        if name.startswith("x-"):
+            clone.headers[name] = value
+    clone.background = BackgroundTask(clean_up_temp_directory, temp_dir)
+    return clone
+
+def discard_file_response(response):
+    """Remove o diretório de um FileResponse que não vai mais ser enviado."""
+    clean_up_temp_directory(os.path.dirname(response.path))
+
+def cached_file_response(cached_path, original_filename, new_extension, media_type, headers=None):
+    """
+    FileResponse de um arquivo do cache em disco, servido de uma cópia própria.
+    
+    O arquivo é ligado (hardlink) ou copiado para um diretório temporário
+    antes do envio, então a remoção do cache (LRU) no meio do download não
+    afeta a resposta. headers são os X-* guardados com a entrada, para a
+    resposta sair igual à da conversão. Retorna None se o arquivo já saiu
+    do cache.
+    """
+    try:
+        temp_dir, file_path = link_to_temp_directory(cached_path)
+    except FileNotFoundError:
+        return None
+    
+    response = create_file_response(file_path, original_filename, new_extension, media_type)
+    for name, value in (headers or {}).items():
+        response.headers[name] = value
+    response.background = BackgroundTask(clean_up_temp_directory, temp_dir)
+    return response
+
+# Documentação do corpo multipart para rotas que leem o upload manualmente
+PDF_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}}
+                }
+            }
+        }
+    }
+}
+
+class UploadedPDF:
+    """
+    PDF recebido pelo upload, mantido em uma única cópia.
+    
+    Em modo memória os bytes ficam em um único bytearray (também exposto
+    como memoryview); em modo disco o PDF é gravado direto em path, dentro
+    de um diretório temporário, sem passar pela memória.
+    """
+    
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.size = 0
+        self.sha256 = None
+        self.buffer = None
+        self.path = None
+        self.temp_dir = None
+        self.triage = None
+        self._hash = hashlib.sha256()
+        self._file = None
+    
+    @classmethod
+    def from_bytes(cls, filename: str, data: bytes, spool: bool = False) -> "UploadedPDF":
+        """Monta um UploadedPDF a partir de bytes já em memória (benchmarks, scripts)."""
+        upload = cls(filename)
+        upload._open(spool)
+        upload._write(data)
+        upload._finish()
+        return upload
+
+    @property
+    def lane(self) -> str:
+        """Fila definida pela triagem (core.triage); "fast" se não houve triagem."""
+        return self.triage["lane"] if self.triage else "fast"
+
+    @property
+    def view(self) -> memoryview:
+        """Visão sem cópia do buffer em memória."""
+        return memoryview(self.buffer)
+    
+    def _open(self, spool: bool):
+        if spool:
+            self.temp_dir = create_temp_directory()
+            self.path = os.path.join(self.temp_dir, "input.pdf")
+            self._file = open(self.path, "wb")
+        else:
+            self.buffer = bytearray()
+    
+    def _write(self, data):
+        self.size += len(data)
+        self._hash.update(data)
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            self.buffer.extend(data)
+    
+    def _finish(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.sha256 = self._hash.hexdigest()
+    
+    async def read(self):
+        """Compatível com UploadFile.read(); em modo memória não copia o buffer."""
+        if self.buffer is not None:
+            return self.buffer
+        with open(self.path, "rb") as pdf_file:
+            return pdf_file.read()
+    
+    def spool(self) -> str:
+        """
+        Garante que o PDF esteja em disco e retorna o caminho.
+        
+        Em modo memória grava o buffer e o libera, para continuar com uma cópia só.
+        """
+        if self.path is None:
+            with stage("spool"):
+                self.temp_dir = create_temp_directory()
+                self.path = os.path.join(self.temp_dir, "input.pdf")
+                with open(self.path, "wb") as pdf_file:
+                    pdf_file.write(self.view)
+                self.buffer = None
+        return self.path
+    
+    def cleanup(self):
+        """Remove o arquivo temporário do upload, se houver."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.temp_dir:
+            clean_up_temp_directory(self.temp_dir)
+            self.temp_dir = None
+            self.path = None
+
+async def receive_pdf_upload(request: Request, max_bytes: int, spool: bool = False,
+                             field_name: str = "file") -> UploadedPDF:
+    """
+    Lê o PDF do corpo multipart em streaming, verificando o tamanho a cada pedaço.
+    
+    O upload é recusado com 413 assim que passa de max_bytes, antes de o
+    corpo inteiro chegar; nada fica duplicado em memória.
+    
+    Args:
+        request: Request do FastAPI (o corpo ainda não pode ter sido lido)
+        max_bytes: Tamanho máximo do PDF
+        spool: True para gravar direto em disco, False para manter em memória
+        field_name: Nome do campo do formulário com o arquivo
+        
+    Returns:
+        UploadedPDF: PDF recebido
+    """
+    uploads = await receive_pdf_uploads(request, max_bytes, spool, field_name)
+    return uploads[0]
+
+@timed_stage("upload")
+async def receive_pdf_uploads(request: Request, max_bytes: int, spool: bool = False,
+                              field_name: str = "file", max_files: int = 1,
+                              max_total_bytes: int = None, accept_zip: bool = False) -> list:
+    """
+    Lê um ou mais PDFs do corpo multipart em streaming (ver receive_pdf_upload).
+    
+    Com accept_zip, arquivos .zip no mesmo campo são expandidos e cada PDF
+    de dentro conta como um arquivo do lote.
+    
+    Args:
+        request: Request do FastAPI (o corpo ainda não pode ter sido lido)
+        max_bytes: Tamanho máximo de cada PDF
+        spool: True para gravar direto em disco, False para manter em memória
+        field_name: Nome do campo do formulário com os arquivos
+        max_files: Máximo de PDFs; com 1, arquivos extras são ignorados
+        max_total_bytes: Soma máxima dos arquivos enviados (padrão: max_bytes)
+        accept_zip: Aceitar arquivos .zip com PDFs dentro
+        
+    Returns:
+        list[UploadedPDF]: PDFs recebidos, na ordem do envio
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail=f"Envie o PDF no campo '{field_name}' (multipart/form-data)")
+    
+    if max_total_bytes is None:
+        max_total_bytes = max_bytes
+    
+    state = {"header_field": b"", "header_value": b"", "headers": {}, "target": None, "total": 0}
+    uploads = []
+    archives = []
+    errors = []
+    
+    def on_part_begin():
+        state["headers"] = {}
+        state["target"] = None
+    
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+    
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+    
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+    
+    def on_headers_finished():
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        if options.get(b"name", b"").decode() != field_name or b"filename" not in options:
+            return
+        if errors:
+            return
+        if len(uploads) + len(archives) >= max_files:
+            if max_files > 1:
+                errors.append(HTTPException(status_code=400, detail=f"Envie no máximo {max_files} arquivos por vez"))
+            return
+        
+        filename = options[b"filename"].decode("utf-8", errors="replace")
+        is_zip = accept_zip and filename.lower().endswith(".zip")
+        if not filename.lower().endswith(".pdf") and not is_zip:
+            errors.append(HTTPException(status_code=400, detail="Arquivo deve ser um PDF"))
+            return
+        
+        # O ZIP vai sempre para o disco; os PDFs dele são extraídos depois
+        upload = UploadedPDF(filename)
+        upload._open(spool or is_zip)
+        (archives if is_zip else uploads).append(upload)
+        state["target"] = upload
+    
+    def on_part_data(data, start, end):
+        upload = state["target"]
+        if upload is None or errors:
+            return
+        size = end - start
+        limit = max_total_bytes if upload in archives else max_bytes
+        if upload.size + size > limit or state["total"] + size > max_total_bytes:
+            errors.append(HTTPException(
+                status_code=413,
+                detail=f"Arquivo muito grande. Máximo permitido: {limit // (1024 * 1024)}MB"
+            ))
+            return
+        state["total"] += size
+        upload._write(memoryview(data)[start:end])
+    
+    def on_part_end():
+        state["target"] = None
+    
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end
+    })
+    
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if errors:
+                # Parar de ler o corpo assim que o upload é recusado
+                raise errors[0]
+        parser.finalize()
+        
+        for upload in uploads + archives:
+            upload._finish()
+        
+        # Expandir os ZIPs fora do event loop (descompressão e disco)
+        for archive in archives:
+            extracted = await asyncio.to_thread(
+                extract_zip_upload, archive, max_bytes, max_files - len(uploads), spool
+            )
+            uploads.extend(extracted)
+            archive.cleanup()
+        
+        if not uploads:
+            raise HTTPException(status_code=400, detail=f"Envie o PDF no campo '{field_name}' (multipart/form-data)")
+        
+        return uploads
+    
+    except HTTPException:
+        for upload in uploads + archives:
+            upload.cleanup()
+        raise
+    except Exception as e:
+        for upload in uploads + archives:
+            upload.cleanup()
+        raise HTTPException(status_code=400, detail=f"Upload inválido: {str(e)}")
+
+def extract_zip_upload(archive: UploadedPDF, max_bytes: int, max_files: int, spool: bool) -> list:
+    """
+    Extrai os PDFs de um ZIP enviado, com os mesmos limites do upload direto.
+    
+    O tamanho é conferido durante a descompressão (o declarado no ZIP pode mentir).
+    
+    Returns:
+        list[UploadedPDF]: PDFs do ZIP, na ordem em que aparecem
+    """
+    uploads = []
+    try:
+        with zipfile.ZipFile(archive.path) as zip_file:
+            members = [
+                info for info in zip_file.infolist()
+                if not info.is_dir()
+                and info.filename.lower().endswith(".pdf")
+                and not info.filename.startswith("__MACOSX/")
+            ]
+            if len(members) > max_files:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Arquivos demais: o ZIP tem {len(members)} PDFs e cabem mais {max_files} neste envio"
+                )
+            
+            for info in members:
+                upload = UploadedPDF(os.path.basename(info.filename))
+                uploads.append(upload)
+                upload._open(spool)
+                with zip_file.open(info) as member:
+                    while True:
+                        chunk = member.read(1024 * 1024)
+                        if not chunk:
+                            break
+                        if upload.size + len(chunk) > max_bytes:
+                            raise HTTPException(
+                                status_code=413,
+                                detail=f"{upload.filename} no ZIP é muito grande. Máximo permitido: {max_bytes // (1024 * 1024)}MB"
+                            )
+                        upload._write(chunk)
+                upload._finish()
+        return uploads
+    
+    except Exception as e:
+        for upload in uploads:
+            upload.cleanup()
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=400, detail=f"ZIP inválido: {str(e)}")
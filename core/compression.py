@@ -0,0 +1,279 @@
+"""Compressão das respostas JSON e NDJSON (gzip, brotli ou zstd)."""
+import asyncio
+import logging
+import os
+import time
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from core.common import get_env_int
+from core.metrics import add_stage, registry
+
+# brotli e zstandard são opcionais: sem eles só o gzip é oferecido
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Tipos comprimidos; os demais (DOCX, XLSX, ZIP, imagens) já são compactados
+COMPRESSIBLE_MEDIA_TYPES = ("application/json", "application/x-ndjson")
+
+# Um corpo grande é comprimido e enviado em partes deste tamanho
+SLICE_BYTES = 256 * 1024
+
+compression_responses = registry.counter(
+    "pdffacil_compression_responses_total", "Respostas comprimidas, por codificação", ["encoding"]
+)
+compression_bytes = registry.counter(
+    "pdffacil_compression_bytes_total",
+    "Bytes antes (in) e depois (out) da compressão, por codificação",
+    ["encoding", "direction"]
+)
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Codificações disponíveis neste ambiente
+ENCODERS = {"gzip": _GzipEncoder}
+if brotli is not None:
+    ENCODERS["br"] = _BrotliEncoder
+if zstandard is not None:
+    ENCODERS["zstd"] = _ZstdEncoder
+
+# Codificações oferecidas, em ordem de preferência (vazio desativa)
+ENCODINGS = [
+    encoding.strip().lower()
+    for encoding in os.environ.get("PDFFACIL_COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",")
+    if encoding.strip().lower() in ENCODERS
+]
+
+# Respostas menores que isto não compensam a compressão
+MIN_BYTES = get_env_int("PDFFACIL_COMPRESSION_MIN_BYTES", 1024)
+
+# Nível de cada codificação: gzip 1-9, brotli 0-11, zstd 1-22
+LEVELS = {
+    "gzip": get_env_int("PDFFACIL_COMPRESSION_GZIP_LEVEL", 6),
+    "br": get_env_int("PDFFACIL_COMPRESSION_BR_LEVEL", 4),
+    "zstd": get_env_int("PDFFACIL_COMPRESSION_ZSTD_LEVEL", 3)
+}
+
+# Partes a partir deste tamanho são comprimidas em uma thread, fora do event loop
+THREAD_BYTES = get_env_int("PDFFACIL_COMPRESSION_THREAD_BYTES", 32 * 1024)
+
+
+def negotiate(accept_encoding: str, offered=None):
+    """
+    Escolhe a codificação pelo Accept-Encoding do cliente.
+
+    Vence a de maior q; no empate, a primeira de offered (a ordem de
+    preferência do servidor). q=0 recusa a codificação.
+
+    Args:
+        accept_encoding: Valor do header Accept-Encoding
+        offered: Codificações oferecidas (padrão: ENCODINGS)
+
+    Returns:
+        str: "zstd", "br", "gzip" ou None (sem compressão)
+    """
+    qualities = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS if offered is None else offered:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class _CompressedBody:
+    """Estado de uma resposta sendo comprimida."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self.encoder = ENCODERS[encoding](LEVELS[encoding])
+        self.seconds = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def step(self, data: bytes, end: str = None) -> bytes:
+        """Comprime data; end="flush" esvazia o compressor, end="finish" encerra o stream."""
+        start = time.perf_counter()
+        output = self.encoder.compress(data) if data else b""
+        if end == "flush":
+            output += self.encoder.flush()
+        elif end == "finish":
+            output += self.encoder.finish()
+        self.seconds += time.perf_counter() - start
+        self.bytes_in += len(data)
+        self.bytes_out += len(output)
+        return output
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI que comprime as respostas JSON e NDJSON.
+
+    - Negocia zstd, brotli ou gzip pelo Accept-Encoding (Vary sempre enviado).
+    - Não mexe em respostas que já têm Content-Encoding, nem nas menores
+      que PDFFACIL_COMPRESSION_MIN_BYTES (pelo Content-Length ou, sem ele,
+      quando o corpo inteiro chega em uma parte só).
+    - Cada parte do corpo sai comprimida e com flush, então as linhas do
+      NDJSON chegam ao cliente conforme são extraídas.
+
+    Args:
+        app: Aplicação ASGI
+        media_types: Tipos de conteúdo comprimidos
+    """
+
+    def __init__(self, app, media_types=COMPRESSIBLE_MEDIA_TYPES):
+        self.app = app
+        self.media_types = set(media_types)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        start_message = None
+        body = None
+
+        async def compressing_send(message):
+            nonlocal start_message, body
+            if message["type"] == "http.response.start":
+                start_message = self._prepare(message, encoding)
+                if start_message is None:
+                    await send(message)
+                return
+
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            data = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if body is None:
+                # Primeira parte: sem Content-Length, só aqui se sabe se o corpo é pequeno
+                if not more_body and len(data) < MIN_BYTES:
+                    await send(start_message)
+                    start_message = None
+                    await send(message)
+                    return
+                body = _CompressedBody(encoding)
+                headers = MutableHeaders(scope=start_message)
+                del headers["content-length"]
+                headers["content-encoding"] = encoding
+                await send(start_message)
+
+            await self._send_compressed(send, body, data, more_body)
+            if not more_body:
+                self._record(body)
+
+        await self.app(scope, receive, compressing_send)
+
+    def _prepare(self, message, encoding: str):
+        """Devolve o início da resposta a segurar se ela for comprimida, ou None."""
+        headers = MutableHeaders(scope=message)
+        media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        if media_type not in self.media_types:
+            return None
+
+        vary = headers.get("vary")
+        if vary is None:
+            headers["vary"] = "Accept-Encoding"
+        elif "accept-encoding" not in vary.lower():
+            headers["vary"] = f"{vary}, Accept-Encoding"
+
+        if encoding is None or "content-encoding" in headers or message["status"] in (204, 304):
+            return None
+        content_length = headers.get("content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) < MIN_BYTES:
+            return None
+        return message
+
+    async def _send_compressed(self, send, body: _CompressedBody, data: bytes, more_body: bool):
+        """Comprime e envia uma parte do corpo, fatiada se for grande."""
+        offsets = range(0, len(data), SLICE_BYTES) if data else [0]
+        last_offset = offsets[-1]
+        for offset in offsets:
+            piece = data[offset:offset + SLICE_BYTES]
+            end = None
+            if offset == last_offset:
+                end = "flush" if more_body else "finish"
+            if len(piece) >= THREAD_BYTES:
+                output = await asyncio.to_thread(body.step, piece, end)
+            else:
+                output = body.step(piece, end)
+
+            final = offset == last_offset and not more_body
+            if output or final:
+                await send({"type": "http.response.body", "body": output, "more_body": not final})
+
+    def _record(self, body: _CompressedBody):
+        compression_responses.inc(encoding=body.encoding)
+        compression_bytes.inc(body.bytes_in, encoding=body.encoding, direction="in")
+        compression_bytes.inc(body.bytes_out, encoding=body.encoding, direction="out")
+        add_stage("compress", body.seconds)
+        logger.debug(
+            "Resposta comprimida (%s): %d -> %d bytes em %.3fs",
+            body.encoding, body.bytes_in, body.bytes_out, body.seconds
+        )
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException
+from core.common import get_env_int
+from core.metrics import registry
+from core.scheduler import FairScheduler, estimate_cost
+
+logger = logging.getLogger(__name__)
+
+executor_run_seconds = registry.histogram(
+    "pdffacil_executor_run_seconds", "Tempo de um job no pool, incluindo a espera na fila", ["executor"]
+)
+executor_errors = registry.counter(
+    "pdffacil_executor_errors_total", "Jobs recusados ou interrompidos pelo pool", ["executor", "reason"]
+)
+
+
+class ConversionTimeout(Exception):
+    """Levantada dentro do processo worker quando o job estoura o tempo."""
+
+
+def _alarm_handler(signum, frame):
+    raise ConversionTimeout()
+
+
+def _run_job(timeout: int, func, args):
+    """
+    Executa o job dentro do processo worker.
+
+    Usa SIGALRM para interromper o próprio job quando o tempo acaba, assim
+    o worker continua vivo e pode atender o próximo job.
+    """
+    use_alarm = timeout > 0 and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _alarm_handler)
+        signal.alarm(timeout)
+    try:
+        return func(*args)
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+
+
+class ConversionExecutor:
+    """
+    Pool de processos para trabalho pesado de CPU, fora do event loop.
+
+    Args:
+        name: Nome do pool usado nos logs
+        env_prefix: Prefixo das variáveis de ambiente de configuração
+    """
+
+    def __init__(self, name: str = "conversão", env_prefix: str = "PDFFACIL_CONVERSION"):
+        self.name = name
+        
+        # Rótulo nas métricas: PDFFACIL_EXTRACTION -> "extraction"
+        self.label = env_prefix.rsplit("_", 1)[-1].lower()
+
+        # Número de processos worker (padrão: todos os núcleos)
+        self.max_workers = get_env_int(f"{env_prefix}_WORKERS", os.cpu_count() or 1)
+
+        # Tempo máximo de um job, em segundos
+        self.job_timeout = get_env_int(f"{env_prefix}_TIMEOUT", 300)
+
+        # Margem extra antes de matar o pool inteiro
+        self.kill_grace = get_env_int(f"{env_prefix}_KILL_GRACE", 10)
+
+        # Jobs aguardando além dos que já estão rodando
+        self.max_queue = get_env_int(f"{env_prefix}_MAX_QUEUE", self.max_workers * 4)
+
+        # Valor do header Retry-After quando a fila está cheia
+        self.retry_after = get_env_int(f"{env_prefix}_RETRY_AFTER", 30)
+
+        # Vagas do pool distribuídas entre os clientes (ver core/scheduler.py)
+        self.scheduler = FairScheduler(self.max_workers, self.label)
+
+        self._pool = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Jobs rodando ou aguardando na fila."""
+        return self._pending
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs aguardando um worker livre."""
+        return max(0, self._pending - self.max_workers)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn evita herdar threads e sockets do processo do uvicorn
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info("Pool de %s iniciado com %s workers", self.name, self.max_workers)
+        return self._pool
+
+    def _kill_pool(self):
+        """Mata todos os processos do pool e descarta o pool."""
+        pool = self._pool
+        self._pool = None
+        if pool is None:
+            return
+
+        for process in list(getattr(pool, "_processes", {}).values()):
+            try:
+                process.kill()
+            except Exception:
+                pass
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, func, *args, kind: str = None, pages: int = 0, size: int = 0, lane: str = "fast"):
+        """
+        Executa func(*args) em um processo do pool e aguarda o resultado.
+
+        O job espera a vez do cliente na fila justa antes de entrar no pool;
+        kind, pages e size estimam o custo cobrado dele.
+
+        Args:
+            func: Função de nível de módulo (precisa ser picklable)
+            *args: Argumentos picklable para a função
+            kind: Tipo de trabalho (pdf_to_docx, pdf_to_text, ...)
+            pages: Páginas processadas pelo job, se conhecidas
+            size: Tamanho do PDF em bytes
+            lane: Fila da triagem ("fast" ou "heavy")
+
+        Returns:
+            O valor retornado por func
+
+        Raises:
+            HTTPException 503 se a fila estiver cheia, 504 se o job estourar o tempo
+        """
+        if self._pending >= self.max_workers + self.max_queue:
+            logger.warning("Fila de %s cheia: %s jobs pendentes", self.name, self._pending)
+            executor_errors.inc(executor=self.label, reason="queue_full")
+            raise HTTPException(
+                status_code=503,
+                detail="Servidor ocupado com outras conversões. Tente novamente em instantes.",
+                headers={"Retry-After": str(self.retry_after)}
+            )
+
+        self._pending += 1
+        start = time.perf_counter()
+        try:
+            kind = kind or self.label
+            await self.scheduler.acquire(kind, estimate_cost(kind, pages, size, lane))
+            try:
+                loop = asyncio.get_running_loop()
+                future = loop.run_in_executor(self._get_pool(), _run_job, self.job_timeout, func, args)
+
+                hard_timeout = self.job_timeout + self.kill_grace if self.job_timeout > 0 else None
+                try:
+                    return await asyncio.wait_for(future, timeout=hard_timeout)
+                except asyncio.TimeoutError:
+                    # O worker não respondeu nem ao SIGALRM: mata o pool
+                    logger.error("Job de %s travado após %ss, reiniciando pool", self.name, hard_timeout)
+                    self._kill_pool()
+                    executor_errors.inc(executor=self.label, reason="hard_timeout")
+                    raise self._timeout_error()
+                except ConversionTimeout:
+                    logger.warning("Job de %s excedeu %ss e foi interrompido", self.name, self.job_timeout)
+                    executor_errors.inc(executor=self.label, reason="timeout")
+                    raise self._timeout_error()
+                except BrokenProcessPool:
+                    logger.error("Pool de %s quebrado, será recriado no próximo job", self.name)
+                    self._kill_pool()
+                    executor_errors.inc(executor=self.label, reason="broken_pool")
+                    raise Exception(f"Processo de {self.name} encerrado inesperadamente")
+            finally:
+                self.scheduler.release()
+        finally:
+            self._pending -= 1
+            executor_run_seconds.observe(time.perf_counter() - start, executor=self.label)
+
+    def _timeout_error(self) -> HTTPException:
+        return HTTPException(
+            status_code=504,
+            detail=f"Conversão excedeu o tempo máximo de {self.job_timeout}s"
+        )
+
+    def shutdown(self):
+        """Encerra o pool (chamado no shutdown da aplicação)."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# Instância global do executor de conversões (pdf2docx)
+conversion_executor = ConversionExecutor()
+
+# Pool separado para extração de texto, para que requests leves
+# não fiquem na fila atrás de conversões DOCX
+extraction_executor = ConversionExecutor("extração", "PDFFACIL_EXTRACTION")
+
+executors = (conversion_executor, extraction_executor)
+
+registry.gauge(
+    "pdffacil_executor_pending", "Jobs rodando ou aguardando no pool", ["executor"],
+    collect=lambda: {(e.label,): e.pending for e in executors}
+)
+registry.gauge(
+    "pdffacil_executor_queue_depth", "Jobs aguardando um worker livre", ["executor"],
+    collect=lambda: {(e.label,): e.queue_depth for e in executors}
+)
+registry.gauge(
+    "pdffacil_executor_workers", "Processos worker configurados", ["executor"],
+    collect=lambda: {(e.label,): e.max_workers for e in executors}
+)
+registry.gauge(
+    "pdffacil_scheduler_waiting", "Jobs na fila justa aguardando uma vaga no pool", ["executor"],
+    collect=lambda: {(e.label,): e.scheduler.waiting for e in executors}
+)
+registry.gauge(
+    "pdffacil_scheduler_clients", "Clientes com jobs na fila justa", ["executor"],
+    collect=lambda: {(e.label,): e.scheduler.clients for e in executors}
+)
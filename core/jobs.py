@@ -0,0 +1,311 @@
+import asyncio
+import contextvars
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from fastapi import HTTPException
+from core.common import get_env_int, clean_up_temp_directory
+from core.metrics import registry, begin_request
+from core import scheduler
+
+logger = logging.getLogger(__name__)
+
+# Arquivo, no diretório do job, em que os workers do pool gravam as páginas concluídas
+PROGRESS_FILE = "progress"
+
+# Job em execução no contexto atual (None fora de um job)
+_current_job = contextvars.ContextVar("pdffacil_current_job", default=None)
+
+
+class Job:
+    """Um job de conversão assíncrona e seu estado."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, kind: str, upload, pages_total: int = 0):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.upload = upload
+        self.filename = upload.filename
+        self.work_dir = upload.temp_dir
+        self.input_path = upload.path
+        self.status = Job.QUEUED
+        self.pages_total = pages_total
+        self.pages_done = 0
+        # Cliente que enviou o job, para a fila justa dos pools
+        self.client = scheduler.current_client()
+        self.error = None
+        self.result_path = None
+        self.result_filename = None
+        self.media_type = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def progress(self) -> int:
+        """Páginas concluídas: as informadas no processo e as gravadas pelos workers."""
+        if self.status != Job.RUNNING:
+            return self.pages_done
+        return min(self.pages_total, max(self.pages_done, read_progress(self.work_dir)))
+
+    def to_dict(self, queue_position: int = None) -> dict:
+        """Representação pública do job para a API."""
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "filename": self.filename,
+            "progress": {
+                "pages_done": self.progress,
+                "pages_total": self.pages_total
+            },
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if queue_position is not None:
+            data["queue_position"] = queue_position
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+def report_pages(count: int):
+    """Soma páginas concluídas ao job em execução (se houver um)."""
+    job = _current_job.get()
+    if job is not None:
+        job.pages_done += count
+
+
+def progress_path():
+    """Arquivo de progresso do job em execução, para passar a um worker do pool (None fora de um job)."""
+    job = _current_job.get()
+    if job is None or not job.work_dir:
+        return None
+    return os.path.join(job.work_dir, PROGRESS_FILE)
+
+
+def write_progress(path: str, pages_done: int):
+    """Grava as páginas concluídas (chamada dentro do worker, a cada página)."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as progress_file:
+        progress_file.write(str(pages_done))
+    os.replace(temp_path, path)
+
+
+def read_progress(work_dir: str) -> int:
+    if not work_dir:
+        return 0
+    try:
+        with open(os.path.join(work_dir, PROGRESS_FILE)) as progress_file:
+            return int(progress_file.read() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+class JobStore:
+    """
+    Armazena jobs de conversão e os executa em segundo plano.
+
+    Os handlers recebem o Job e devolvem (caminho do resultado, nome do
+    arquivo, media type). O trabalho pesado continua passando pelos pools
+    de core.executor; aqui só controlamos fila, estado e expiração.
+    """
+
+    def __init__(self):
+        # Jobs processados ao mesmo tempo
+        self.concurrency = get_env_int("PDFFACIL_JOB_WORKERS", os.cpu_count() or 1)
+
+        # Jobs aceitos e ainda não iniciados
+        self.max_queued = get_env_int("PDFFACIL_JOB_MAX_QUEUED", 100)
+
+        # Tempo que um resultado fica disponível após terminar
+        self.result_ttl = get_env_int("PDFFACIL_JOB_TTL_SECONDS", 3600)
+
+        self.retry_after = get_env_int("PDFFACIL_JOB_RETRY_AFTER", 60)
+
+        self.jobs = {}
+        self.handlers = {}
+        self._queue = None
+        self._order = []
+        # Lugares na fila reservados por envios ainda sendo aceitos (ver reservation)
+        self._reserved = 0
+        self._tasks = []
+
+    def register(self, kind: str, handler):
+        """Registra o handler assíncrono de um tipo de job."""
+        self.handlers[kind] = handler
+
+    @property
+    def queued_count(self) -> int:
+        return len(self._order)
+
+    def _check_capacity(self):
+        if self.queued_count + self._reserved >= self.max_queued:
+            logger.warning("Fila de jobs cheia: %s aguardando", self.queued_count)
+            raise HTTPException(
+                status_code=503,
+                detail="Fila de conversões cheia. Tente novamente em instantes.",
+                headers={"Retry-After": str(self.retry_after)}
+            )
+
+    @contextmanager
+    def reservation(self):
+        """
+        Reserva um lugar na fila enquanto o envio é aceito (ex.: durante a
+        cobrança da cota), para que a fila não encha entre a cobrança e o
+        create(reserved=True).
+
+        Raises:
+            HTTPException 503 se a fila estiver cheia
+        """
+        self._check_capacity()
+        self._reserved += 1
+        try:
+            yield
+        finally:
+            self._reserved -= 1
+
+    def create(self, kind: str, upload, pages_total: int = 0, reserved: bool = False) -> Job:
+        """
+        Cria um job para um UploadedPDF gravado em disco e o coloca na fila.
+
+        O diretório do upload passa a ser o diretório do job.
+
+        Args:
+            reserved: O lugar já foi reservado com reservation()
+
+        Raises:
+            HTTPException 503 se a fila estiver cheia
+        """
+        if kind not in self.handlers:
+            raise HTTPException(status_code=404, detail=f"Tipo de job desconhecido: {kind}")
+
+        if not reserved:
+            self._check_capacity()
+
+        job = Job(kind, upload, pages_total)
+
+        self.jobs[job.id] = job
+        self._order.append(job.id)
+        self._get_queue().put_nowait(job.id)
+
+        logger.info("Job %s (%s) criado, %s na fila", job.id, kind, self.queued_count)
+        return job
+
+    def get(self, job_id: str) -> Job:
+        """Retorna o job ou levanta 404."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job não encontrado ou expirado")
+        return job
+
+    def queue_position(self, job: Job):
+        """Posição do job na fila (1 = próximo), ou None se já saiu dela."""
+        if job.status != Job.QUEUED:
+            return None
+        try:
+            return self._order.index(job.id) + 1
+        except ValueError:
+            return None
+
+    def get_stats(self) -> dict:
+        counts = {Job.QUEUED: 0, Job.RUNNING: 0, Job.DONE: 0, Job.FAILED: 0}
+        for job in self.jobs.values():
+            counts[job.status] += 1
+        return {**counts, "max_queued": self.max_queued, "concurrency": self.concurrency}
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    async def _run(self, job: Job):
+        # Etapas medidas pelos processors saem com o rótulo do tipo de job
+        timings = begin_request(f"job:{job.kind}")
+        scheduler.set_client(job.client)
+        _current_job.set(job)
+        job.status = Job.RUNNING
+        job.started_at = time.time()
+        try:
+            result_path, result_filename, media_type = await self.handlers[job.kind](job)
+            job.result_path = result_path
+            job.result_filename = result_filename
+            job.media_type = media_type
+            job.pages_done = job.pages_total
+            job.status = Job.DONE
+            logger.info("Job %s concluído em %.2fs", job.id, time.time() - job.started_at)
+        except Exception as e:
+            job.status = Job.FAILED
+            job.error = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.error("Job %s falhou: %s", job.id, job.error)
+        finally:
+            job.finished_at = time.time()
+            timings.flush()
+
+    async def _worker(self):
+        queue = self._get_queue()
+        while True:
+            job_id = await queue.get()
+            try:
+                self._order.remove(job_id)
+            except ValueError:
+                pass
+
+            job = self.jobs.get(job_id)
+            if job is not None:
+                await self._run(job)
+            queue.task_done()
+
+    def expire(self, current_time: float) -> int:
+        """Remove jobs terminados há mais de result_ttl segundos."""
+        expired = [
+            job for job in self.jobs.values()
+            if job.finished_at is not None and current_time - job.finished_at > self.result_ttl
+        ]
+        for job in expired:
+            del self.jobs[job.id]
+            clean_up_temp_directory(job.work_dir)
+        return len(expired)
+
+    async def _expiry_loop(self):
+        while True:
+            await asyncio.sleep(min(60, max(1, self.result_ttl)))
+            removed = self.expire(time.time())
+            if removed:
+                logger.info("%s jobs expirados removidos", removed)
+
+    def start(self):
+        """Inicia os workers e a expiração (no startup da aplicação)."""
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._tasks.append(loop.create_task(self._expiry_loop()))
+
+    def stop(self):
+        """Cancela os workers e remove os arquivos de todos os jobs."""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        for job in self.jobs.values():
+            clean_up_temp_directory(job.work_dir)
+        self.jobs.clear()
+
+
+# Instância global da fila de jobs
+job_store = JobStore()
+
+registry.gauge(
+    "pdffacil_jobs", "Jobs assíncronos por estado", ["status"],
+    collect=lambda: {
+        (status,): count for status, count in job_store.get_stats().items()
+        if status in (Job.QUEUED, Job.RUNNING, Job.DONE, Job.FAILED)
+    }
+)
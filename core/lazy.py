@@ -0,0 +1,97 @@
+import importlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Momento em que o processo começou a importar a aplicação
+BOOT_TIME = time.time()
+
+# Tempo gasto em cada import medido: nome do módulo -> registro
+import_timings = {}
+
+_lazy_modules = {}
+_lock = threading.Lock()
+
+
+def timed_import(name: str, phase: str = "startup"):
+    """
+    Importa um módulo registrando quanto tempo o import levou.
+
+    Args:
+        name: Nome completo do módulo
+        phase: "startup", "lazy" (primeiro uso) ou "preload" (segundo plano)
+    """
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    elapsed = time.perf_counter() - start
+
+    with _lock:
+        import_timings.setdefault(name, {
+            "seconds": round(elapsed, 4),
+            "phase": phase,
+            "at": round(time.time() - BOOT_TIME, 3)
+        })
+    if phase != "startup":
+        logger.info("Módulo %s carregado (%s) em %.3fs", name, phase, elapsed)
+    return module
+
+
+class LazyModule:
+    """
+    Módulo importado só no primeiro acesso a um atributo.
+
+    Usado para os processors, que puxam dependências pesadas (pdf2docx,
+    OpenCV, NumPy, pandas) e atrasariam o cold start da máquina.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self, phase: str = "lazy"):
+        if self._module is None:
+            self._module = timed_import(self._name, phase)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+def lazy_import(name: str) -> LazyModule:
+    """Retorna o LazyModule de um módulo (um por nome)."""
+    with _lock:
+        module = _lazy_modules.get(name)
+        if module is None:
+            module = _lazy_modules[name] = LazyModule(name)
+    return module
+
+
+def preload_in_background():
+    """Carrega em uma thread os módulos lazy que ainda não foram usados."""
+    def preload():
+        for module in list(_lazy_modules.values()):
+            try:
+                module.load("preload")
+            except Exception as e:
+                logger.warning("Falha ao pré-carregar %s: %s", module._name, e)
+
+    thread = threading.Thread(target=preload, name="preload-modules", daemon=True)
+    thread.start()
+    return thread
+
+
+def get_startup_report() -> dict:
+    """Relatório de tempos de import desde o boot."""
+    with _lock:
+        timings = dict(import_timings)
+    return {
+        "uptime_seconds": round(time.time() - BOOT_TIME, 3),
+        "imports": timings,
+        "lazy_modules": {name: module.loaded for name, module in _lazy_modules.items()}
+    }
@@ -0,0 +1,182 @@
+"""
+Logging que não bloqueia o event loop: os registros vão para uma fila e
+uma thread escreve no stdout. A %-formatação só acontece nessa thread,
+então os argumentos não devem ser alterados depois da chamada ao logger.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+from core.common import get_env_int
+from core.metrics import registry
+
+REQUEST_ID_HEADER = "x-request-id"
+
+# Ids recebidos do cliente são aceitos só neste formato
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Atributos próprios do LogRecord; o resto veio em extra= e vai para o JSON
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "request_id", "taskName"
+}
+
+log_records_dropped = registry.counter(
+    "pdffacil_log_records_dropped_total", "Linhas de log descartadas, por motivo", ["reason"]
+)
+
+
+LOG_LEVEL = os.environ.get("PDFFACIL_LOG_LEVEL", "INFO").upper()
+
+# "json" (uma linha por registro) ou "text"
+LOG_FORMAT = os.environ.get("PDFFACIL_LOG_FORMAT", "json")
+
+# Porcentagem dos requests com as linhas de sucesso (INFO e abaixo) registradas
+SAMPLE_PERCENT = get_env_int("PDFFACIL_LOG_SAMPLE_PERCENT", 100)
+
+# Registros aguardando a escrita; com a fila cheia, os novos são descartados
+QUEUE_SIZE = get_env_int("PDFFACIL_LOG_QUEUE_SIZE", 10000)
+
+# (id do request, linhas de sucesso registradas?) do request atual
+_request_context = contextvars.ContextVar("pdffacil_log_context", default=None)
+
+
+def begin_request(request_id: str = None) -> str:
+    """
+    Define o id do request atual e se as linhas de sucesso dele entram na amostra.
+
+    Args:
+        request_id: Id recebido no header X-Request-ID (gera um novo se inválido)
+
+    Returns:
+        str: Id do request
+    """
+    if not request_id or not _REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex[:16]
+    sampled = random.random() * 100 < SAMPLE_PERCENT
+    _request_context.set((request_id, sampled))
+    return request_id
+
+
+def current_request_id() -> str:
+    context = _request_context.get()
+    return context[0] if context else None
+
+
+class ContextFilter(logging.Filter):
+    """Anota o id do request e descarta as linhas de sucesso fora da amostra."""
+
+    def filter(self, record) -> bool:
+        context = _request_context.get()
+        record.request_id = context[0] if context else None
+        if context is not None and not context[1] and record.levelno < logging.WARNING:
+            log_records_dropped.inc(reason="sampled")
+            return False
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler que deixa a formatação para a thread de escrita e nunca
+    espera: com a fila cheia o registro é descartado.
+    """
+
+    def prepare(self, record):
+        # A exceção precisa ser formatada agora, enquanto o traceback existe
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped.inc(reason="queue_full")
+
+
+class JsonFormatter(logging.Formatter):
+    """Um objeto JSON por linha, com os campos passados em extra=."""
+
+    converter = time.gmtime
+
+    def format(self, record) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Texto simples, para uso local."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record) -> str:
+        if not getattr(record, "request_id", None):
+            record.request_id = "-"
+        return super().format(record)
+
+
+class LogPipeline:
+    """Fila de registros e a thread que os escreve no stdout."""
+
+    def __init__(self):
+        self._listener = None
+
+    def start(self):
+        """Instala o handler com fila no logger raiz (e nos do uvicorn) e inicia a escrita."""
+        if self._listener is not None:
+            return
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+        records = queue.Queue(QUEUE_SIZE)
+        handler = NonBlockingQueueHandler(records)
+        handler.addFilter(ContextFilter())
+
+        root = logging.getLogger()
+        root.handlers = [handler]
+        root.setLevel(LOG_LEVEL)
+
+        # O uvicorn instala handlers próprios, que escrevem direto no stdout
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+            uvicorn_logger = logging.getLogger(name)
+            uvicorn_logger.handlers = []
+            uvicorn_logger.propagate = True
+
+        self._listener = QueueListener(records, output, respect_handler_level=True)
+        self._listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Escreve o que ainda está na fila e encerra a thread."""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+
+
+# Instância global
+log_pipeline = LogPipeline()
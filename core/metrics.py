@@ -0,0 +1,345 @@
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Limites dos histogramas de duração, em segundos
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Janela usada nos gauges de vazão (páginas/s e bytes/s)
+THROUGHPUT_WINDOW_SECONDS = 60
+
+# Rota usada para etapas medidas fora de um request (jobs, pré-carregamento)
+BACKGROUND_ROUTE = "background"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """
+    Métrica com rótulos no formato de exposição de texto do Prometheus.
+
+    Args:
+        name: Nome da métrica
+        documentation: Texto do # HELP
+        labelnames: Nomes dos rótulos, na ordem usada em labels()
+        collect: Função chamada a cada leitura que devolve {tupla de rótulos: valor};
+                 usada para valores que já existem em outro lugar (fila, cache)
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), collect=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self):
+        """Linhas de amostra (sem HELP/TYPE)."""
+        if self.collect is not None:
+            values = self.collect() or {}
+        else:
+            with self._lock:
+                values = dict(self._values)
+
+        for key, value in sorted(values.items()):
+            if value is None:
+                continue
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [contagem por balde..., soma, total]
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[index] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(entry) for key, entry in self._values.items()}
+
+        for key, entry in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            inf = 'le="+Inf"'
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, inf)} {entry[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(entry[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {entry[-1]}"
+
+
+class MetricsRegistry:
+    """Conjunto de métricas expostas em /metrics."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=(), collect=None) -> Counter:
+        return self._register(Counter(name, documentation, labelnames, collect))
+
+    def gauge(self, name: str, documentation: str, labelnames=(), collect=None) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, collect))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DURATION_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Todas as métricas no formato de exposição de texto."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        blocks = []
+        for metric in metrics:
+            try:
+                blocks.append(metric.render())
+            except Exception as e:
+                # Uma métrica com erro não derruba o scrape inteiro
+                blocks.append(f"# {metric.name} indisponível: {_escape(e)}")
+        return "\n".join(blocks) + "\n"
+
+
+# Registro global de métricas
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    "pdffacil_http_requests_total", "Requests HTTP atendidos", ["route", "method", "status"]
+)
+http_duration = registry.histogram(
+    "pdffacil_http_request_duration_seconds",
+    "Tempo total do request, incluindo o envio da resposta", ["route", "method"]
+)
+http_response_bytes = registry.counter(
+    "pdffacil_http_response_bytes_total", "Bytes enviados no corpo das respostas", ["route"]
+)
+stage_duration = registry.histogram(
+    "pdffacil_stage_duration_seconds",
+    "Tempo gasto em cada etapa do processamento", ["route", "stage"]
+)
+stage_errors = registry.counter(
+    "pdffacil_stage_errors_total", "Etapas que terminaram com exceção", ["route", "stage"]
+)
+pages_processed = registry.counter(
+    "pdffacil_pages_processed_total", "Páginas processadas por tipo de conversão", ["kind"]
+)
+bytes_processed = registry.counter(
+    "pdffacil_bytes_processed_total", "Bytes de PDF processados por tipo de conversão", ["kind"]
+)
+
+
+class RequestTimings:
+    """Etapas medidas durante um request, registradas quando ele termina."""
+
+    __slots__ = ("route", "stages")
+
+    def __init__(self, route: str = None):
+        self.route = route
+        self.stages = []
+
+    def add(self, stage: str, seconds: float, failed: bool = False):
+        self.stages.append((stage, seconds, failed))
+
+    def totals_ms(self) -> dict:
+        """Tempo total de cada etapa, em milissegundos (para o log do request)."""
+        totals = {}
+        for stage, seconds, _ in self.stages:
+            totals[stage] = totals.get(stage, 0.0) + seconds * 1000
+        return {stage: round(ms, 3) for stage, ms in totals.items()}
+
+    def flush(self, route: str = None):
+        """Registra as etapas acumuladas com o rótulo de rota final."""
+        route = route or self.route or BACKGROUND_ROUTE
+        stages, self.stages = self.stages, []
+        for stage, seconds, failed in stages:
+            stage_duration.observe(seconds, route=route, stage=stage)
+            if failed:
+                stage_errors.inc(route=route, stage=stage)
+
+
+# Etapas do request atual (o middleware cria uma por request)
+_current_timings = contextvars.ContextVar("pdffacil_request_timings", default=None)
+
+
+def begin_request(route: str = None) -> RequestTimings:
+    """Começa a acumular as etapas do request ou job atual."""
+    timings = RequestTimings(route)
+    _current_timings.set(timings)
+    return timings
+
+
+def route_label(scope: dict) -> str:
+    """Caminho da rota (com parâmetros, ex.: /jobs/{job_id}), sem explodir a cardinalidade."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def _record_stage(name: str, seconds: float, failed: bool):
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(name, seconds, failed)
+    else:
+        stage_duration.observe(seconds, route=BACKGROUND_ROUTE, stage=name)
+        if failed:
+            stage_errors.inc(route=BACKGROUND_ROUTE, stage=name)
+
+
+def add_stage(name: str, seconds: float):
+    """Registra uma etapa medida à parte (ex.: somada ao longo de várias partes)."""
+    _record_stage(name, seconds, False)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Mede o tempo de uma etapa (upload, rate_limit, convert, ...).
+
+    Funciona em código síncrono e assíncrono; dentro de um request a
+    medição sai com o rótulo da rota, fora dele com "background".
+    """
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        _record_stage(name, time.perf_counter() - start, failed)
+
+
+def timed_stage(name: str):
+    """Decorador de stage() para funções assíncronas (entradas dos processors)."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with stage(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _Throughput:
+    """Soma móvel de páginas e bytes processados na janela recente."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, pages: int, size: int):
+        now = time.monotonic()
+        with self._lock:
+            events = self._events.setdefault(kind, deque())
+            events.append((now, pages, size))
+            self._prune(events, now)
+
+    def _prune(self, events: deque, now: float):
+        while events and now - events[0][0] > self.window:
+            events.popleft()
+
+    def rates(self, index: int) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            rates = {}
+            for kind, events in self._events.items():
+                self._prune(events, now)
+                rates[(kind,)] = sum(event[index] for event in events) / self.window
+            return rates
+
+
+_throughput = _Throughput(THROUGHPUT_WINDOW_SECONDS)
+
+registry.gauge(
+    "pdffacil_pages_per_second",
+    f"Páginas por segundo (média dos últimos {THROUGHPUT_WINDOW_SECONDS}s)", ["kind"],
+    collect=lambda: _throughput.rates(1)
+)
+registry.gauge(
+    "pdffacil_bytes_per_second",
+    f"Bytes de PDF por segundo (média dos últimos {THROUGHPUT_WINDOW_SECONDS}s)", ["kind"],
+    collect=lambda: _throughput.rates(2)
+)
+
+
+def record_throughput(kind: str, pages: int, size: int):
+    """Registra páginas e bytes processados por uma conversão concluída."""
+    pages_processed.inc(pages, kind=kind)
+    bytes_processed.inc(size, kind=kind)
+    _throughput.add(kind, pages, size)
+
+
+def render() -> str:
+    """Texto servido em /metrics."""
+    return registry.render()
@@ -0,0 +1,57 @@
+from fastapi import HTTPException
+from core.executor import extraction_executor
+from core.common import select_pages
+from core.rate_limiter import rate_limiter
+
+def read_page_count(pdf_path):
+    """
+    Conta as páginas de um PDF (roda no pool de extração).
+    
+    Args:
+        pdf_path: Caminho do PDF (só o caminho passa pelo pool, não os bytes)
+    """
+    import pymupdf
+    
+    doc = pymupdf.open(pdf_path, filetype="pdf")
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+async def get_page_count(upload) -> int:
+    """
+    Conta as páginas de um UploadedPDF sem bloquear o event loop.
+    
+    Usa a contagem da triagem (core.triage) quando ela já foi feita; senão
+    grava o upload em disco (upload.spool()) e o worker abre pelo caminho.
+    
+    Raises:
+        HTTPException 400 se o PDF não puder ser aberto
+    """
+    if upload.triage is not None:
+        return upload.triage["pages"]
+    pdf_path = upload.spool()
+    try:
+        return await extraction_executor.run(read_page_count, pdf_path, kind="page_count")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Não foi possível abrir o PDF: {str(e)}")
+
+async def quota_cost(upload, page_ranges=None) -> int:
+    """
+    Custo em cota de um request.
+    
+    Só abre o PDF quando a cobrança por páginas está ligada no rate limiter;
+    caso contrário todo PDF custa 1.
+    """
+    if not rate_limiter.weights_pages:
+        return 1
+    num_pages = await get_page_count(upload)
+    selected = select_pages(page_ranges, num_pages)
+    if num_pages and not selected:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Nenhuma das páginas pedidas existe no documento ({num_pages} páginas)"
+        )
+    return rate_limiter.cost_for_pages(len(selected))
@@ -0,0 +1,338 @@
+"""
+Profiling sob demanda de um request, liberado por um token assinado
+(header X-Profile-Token). Para gerar um token:
+
+    PDFFACIL_PROFILE_SECRET=... python -m core.profiling POST /pdf-to-text/
+"""
+import contextvars
+import cProfile
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from core.common import get_env_int
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = "x-profile-token"
+TOKEN_QUERY_PARAM = "profile_token"
+
+# Rotas de consulta dos perfis (usam o mesmo token, mas não são medidas)
+ADMIN_PREFIX = "/admin/profiles/"
+
+# Funções e linhas de alocação guardadas no resumo JSON
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+SLOWEST_PAGES = 10
+
+profiles_total = registry.counter(
+    "pdffacil_profiles_total", "Requests com profiling pedido, por resultado", ["result"]
+)
+
+
+# Sem segredo o profiling fica desligado
+PROFILE_SECRET = os.environ.get("PDFFACIL_PROFILE_SECRET", "").encode()
+
+# Validade máxima aceita para um token, em segundos
+MAX_TOKEN_TTL = get_env_int("PDFFACIL_PROFILE_MAX_TTL", 3600)
+
+# Onde os perfis ficam guardados, e quantos manter
+PROFILE_DIR = os.environ.get(
+    "PDFFACIL_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "pdffacil-profiles")
+)
+PROFILE_KEEP = get_env_int("PDFFACIL_PROFILE_KEEP", 20)
+
+# Acompanhar alocações com tracemalloc (deixa o request bem mais lento)
+TRACK_ALLOCATIONS = os.environ.get("PDFFACIL_PROFILE_TRACEMALLOC", "1") == "1"
+
+
+def sign(method: str, path: str, expires: int, secret: bytes = None) -> str:
+    """Token que libera o profiling de method + path até expires."""
+    message = f"{expires}:{method.upper()}:{path}".encode()
+    signature = hmac.new(secret or PROFILE_SECRET, message, hashlib.sha256).hexdigest()
+    return f"{expires}:{signature}"
+
+
+def verify(token: str, method: str, path: str) -> bool:
+    """Confere assinatura, método, caminho e validade do token."""
+    if not PROFILE_SECRET or not token:
+        return False
+    expires, _, _ = token.partition(":")
+    try:
+        expires = int(expires)
+    except ValueError:
+        return False
+
+    now = time.time()
+    if expires < now or expires > now + MAX_TOKEN_TTL:
+        return False
+    return hmac.compare_digest(token, sign(method, path, expires))
+
+
+def request_token(request) -> str:
+    return request.headers.get(TOKEN_HEADER) or request.query_params.get(TOKEN_QUERY_PARAM)
+
+
+class ProfileSession:
+    """
+    Um request sendo medido: cProfile no thread do event loop, tracemalloc
+    e os tempos por página que os processors informam.
+
+    O cProfile vê só o processo da API; o que roda nos pools aparece nos
+    tempos por página (medidos dentro dos workers) e nas etapas.
+
+    O event loop é compartilhado: o que outros requests executam enquanto
+    este está sendo medido entra no cProfile (e no tracemalloc) também.
+    concurrent_requests conta esses requests, e o resumo avisa quando o
+    perfil não é exclusivo.
+    """
+
+    def __init__(self, method: str, path: str):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.pages = []
+        self.concurrent_requests = 0
+        self._profiler = cProfile.Profile()
+        self._tracing = TRACK_ALLOCATIONS and not tracemalloc.is_tracing()
+
+    def start(self):
+        if self._tracing:
+            tracemalloc.start()
+        self._start = time.perf_counter()
+        self._profiler.enable()
+
+    def add_pages(self, page_numbers, seconds, kind: str = "extract"):
+        """Tempos por página (índices a partir de 0) medidos por um processor."""
+        for page_num, page_seconds in zip(page_numbers, seconds):
+            self.pages.append({"page": page_num + 1, "seconds": round(page_seconds, 6), "kind": kind})
+
+    def stop(self, status: int, stages) -> dict:
+        """Para as medições e grava o .prof e o resumo .json; retorna o resumo."""
+        self._profiler.disable()
+        duration = time.perf_counter() - self._start
+
+        allocations = None
+        if self._tracing:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            allocations = {
+                "peak_bytes": peak,
+                "top": [
+                    {"location": str(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+                ]
+            }
+
+        summary = {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "started_at": self.started_at,
+            "duration_seconds": round(duration, 6),
+            "exclusive": self.concurrent_requests == 0,
+            "concurrent_requests": self.concurrent_requests,
+            "stages": [
+                {"stage": name, "seconds": round(seconds, 6), "failed": failed}
+                for name, seconds, failed in stages
+            ],
+            "functions": self._top_functions(),
+            "allocations": allocations,
+            "pages": {
+                "count": len(self.pages),
+                "total_seconds": round(sum(page["seconds"] for page in self.pages), 6),
+                "slowest": sorted(self.pages, key=lambda page: page["seconds"], reverse=True)[:SLOWEST_PAGES],
+                "timings": self.pages
+            }
+        }
+        if self.concurrent_requests:
+            summary["note"] = (
+                f"{self.concurrent_requests} outro(s) request(s) rodaram no event loop durante o perfil: "
+                "functions e allocations incluem o trabalho deles"
+            )
+        store.save(self, summary)
+        return summary
+
+    def abort(self):
+        """Desliga as medições sem gravar nada (o request falhou antes da resposta)."""
+        self._profiler.disable()
+        if self._tracing:
+            tracemalloc.stop()
+
+    def _top_functions(self) -> list:
+        stats = pstats.Stats(self._profiler, stream=io.StringIO())
+        rows = []
+        for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": function,
+                "file": filename,
+                "line": line,
+                "calls": calls,
+                "tottime": round(tottime, 6),
+                "cumtime": round(cumtime, 6)
+            })
+        rows.sort(key=lambda row: row["cumtime"], reverse=True)
+        return rows[:TOP_FUNCTIONS]
+
+    def dump_stats(self, path: str):
+        self._profiler.dump_stats(path)
+
+
+class ProfileStore:
+    """Perfis gravados em disco: <id>.prof (pstats) e <id>.json (resumo)."""
+
+    def __init__(self, directory: str, keep: int):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def path(self, profile_id: str, extension: str) -> str:
+        # Só ids gerados aqui (sem barras nem pontos)
+        if not profile_id.replace("-", "").isalnum():
+            return None
+        return os.path.join(self.directory, f"{profile_id}{extension}")
+
+    def save(self, session: ProfileSession, summary: dict):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            session.dump_stats(self.path(session.id, ".prof"))
+            with open(self.path(session.id, ".json"), "w", encoding="utf-8") as summary_file:
+                json.dump(summary, summary_file, ensure_ascii=False, indent=2)
+            self._prune()
+
+    def _prune(self):
+        summaries = sorted(name for name in os.listdir(self.directory) if name.endswith(".json"))
+        for name in summaries[:max(0, len(summaries) - self.keep)]:
+            profile_id = name[:-len(".json")]
+            for extension in (".json", ".prof"):
+                try:
+                    os.remove(self.path(profile_id, extension))
+                except OSError:
+                    pass
+
+    def list(self) -> list:
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted((name[:-len(".json")] for name in names if name.endswith(".json")), reverse=True)
+
+
+store = ProfileStore(PROFILE_DIR, PROFILE_KEEP)
+
+# Sessão do request atual (None fora de um request com profiling)
+_current_session = contextvars.ContextVar("pdffacil_profile_session", default=None)
+
+# Um perfil por vez: o cProfile e o tracemalloc são globais ao processo.
+# Um perfil que nunca terminou (resposta abandonada) é descartado depois de
+# STALE_SECONDS, para não bloquear os próximos.
+STALE_SECONDS = 600
+_active = {"session": None}
+_active_lock = threading.Lock()
+
+# Requests em andamento no processo (com ou sem perfil)
+_in_flight = {"count": 0}
+
+
+def request_started():
+    """Conta um request que começou; se há um perfil ativo, ele deixa de ser exclusivo."""
+    with _active_lock:
+        _in_flight["count"] += 1
+        session = _active["session"]
+        if session is not None:
+            session.concurrent_requests += 1
+
+
+def request_finished():
+    """Desconta um request contado por request_started."""
+    with _active_lock:
+        _in_flight["count"] -= 1
+
+
+def begin(request):
+    """
+    Começa o profiling se o request trouxer um token válido.
+
+    Returns:
+        ProfileSession ou None
+    """
+    token = request_token(request)
+    if not token or request.url.path.startswith(ADMIN_PREFIX):
+        return None
+
+    if not verify(token, request.method, request.url.path):
+        profiles_total.inc(result="rejected")
+        logger.warning("Token de profiling inválido para %s %s", request.method, request.url.path)
+        return None
+
+    with _active_lock:
+        current = _active["session"]
+        if current is not None:
+            if time.time() - current.started_at < STALE_SECONDS:
+                profiles_total.inc(result="busy")
+                logger.warning("Profiling já em andamento; request atendido sem perfil")
+                return None
+            logger.warning("Perfil %s abandonado, descartando", current.id)
+            current.abort()
+
+        session = ProfileSession(request.method, request.url.path)
+        # Os outros requests já em andamento também vão rodar durante o perfil
+        session.concurrent_requests = max(0, _in_flight["count"] - 1)
+        session.start()
+        _active["session"] = session
+
+    _current_session.set(session)
+    logger.info("Profiling do request %s %s (%s)", request.method, request.url.path, session.id)
+    return session
+
+
+def _release(session: ProfileSession):
+    with _active_lock:
+        if _active["session"] is session:
+            _active["session"] = None
+
+
+def finish(session: ProfileSession, status: int, stages):
+    """Encerra o perfil, grava os arquivos e libera o próximo."""
+    try:
+        session.stop(status, stages)
+        profiles_total.inc(result="stored")
+    except Exception as e:
+        logger.error("Erro ao gravar o perfil %s: %s", session.id, e)
+    finally:
+        _release(session)
+
+
+def abort(session: ProfileSession):
+    """Encerra o perfil sem gravar (o request falhou antes da resposta)."""
+    try:
+        session.abort()
+    finally:
+        _release(session)
+
+
+def record_pages(page_numbers, seconds, kind: str = "extract"):
+    """Registra tempos por página no perfil do request atual (se houver um)."""
+    session = _current_session.get()
+    if session is not None:
+        session.add_pages(page_numbers, seconds, kind)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or not PROFILE_SECRET:
+        sys.exit("Uso: PDFFACIL_PROFILE_SECRET=... python -m core.profiling MÉTODO CAMINHO [validade em segundos]")
+    ttl = int(sys.argv[3]) if len(sys.argv) > 3 else 600
+    print(sign(sys.argv[1], sys.argv[2], int(time.time()) + ttl))
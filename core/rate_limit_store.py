@@ -0,0 +1,435 @@
+import hashlib
+import os
+import select
+import socket
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Optional, Tuple
+from urllib.parse import urlparse, unquote
+import logging
+
+logger = logging.getLogger(__name__)
+
+class WindowCounter:
+    """
+    Contador de janela deslizante dividido em baldes de tempo.
+
+    Cada balde guarda quantos requests caíram naquele intervalo (por padrão
+    uma hora). Avançar a janela zera apenas os baldes que saíram dela, então
+    contar e registrar custam O(número de baldes), independente do volume.
+    """
+    __slots__ = ("buckets", "head", "total", "last_seen")
+
+    def __init__(self, num_buckets: int, bucket: int, now: float):
+        self.buckets = array("I", bytes(4 * num_buckets))
+        self.head = bucket
+        self.total = 0
+        self.last_seen = now
+
+    def advance(self, bucket: int):
+        """Move a janela até o balde atual, descartando os baldes expirados."""
+        num_buckets = len(self.buckets)
+        elapsed = bucket - self.head
+        if elapsed <= 0:
+            return
+
+        if elapsed >= num_buckets:
+            for index in range(num_buckets):
+                self.buckets[index] = 0
+            self.total = 0
+        else:
+            for step in range(1, elapsed + 1):
+                index = (self.head + step) % num_buckets
+                self.total -= self.buckets[index]
+                self.buckets[index] = 0
+
+        self.head = bucket
+
+    def count(self, bucket: int) -> int:
+        """Requests dentro da janela."""
+        self.advance(bucket)
+        return self.total
+
+    def add(self, bucket: int, amount: int = 1):
+        """Registra requests no balde atual."""
+        self.advance(bucket)
+        self.buckets[bucket % len(self.buckets)] += amount
+        self.total += amount
+
+class RateLimitStore:
+    """
+    Interface de armazenamento dos contadores do rate limiter.
+
+    Os contadores são janelas deslizantes de num_buckets baldes com
+    bucket_seconds segundos cada, por chave (IP, funcionalidade).
+    """
+
+    # As chamadas fazem I/O bloqueante (disco, rede) e devem rodar fora do event loop
+    blocking = False
+
+    def __init__(self, bucket_seconds: int, num_buckets: int):
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = num_buckets
+
+    def bucket(self, current_time: float) -> int:
+        return int(current_time // self.bucket_seconds)
+
+    def get_usage(self, ip: str, function_name: str, current_time: float) -> int:
+        """Requests usados na janela, sem registrar nada."""
+        raise NotImplementedError
+
+    def check_and_increment(self, ip: str, function_name: str, limit: int,
+                            current_time: float, amount: int = 1) -> Tuple[bool, int]:
+        """
+        Registra o request se couber no limite, de forma atômica.
+
+        Returns:
+            tuple: (permitido, usados na janela antes deste request)
+        """
+        raise NotImplementedError
+
+    def sweep(self, current_time: float) -> int:
+        """Remove chaves expiradas. Retorna quantas foram removidas."""
+        return 0
+
+    def key_count(self) -> Optional[int]:
+        """Número de chaves rastreadas, ou None se o backend não informa."""
+        return None
+
+    def close(self):
+        pass
+
+class MemoryStore(RateLimitStore):
+    """Contadores na memória do processo (um worker só)."""
+
+    def __init__(self, bucket_seconds: int, num_buckets: int, max_tracked_keys: int):
+        super().__init__(bucket_seconds, num_buckets)
+
+        # Armazena: (IP, funcionalidade) -> WindowCounter, do menos ao mais recente
+        self.counters: "OrderedDict[Tuple[str, str], WindowCounter]" = OrderedDict()
+        self.max_tracked_keys = max_tracked_keys
+
+    def get_usage(self, ip, function_name, current_time):
+        counter = self.counters.get((ip, function_name))
+        if counter is None:
+            return 0
+        return counter.count(self.bucket(current_time))
+
+    def check_and_increment(self, ip, function_name, limit, current_time, amount=1):
+        key = (ip, function_name)
+        bucket = self.bucket(current_time)
+
+        counter = self.counters.get(key)
+        used = counter.count(bucket) if counter is not None else 0
+        if used + amount > limit:
+            return False, used
+
+        if counter is None:
+            counter = WindowCounter(self.num_buckets, bucket, current_time)
+            self.counters[key] = counter
+
+            # Teto de chaves: descartar as vistas há mais tempo
+            while len(self.counters) > self.max_tracked_keys:
+                self.counters.popitem(last=False)
+        else:
+            self.counters.move_to_end(key)
+
+        counter.add(bucket, amount)
+        counter.last_seen = current_time
+        return True, used
+
+    def sweep(self, current_time):
+        """
+        Remove as chaves sem requests na janela.
+
+        As chaves ficam ordenadas pelo último acesso, então basta remover
+        do início até encontrar uma chave ainda dentro da janela.
+        """
+        cutoff_time = current_time - self.bucket_seconds * self.num_buckets
+        removed = 0
+
+        while self.counters:
+            key, counter = next(iter(self.counters.items()))
+            if counter.last_seen > cutoff_time:
+                break
+            del self.counters[key]
+            removed += 1
+
+        return removed
+
+    def key_count(self):
+        return len(self.counters)
+
+class SQLiteStore(RateLimitStore):
+    """
+    Contadores em um arquivo SQLite (modo WAL), compartilhados entre
+    os workers do uvicorn na mesma máquina.
+    """
+
+    blocking = True
+
+    def __init__(self, bucket_seconds: int, num_buckets: int, path: str):
+        super().__init__(bucket_seconds, num_buckets)
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit ("
+            " ip TEXT NOT NULL, function TEXT NOT NULL, bucket INTEGER NOT NULL,"
+            " count INTEGER NOT NULL, PRIMARY KEY (ip, function, bucket))"
+        )
+
+    def _sum(self, ip, function_name, bucket):
+        row = self._conn.execute(
+            "SELECT COALESCE(SUM(count), 0) FROM rate_limit"
+            " WHERE ip = ? AND function = ? AND bucket > ?",
+            (ip, function_name, bucket - self.num_buckets)
+        ).fetchone()
+        return row[0]
+
+    def get_usage(self, ip, function_name, current_time):
+        with self._lock:
+            return self._sum(ip, function_name, self.bucket(current_time))
+
+    def check_and_increment(self, ip, function_name, limit, current_time, amount=1):
+        bucket = self.bucket(current_time)
+        with self._lock:
+            # BEGIN IMMEDIATE trava a escrita entre processos até o COMMIT
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                used = self._sum(ip, function_name, bucket)
+                if used + amount > limit:
+                    self._conn.execute("ROLLBACK")
+                    return False, used
+
+                self._conn.execute(
+                    "INSERT INTO rate_limit (ip, function, bucket, count) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT (ip, function, bucket) DO UPDATE SET count = count + excluded.count",
+                    (ip, function_name, bucket, amount)
+                )
+                self._conn.execute("COMMIT")
+                return True, used
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def sweep(self, current_time):
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM rate_limit WHERE bucket <= ?",
+                (self.bucket(current_time) - self.num_buckets,)
+            )
+            return cursor.rowcount
+
+    def key_count(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM (SELECT DISTINCT ip, function FROM rate_limit)"
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class RedisError(Exception):
+    """Erro retornado pelo servidor Redis."""
+
+# Soma a janela (KEYS[1] é o balde atual) e, se o pedido couber no limite,
+# registra no balde atual e renova o TTL. Roda inteiro no servidor, atômico.
+CHECK_AND_INCREMENT_SCRIPT = """
+local used = 0
+for i = 1, #KEYS do
+    used = used + tonumber(redis.call('GET', KEYS[i]) or '0')
+end
+local amount = tonumber(ARGV[1])
+if used + amount > tonumber(ARGV[2]) then
+    return {0, used}
+end
+redis.call('INCRBY', KEYS[1], amount)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return {1, used}
+"""
+
+class RedisStore(RateLimitStore):
+    """
+    Contadores em um servidor que fala o protocolo Redis (RESP).
+
+    Cada balde é uma chave com TTL. O check-and-increment é um script Lua
+    (EVALSHA, com EVAL se o servidor ainda não tem o script): somar a
+    janela, comparar com o limite e registrar acontecem de uma vez no
+    servidor. Fora o script só usa MGET, então funciona com Redis, Valkey,
+    KeyDB ou um servidor falso em testes.
+
+    Comandos que alteram contadores nunca são reenviados: se a conexão cai
+    depois do envio, não há como saber se o servidor os aplicou. Só leituras
+    são repetidas em uma conexão nova.
+    """
+
+    blocking = True
+
+    def __init__(self, bucket_seconds: int, num_buckets: int, url: str,
+                 prefix: str = "pdffacil:rl", timeout: float = 2.0):
+        super().__init__(bucket_seconds, num_buckets)
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self.script_sha = hashlib.sha1(CHECK_AND_INCREMENT_SCRIPT.encode()).hexdigest()
+
+        self._lock = threading.Lock()
+        self._sock = None
+        self._reader = None
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._reader = self._sock.makefile("rb")
+        if self.password:
+            self._call_unlocked(["AUTH", self.password])
+        if self.db:
+            self._call_unlocked(["SELECT", str(self.db)])
+
+    def _disconnect(self):
+        for closable in (self._reader, self._sock):
+            try:
+                if closable is not None:
+                    closable.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Conexão com o Redis encerrada")
+        kind, payload = line[:1], line[1:-2]
+
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RedisError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisError(f"Resposta RESP inválida: {line!r}")
+
+    def _call_unlocked(self, *commands):
+        self._sock.sendall(b"".join(self._encode(command) for command in commands))
+
+        # Ler todas as respostas antes de levantar um erro, para não dessincronizar a conexão
+        replies = []
+        for _ in commands:
+            try:
+                replies.append(self._read_reply())
+            except RedisError as e:
+                replies.append(e)
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies if len(commands) > 1 else replies[0]
+
+    def _ensure_connection(self):
+        """Conecta, ou reconecta se o servidor fechou a conexão ociosa."""
+        if self._sock is not None:
+            # Nada deveria chegar antes de um comando: legível aqui é EOF ou lixo
+            readable, _, _ = select.select([self._sock], [], [], 0)
+            if readable:
+                self._disconnect()
+        if self._sock is None:
+            try:
+                self._connect()
+            except Exception:
+                self._disconnect()
+                raise
+
+    def _call(self, *commands, retry: bool = False):
+        """
+        Envia um ou mais comandos em pipeline.
+
+        Args:
+            retry: Repetir uma vez em uma conexão nova se ela cair (só para leituras)
+        """
+        with self._lock:
+            for attempt in range(2 if retry else 1):
+                self._ensure_connection()
+                try:
+                    return self._call_unlocked(*commands)
+                except (OSError, ConnectionError):
+                    self._disconnect()
+                    if attempt or not retry:
+                        raise
+
+    def _keys(self, ip, function_name, bucket):
+        return [
+            f"{self.prefix}:{function_name}:{ip}:{b}"
+            for b in range(bucket - self.num_buckets + 1, bucket + 1)
+        ]
+
+    def get_usage(self, ip, function_name, current_time):
+        keys = self._keys(ip, function_name, self.bucket(current_time))
+        values = self._call(["MGET", *keys], retry=True)
+        return sum(int(value) for value in values if value is not None)
+
+    def check_and_increment(self, ip, function_name, limit, current_time, amount=1):
+        # Balde atual primeiro (KEYS[1] no script)
+        keys = self._keys(ip, function_name, self.bucket(current_time))[::-1]
+        ttl = self.bucket_seconds * (self.num_buckets + 1)
+        args = [len(keys), *keys, amount, limit, ttl]
+
+        try:
+            allowed, used = self._call(["EVALSHA", self.script_sha, *args])
+        except RedisError as e:
+            if not str(e).startswith("NOSCRIPT"):
+                raise
+            # Script ainda não carregado: nada foi executado, EVAL o envia junto
+            allowed, used = self._call(["EVAL", CHECK_AND_INCREMENT_SCRIPT, *args])
+        return bool(allowed), int(used)
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+def create_store(url: str, bucket_seconds: int, num_buckets: int, max_tracked_keys: int) -> RateLimitStore:
+    """
+    Cria o armazenamento a partir de uma URL de configuração.
+
+    Args:
+        url: "memory", "sqlite:///caminho/arquivo.db" ou "redis://host:porta/db"
+    """
+    if not url or url == "memory":
+        return MemoryStore(bucket_seconds, num_buckets, max_tracked_keys)
+    if url.startswith("sqlite://"):
+        return SQLiteStore(bucket_seconds, num_buckets, url[len("sqlite://"):])
+    if url.startswith("redis://"):
+        return RedisStore(bucket_seconds, num_buckets, url)
+    raise ValueError(f"Armazenamento de rate limit desconhecido: {url}")
@@ -1,27 +1,89 @@
+import asyncio
+import functools
+import os
 import time
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException, Request
-from datetime import datetime, timedelta
 import logging
+from core.common import get_env_int
+from core.rate_limit_store import create_store
+from core.metrics import registry, stage
 
 logger = logging.getLogger(__name__)
 
+rate_limit_rejections = registry.counter(
+    "pdffacil_rate_limit_rejections_total", "Requests recusados pelo rate limiter", ["function", "reason"]
+)
+
 class RateLimiter:
-    """Rate limiter simples em memória para proteger a API."""
+    """Rate limiter diário por IP, com armazenamento plugável (memória, SQLite ou Redis)."""
     
     def __init__(self):
-        # Armazena: IP -> {"pdf_to_text": [timestamps], "pdf_to_docx": [timestamps]}
-        self.requests: Dict[str, Dict[str, List[float]]] = {}
-        
         # Limites por funcionalidade
         self.limits = {
             "pdf_to_text": 40,   # 40 PDFs por dia
-            "pdf_to_docx": 12    # 12 PDFs por dia
+            "pdf_to_docx": 12,   # 12 PDFs por dia
+            "pdf_to_excel": 12   # 12 PDFs por dia
         }
         self.max_file_size_mb = 10       # 10MB por arquivo
         
-        # Tempo de janela em segundos (só diário)
+        # Envios em lote (/batch/...): arquivos e tamanho total por request
+        self.max_batch_files = get_env_int("PDFFACIL_BATCH_MAX_FILES", 20)
+        self.max_batch_size_mb = get_env_int("PDFFACIL_BATCH_MAX_MB", 50)
+        
+        # Tempo de janela em segundos (só diário), dividido em baldes de 1h
         self.day_window = 86400
+        self.bucket_seconds = 3600
+        self.num_buckets = self.day_window // self.bucket_seconds
+        
+        # Máximo de chaves (IP, funcionalidade) rastreadas em memória
+        self.max_tracked_keys = get_env_int("PDFFACIL_RATE_LIMIT_MAX_KEYS", 100000)
+        
+        # Cobrança por páginas: cada N páginas processadas contam como 1 PDF (0 = desligado)
+        self.pages_per_unit = get_env_int("PDFFACIL_RATE_LIMIT_PAGES_PER_UNIT", 0)
+        
+        # Onde os contadores ficam: "memory", "sqlite:///arquivo.db" ou "redis://host:porta/db"
+        self.store = create_store(
+            os.environ.get("PDFFACIL_RATE_LIMIT_STORE", "memory"),
+            self.bucket_seconds,
+            self.num_buckets,
+            self.max_tracked_keys
+        )
+        
+        # SQLite e Redis fazem I/O bloqueante: as chamadas rodam nestas threads,
+        # para que um Redis lento ou o WAL travado não parem o event loop
+        self._store_executor = None
+        if self.store.blocking:
+            self._store_executor = ThreadPoolExecutor(
+                max_workers=get_env_int("PDFFACIL_RATE_LIMIT_THREADS", 4),
+                thread_name_prefix="rate-limit"
+            )
+        
+        # Chaves rastreadas nos armazenamentos bloqueantes, lidas na limpeza periódica
+        self.tracked_keys = None
+        
+        # Intervalo da limpeza em segundo plano
+        self.sweep_interval = get_env_int("PDFFACIL_RATE_LIMIT_SWEEP_SECONDS", 300)
+        self._sweeper_task = None
+    
+    @property
+    def max_file_size_bytes(self) -> int:
+        return self.max_file_size_mb * 1024 * 1024
+    
+    @property
+    def max_batch_size_bytes(self) -> int:
+        return self.max_batch_size_mb * 1024 * 1024
+    
+    @property
+    def weights_pages(self) -> bool:
+        """Indica se a cota é cobrada pelo número de páginas processadas."""
+        return self.pages_per_unit > 0
+    
+    def cost_for_pages(self, pages: int) -> int:
+        """Quantas unidades de cota um request com esse número de páginas custa."""
+        if not self.weights_pages:
+            return 1
+        return max(1, -(-pages // self.pages_per_unit))
     
     def get_client_ip(self, request: Request) -> str:
         """Extrai IP do cliente, considerando proxies."""
@@ -34,38 +96,59 @@ class RateLimiter:
         real_ip = request.headers.get("x-real-ip")
         if real_ip:
             return real_ip
-            
+        
         # IP direto
         if hasattr(request.client, 'host'):
             return request.client.host
-            
+        
         return "unknown"
     
-    def clean_old_requests(self, ip: str, current_time: float):
-        """Remove requests antigos da memória."""
-        if ip not in self.requests:
-            return
-            
-        # Remove requests mais antigos que 24h para todas as funcionalidades
-        cutoff_time = current_time - self.day_window
-        
-        for func_name in self.requests[ip]:
-            self.requests[ip][func_name] = [
-                req_time for req_time in self.requests[ip][func_name] 
-                if req_time > cutoff_time
-            ]
-        
-        # Remove funcionalidades vazias
-        self.requests[ip] = {
-            func: times for func, times in self.requests[ip].items() 
-            if times
-        }
-        
-        # Remove IP se não tem requests recentes
-        if not self.requests[ip]:
-            del self.requests[ip]
+    async def _store_call(self, func, *args, **kwargs):
+        """Chama o armazenamento, fora do event loop se ele bloqueia."""
+        if self._store_executor is None:
+            return func(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._store_executor, functools.partial(func, *args, **kwargs))
+    
+    def key_count(self):
+        """Chaves rastreadas (nos armazenamentos bloqueantes, o valor da última limpeza)."""
+        if self._store_executor is None:
+            return self.store.key_count()
+        return self.tracked_keys
     
-    def check_rate_limit(self, request: Request, function_name: str, file_size_bytes: int = 0) -> bool:
+    async def clean_old_requests(self, current_time: float) -> int:
+        """Remove do armazenamento as chaves sem requests na janela."""
+        removed = await self._store_call(self.store.sweep, current_time)
+        if self._store_executor is not None:
+            self.tracked_keys = await self._store_call(self.store.key_count)
+        return removed
+    
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                removed = await self.clean_old_requests(time.time())
+            except Exception as e:
+                logger.error("Erro na limpeza do rate limiter: %s", e)
+                continue
+            if removed:
+                logger.info("Rate limiter: %d chaves expiradas removidas", removed)
+    
+    def start_sweeper(self):
+        """Inicia a limpeza periódica em segundo plano (no startup da aplicação)."""
+        if self._sweeper_task is None:
+            self._sweeper_task = asyncio.get_running_loop().create_task(self._sweep_loop())
+    
+    def stop_sweeper(self):
+        """Interrompe a limpeza periódica e as threads do armazenamento."""
+        if self._sweeper_task is not None:
+            self._sweeper_task.cancel()
+            self._sweeper_task = None
+        if self._store_executor is not None:
+            self._store_executor.shutdown(wait=False)
+    
+    async def check_rate_limit(self, request: Request, function_name: str, file_size_bytes: int = 0,
+                               cost: int = 1) -> bool:
         """
         Verifica se o request está dentro dos limites.
         
@@ -73,17 +156,24 @@ class RateLimiter:
             request: Request do FastAPI
             function_name: Nome da função ("pdf_to_text" ou "pdf_to_docx")
             file_size_bytes: Tamanho do arquivo em bytes
-            
+            cost: Unidades de cota consumidas (ver cost_for_pages)
+        
         Returns:
             True se permitido, HTTPException se bloqueado
         """
+        with stage("rate_limit"):
+            return await self._check_rate_limit(request, function_name, file_size_bytes, cost)
+    
+    async def _check_rate_limit(self, request: Request, function_name: str, file_size_bytes: int,
+                                cost: int) -> bool:
         ip = self.get_client_ip(request)
         current_time = time.time()
         
         # Verificar tamanho do arquivo
         file_size_mb = file_size_bytes / (1024 * 1024)
         if file_size_mb > self.max_file_size_mb:
-            logger.warning(f"Arquivo muito grande rejeitado: {file_size_mb:.1f}MB de {ip}")
+            logger.warning("Arquivo muito grande rejeitado: %.1fMB de %s", file_size_mb, ip)
+            rate_limit_rejections.inc(function=function_name, reason="file_size")
             raise HTTPException(
                 status_code=413,
                 detail=f"Arquivo muito grande. Máximo permitido: {self.max_file_size_mb}MB"
@@ -96,70 +186,86 @@ class RateLimiter:
                 detail=f"Função não reconhecida: {function_name}"
             )
         
-        # Limpar requests antigos
-        self.clean_old_requests(ip, current_time)
-        
-        # Inicializar estrutura se não existe
-        if ip not in self.requests:
-            self.requests[ip] = {}
-        if function_name not in self.requests[ip]:
-            self.requests[ip][function_name] = []
-        
-        # Contar requests no último dia para esta função
-        day_cutoff = current_time - self.day_window
-        recent_requests = [
-            req_time for req_time in self.requests[ip][function_name] 
-            if req_time > day_cutoff
-        ]
-        
+        # Contar e registrar o request atual de uma vez (atômico no armazenamento)
         daily_limit = self.limits[function_name]
+        allowed, used_today = await self._store_call(
+            self.store.check_and_increment, ip, function_name, daily_limit, current_time, amount=cost
+        )
         
         # Verificar limite diário
-        if len(recent_requests) >= daily_limit:
-            logger.warning(f"Rate limit diário excedido para {ip} em {function_name}: {len(recent_requests)} requests")
-            raise HTTPException(
-                status_code=429,
-                detail=f"Limite diário excedido para {function_name}. Máximo: {daily_limit} PDFs por dia. Tente amanhã."
+        if not allowed:
+            logger.warning(
+                "Rate limit diário excedido para %s em %s: %s requests (+%s)", ip, function_name, used_today, cost
             )
-        
-        # Registrar request atual
-        self.requests[ip][function_name].append(current_time)
+            rate_limit_rejections.inc(function=function_name, reason="daily")
+            if cost > 1 and used_today < daily_limit:
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Cota insuficiente para {function_name}: este envio custa {cost} e restam {daily_limit - used_today} hoje."
+                )
+            raise self._limit_exceeded(function_name)
         
         # Log para monitoramento
-        logger.info(f"Request permitido para {ip} em {function_name}: {len(recent_requests)+1}/{daily_limit} hoje")
+        logger.info("Request permitido para %s em %s: %s/%s hoje", ip, function_name, used_today + cost, daily_limit)
         
         return True
     
-    def get_status(self, request: Request) -> dict:
-        """Retorna status atual do rate limiting para debug."""
+    async def charge_rejection(self, request: Request, function_name: str):
+        """
+        Cobra 1 da cota por um upload recusado pela triagem (ilegível, com
+        senha, páginas demais), sem recusar o request por isso.
+        
+        Cada recusa ainda custa um job do pool; assim quem só envia lixo
+        esgota a cota e passa a ser barrado antes do corpo (UploadGuardMiddleware).
+        """
+        if function_name not in self.limits:
+            return
+        
         ip = self.get_client_ip(request)
-        current_time = time.time()
+        allowed, used_today = await self._store_call(
+            self.store.check_and_increment, ip, function_name, self.limits[function_name], time.time()
+        )
+        if allowed:
+            logger.info("Upload recusado cobrado para %s em %s: %s/%s hoje",
+                        ip, function_name, used_today + 1, self.limits[function_name])
+    
+    def _limit_exceeded(self, function_name: str) -> HTTPException:
+        return HTTPException(
+            status_code=429,
+            detail=f"Limite diário excedido para {function_name}. Máximo: {self.limits[function_name]} PDFs por dia. Tente amanhã."
+        )
+    
+    async def check_quota(self, request: Request, function_name: str) -> bool:
+        """
+        Verifica se ainda há cota, sem registrar o request.
         
-        if ip not in self.requests:
-            return {
-                "ip": ip,
-                "pdf_to_text": {
-                    "used_today": 0,
-                    "limit_daily": self.limits["pdf_to_text"],
-                    "remaining": self.limits["pdf_to_text"]
-                },
-                "pdf_to_docx": {
-                    "used_today": 0,
-                    "limit_daily": self.limits["pdf_to_docx"],
-                    "remaining": self.limits["pdf_to_docx"]
-                }
-            }
+        Usado antes de ler o corpo do upload; o registro acontece depois,
+        em check_rate_limit.
+        
+        Returns:
+            True se há cota, HTTPException 429 se não há
+        """
+        if function_name not in self.limits:
+            return True
+        
+        ip = self.get_client_ip(request)
+        used_today = await self._store_call(self.store.get_usage, ip, function_name, time.time())
+        if used_today >= self.limits[function_name]:
+            logger.warning("Upload recusado antes da leitura para %s em %s: cota esgotada", ip, function_name)
+            rate_limit_rejections.inc(function=function_name, reason="precheck")
+            raise self._limit_exceeded(function_name)
         
-        # Contar requests recentes para cada função
-        day_cutoff = current_time - self.day_window
+        return True
+    
+    async def get_status(self, request: Request) -> dict:
+        """Retorna status atual do rate limiting para debug."""
+        ip = self.get_client_ip(request)
+        current_time = time.time()
         
         status = {"ip": ip}
         
         for func_name, daily_limit in self.limits.items():
-            if func_name in self.requests[ip]:
-                used_today = len([r for r in self.requests[ip][func_name] if r > day_cutoff])
-            else:
-                used_today = 0
+            used_today = await self._store_call(self.store.get_usage, ip, func_name, current_time)
             
             status[func_name] = {
                 "used_today": used_today,
@@ -171,3 +277,8 @@ class RateLimiter:
 
 # Instância global do rate limiter
 rate_limiter = RateLimiter()
+
+registry.gauge(
+    "pdffacil_rate_limit_keys", "Chaves (IP, funcionalidade) rastreadas pelo rate limiter",
+    collect=lambda: {(): rate_limiter.key_count()}
+)
@@ -0,0 +1,28 @@
+import json
+from fastapi.responses import JSONResponse
+
+# orjson é opcional: serializa direto para bytes, bem mais rápido que o json
+# da biblioteca padrão em respostas grandes (textos de centenas de páginas)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(value) -> bytes:
+    """Serializa para JSON em UTF-8 (sem escapar acentos), com orjson se disponível."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def ndjson_line(value) -> bytes:
+    """Uma linha NDJSON (JSON + quebra de linha)."""
+    return dumps(value) + b"\n"
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse que usa dumps(); o conteúdo já deve estar em tipos JSON nativos."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,194 @@
+"""
+Fila justa por cliente (IP) para as vagas dos pools de processos, com
+deficit round-robin sobre o custo estimado de cada job.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict, deque
+from core.common import get_env_int
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Crédito ganho por cliente a cada volta (na unidade de custo abaixo)
+QUANTUM = get_env_int("PDFFACIL_SCHED_QUANTUM", 2)
+
+# Custo estimado de um job, aproximadamente em segundos de CPU: por
+# página de cada tipo, por MB do PDF e um mínimo para qualquer job
+PAGE_COST = {
+    "pdf_to_docx": 1.0,
+    "pdf_to_excel": 0.05,
+    "pdf_to_text": 0.01,
+    "page_count": 0.0
+}
+DEFAULT_PAGE_COST = 0.1
+MB_COST = 0.05
+BASE_COST = 0.05
+
+# Prioridade por tipo: o custo cobrado do cliente é dividido pelo peso,
+# então extrações de texto passam à frente de conversões DOCX
+KIND_WEIGHTS = {
+    "page_count": get_env_int("PDFFACIL_SCHED_WEIGHT_PAGE_COUNT", 8),
+    "pdf_to_text": get_env_int("PDFFACIL_SCHED_WEIGHT_PDF_TO_TEXT", 4),
+    "pdf_to_excel": get_env_int("PDFFACIL_SCHED_WEIGHT_PDF_TO_EXCEL", 2),
+    "pdf_to_docx": get_env_int("PDFFACIL_SCHED_WEIGHT_PDF_TO_DOCX", 1)
+}
+
+# Documentos da fila pesada (ver core/triage.py) pagam este múltiplo do
+# custo, para que os leves do mesmo momento passem na frente
+HEAVY_LANE_FACTOR = get_env_int("PDFFACIL_SCHED_HEAVY_FACTOR", 2)
+
+scheduler_wait_seconds = registry.histogram(
+    "pdffacil_scheduler_wait_seconds", "Espera na fila justa até ganhar uma vaga no pool", ["executor", "kind"]
+)
+
+# Cliente do request atual (o middleware define um por request)
+_current_client = contextvars.ContextVar("pdffacil_client", default="unknown")
+
+
+def set_client(client: str):
+    """Define o cliente dos jobs disparados pelo request ou job atual."""
+    _current_client.set(client)
+
+
+def current_client() -> str:
+    return _current_client.get()
+
+
+def estimate_seconds(kind: str, pages: int = 0, size: int = 0) -> float:
+    """Tempo de CPU estimado de um job, sem prioridades."""
+    return BASE_COST + PAGE_COST.get(kind, DEFAULT_PAGE_COST) * pages + MB_COST * size / (1024 * 1024)
+
+
+def estimate_cost(kind: str, pages: int = 0, size: int = 0, lane: str = "fast") -> float:
+    """
+    Custo de um job para o deficit round-robin.
+
+    Args:
+        kind: Tipo de trabalho (pdf_to_docx, pdf_to_text, ...)
+        pages: Páginas que o job processa (0 se ainda não se sabe)
+        size: Tamanho do PDF em bytes
+        lane: "fast" ou "heavy", definida pela triagem
+    """
+    cost = estimate_seconds(kind, pages, size) / max(1, KIND_WEIGHTS.get(kind, 1))
+    return cost * HEAVY_LANE_FACTOR if lane == "heavy" else cost
+
+
+class _Waiter:
+    __slots__ = ("future", "cost", "kind")
+
+    def __init__(self, future, cost, kind):
+        self.future = future
+        self.cost = cost
+        self.kind = kind
+
+
+class FairScheduler:
+    """
+    Controla as vagas de um pool (uma por worker) com deficit round-robin.
+
+    Args:
+        slots: Jobs rodando ao mesmo tempo
+        label: Rótulo nas métricas (o do executor)
+        quantum: Crédito por volta de cada cliente
+    """
+
+    def __init__(self, slots: int, label: str, quantum: float = QUANTUM):
+        self.slots = slots
+        self.label = label
+        self.quantum = quantum
+        self.running = 0
+
+        # Clientes com jobs na fila, na ordem da volta; o primeiro é a vez atual
+        self._flows = OrderedDict()
+        self._deficits = {}
+        self._credited = None
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._flows.values())
+
+    @property
+    def clients(self) -> int:
+        return len(self._flows)
+
+    async def acquire(self, kind: str, cost: float, client: str = None):
+        """Aguarda a vez do cliente e ocupa uma vaga (devolvida com release)."""
+        start = time.perf_counter()
+        if self.running < self.slots and not self._flows:
+            self.running += 1
+            scheduler_wait_seconds.observe(0.0, executor=self.label, kind=kind)
+            return
+
+        client = client or _current_client.get()
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), cost, kind)
+        self._flows.setdefault(client, deque()).append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # A vaga saiu, mas o request desistiu antes de usá-la
+                self.release()
+            else:
+                self._discard(client, waiter)
+            raise
+        finally:
+            scheduler_wait_seconds.observe(time.perf_counter() - start, executor=self.label, kind=kind)
+
+    def release(self):
+        """Devolve a vaga e passa para o próximo da fila."""
+        self.running -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.running < self.slots:
+            waiter = self._next()
+            if waiter is None:
+                return
+            self.running += 1
+            waiter.future.set_result(None)
+
+    def _next(self):
+        """Próximo job pelo deficit round-robin, ou None se a fila está vazia."""
+        while self._flows:
+            client, queue = next(iter(self._flows.items()))
+            while queue and queue[0].future.done():
+                queue.popleft()
+            if not queue:
+                self._drop(client)
+                continue
+
+            # Começo da vez do cliente: ganha um quantum de crédito
+            if self._credited != client:
+                self._deficits[client] = self._deficits.get(client, 0.0) + self.quantum
+                self._credited = client
+
+            head = queue[0]
+            if self._deficits[client] >= head.cost:
+                queue.popleft()
+                self._deficits[client] -= head.cost
+                if not queue:
+                    self._drop(client)
+                return head
+
+            # Crédito insuficiente: fica para a próxima volta
+            self._flows.move_to_end(client)
+            self._credited = None
+        return None
+
+    def _drop(self, client):
+        """Tira da volta um cliente sem jobs na fila (o crédito não acumula)."""
+        self._flows.pop(client, None)
+        self._deficits.pop(client, None)
+        if self._credited == client:
+            self._credited = None
+
+    def _discard(self, client, waiter):
+        queue = self._flows.get(client)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                self._drop(client)
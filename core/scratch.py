@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from fastapi import HTTPException
+from core.common import get_env_int
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Prefixo dos diretórios criados; o PID do dono vem logo depois
+DIR_PREFIX = "pdffacil-"
+
+# Raiz padrão em memória (tmpfs), quando existe
+SHM_ROOT = "/dev/shm"
+
+# Cota padrão de um job: no máximo este valor e esta fração da capacidade
+# da raiz (um /dev/shm de 64MB, comum em containers, dá 32MB por job)
+DEFAULT_JOB_QUOTA_BYTES = 200 * 1024 * 1024
+JOB_QUOTA_CAPACITY_SHARE = 2
+
+
+class ScratchQuotaExceeded(Exception):
+    """O job passaria da cota de espaço temporário (levantada também nos workers)."""
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def directory_size(path: str) -> int:
+    """Soma dos tamanhos dos arquivos dentro de path."""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+
+class ScratchSpace:
+    """
+    Espaço temporário das conversões (PDF recebido, DOCX/planilha gerados).
+
+    Os diretórios ficam de preferência em memória (/dev/shm); quando a raiz
+    não tem espaço para mais um job, o diretório vai para o disco. Cada
+    diretório criado fica registrado até release(); o janitor remove os
+    que sobraram (de requests interrompidos ou de processos que morreram).
+    """
+
+    def __init__(self):
+        # Raiz preferida (tmpfs) e raiz em disco usada quando ela enche
+        default_root = os.path.join(SHM_ROOT, "pdffacil") if os.path.isdir(SHM_ROOT) else None
+        self.root = os.environ.get("PDFFACIL_SCRATCH_DIR") or default_root
+        self.fallback_root = os.path.join(tempfile.gettempdir(), "pdffacil-scratch")
+
+        # Espaço máximo de um job (entrada + saída); sem a variável, cada raiz
+        # usa o padrão limitado pela capacidade dela (ver job_quota)
+        configured_mb = get_env_int("PDFFACIL_SCRATCH_JOB_MB", 0)
+        self.configured_quota_bytes = configured_mb * 1024 * 1024 if configured_mb > 0 else None
+
+        # Idade a partir da qual um diretório sem dono é removido, e intervalo do janitor
+        self.max_age_seconds = get_env_int("PDFFACIL_SCRATCH_MAX_AGE_MINUTES", 30) * 60
+        self.janitor_interval = get_env_int("PDFFACIL_SCRATCH_JANITOR_SECONDS", 300)
+
+        self._active = set()
+        self._lock = threading.Lock()
+        self._janitor_task = None
+        self._quotas = {}
+        self._on_fallback = False
+        self.stats = {"reaped": 0, "quota_exceeded": 0, "fallbacks": 0}
+
+    @property
+    def roots(self) -> list:
+        """Raízes em uso, na ordem de preferência."""
+        return [root for root in (self.root, self.fallback_root) if root]
+
+    def free_bytes(self, root: str) -> int:
+        """Espaço livre no sistema de arquivos da raiz."""
+        try:
+            os.makedirs(root, exist_ok=True)
+            return shutil.disk_usage(root).free
+        except OSError:
+            return 0
+
+    def job_quota(self, root: str) -> int:
+        """Cota de um job na raiz: a configurada ou o padrão limitado pela capacidade."""
+        if self.configured_quota_bytes is not None:
+            return self.configured_quota_bytes
+        quota = self._quotas.get(root)
+        if quota is None:
+            try:
+                os.makedirs(root, exist_ok=True)
+                capacity = shutil.disk_usage(root).total
+            except OSError:
+                capacity = 0
+            quota = min(DEFAULT_JOB_QUOTA_BYTES, capacity // JOB_QUOTA_CAPACITY_SHARE)
+            self._quotas[root] = quota
+        return quota
+
+    def _root_of(self, path: str):
+        for root in self.roots:
+            if path.startswith(root + os.sep):
+                return root
+        return None
+
+    def create(self) -> str:
+        """
+        Cria um diretório para um job.
+
+        Returns:
+            str: Caminho do diretório
+
+        Raises:
+            HTTPException 507 quando nenhuma raiz tem espaço para a cota de um job
+        """
+        for index, root in enumerate(self.roots):
+            if self.free_bytes(root) < self.job_quota(root):
+                continue
+            if index > 0 and self.root:
+                self.stats["fallbacks"] += 1
+                # Um aviso por episódio; os desvios seguintes só contam na métrica
+                if not self._on_fallback:
+                    self._on_fallback = True
+                    logger.warning("Espaço temporário em %s esgotado, usando %s", self.root, root)
+            elif index == 0 and self._on_fallback:
+                self._on_fallback = False
+                logger.info("Espaço temporário em %s disponível de novo", root)
+            path = tempfile.mkdtemp(prefix=f"{DIR_PREFIX}{os.getpid()}-", dir=root)
+            with self._lock:
+                self._active.add(path)
+            return path
+
+        raise HTTPException(status_code=507, detail="Sem espaço temporário para processar o arquivo")
+
+    def release(self, path: str):
+        """Remove o diretório e o tira do registro."""
+        if not path:
+            return
+        with self._lock:
+            self._active.discard(path)
+        if os.path.exists(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+    def enforce_quota(self, path: str, incoming: int = 0):
+        """
+        Recusa a gravação se o diretório do job, somado a incoming bytes,
+        passaria da cota. Chamada antes de gravar (também nos workers).
+
+        Raises:
+            ScratchQuotaExceeded
+        """
+        root = self._root_of(path)
+        quota = self.job_quota(root) if root else self.configured_quota_bytes or DEFAULT_JOB_QUOTA_BYTES
+        if directory_size(path) + incoming > quota:
+            raise ScratchQuotaExceeded(
+                f"O resultado passou do limite de espaço temporário por arquivo ({quota // (1024 * 1024)}MB)"
+            )
+
+    def quota_error(self, error: ScratchQuotaExceeded) -> HTTPException:
+        """Converte a recusa (vinda do pool ou não) em 507, contando na métrica."""
+        self.stats["quota_exceeded"] += 1
+        return HTTPException(status_code=507, detail=str(error))
+
+    def write_file(self, path: str, data: bytes):
+        """Grava data em path se couber na cota do diretório do job."""
+        self.enforce_quota(os.path.dirname(path), len(data))
+        with open(path, "wb") as output:
+            output.write(data)
+
+    def leaked_directories(self, current_time: float) -> list:
+        """
+        Diretórios que ninguém vai remover: não estão registrados neste
+        processo, têm mais de max_age_seconds e o processo dono não existe
+        mais (ou é este mesmo).
+        """
+        with self._lock:
+            active = set(self._active)
+
+        leaked = []
+        for root in self.roots:
+            try:
+                entries = list(os.scandir(root))
+            except OSError:
+                continue
+            for entry in entries:
+                if not entry.name.startswith(DIR_PREFIX) or entry.path in active:
+                    continue
+                try:
+                    age = current_time - entry.stat().st_mtime
+                    owner = int(entry.name[len(DIR_PREFIX):].split("-", 1)[0])
+                except (OSError, ValueError):
+                    continue
+                if age < self.max_age_seconds:
+                    continue
+                if owner != os.getpid() and _pid_alive(owner):
+                    continue
+                leaked.append(entry.path)
+        return leaked
+
+    def reap(self, current_time: float) -> int:
+        """Remove os diretórios esquecidos; retorna quantos foram removidos."""
+        leaked = self.leaked_directories(current_time)
+        for path in leaked:
+            shutil.rmtree(path, ignore_errors=True)
+        self.stats["reaped"] += len(leaked)
+        return len(leaked)
+
+    async def _janitor_loop(self):
+        while True:
+            try:
+                removed = await asyncio.to_thread(self.reap, time.time())
+            except Exception as e:
+                logger.error("Erro na limpeza do espaço temporário: %s", e)
+                removed = 0
+            if removed:
+                logger.warning("Espaço temporário: %s diretórios esquecidos removidos", removed)
+            await asyncio.sleep(self.janitor_interval)
+
+    def start_janitor(self):
+        """Faz uma limpeza agora e repete a cada janitor_interval (no startup da aplicação)."""
+        if self._janitor_task is None:
+            self._janitor_task = asyncio.get_running_loop().create_task(self._janitor_loop())
+
+    def stop_janitor(self):
+        """Interrompe a limpeza periódica."""
+        if self._janitor_task is not None:
+            self._janitor_task.cancel()
+            self._janitor_task = None
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            active = len(self._active)
+        return {
+            "root": self.root,
+            "fallback_root": self.fallback_root,
+            "active_dirs": active,
+            "job_quota_mb": {root: self.job_quota(root) // (1024 * 1024) for root in self.roots},
+            "free_bytes": {root: self.free_bytes(root) for root in self.roots},
+            **self.stats
+        }
+
+
+# Instância global do espaço temporário
+scratch_space = ScratchSpace()
+
+registry.gauge(
+    "pdffacil_scratch_free_bytes", "Espaço livre em cada raiz do espaço temporário", ["root"],
+    collect=lambda: {(root,): scratch_space.free_bytes(root) for root in scratch_space.roots}
+)
+registry.gauge(
+    "pdffacil_scratch_active_dirs", "Diretórios temporários em uso neste processo",
+    collect=lambda: {(): scratch_space.get_stats()["active_dirs"]}
+)
+registry.gauge(
+    "pdffacil_scratch_leaked_dirs", "Diretórios esquecidos aguardando o janitor",
+    collect=lambda: {(): len(scratch_space.leaked_directories(time.time()))}
+)
+registry.counter(
+    "pdffacil_scratch_events_total", "Diretórios removidos pelo janitor, cotas estouradas e desvios para o disco",
+    ["event"],
+    collect=lambda: {(event,): count for event, count in scratch_space.stats.items()}
+)
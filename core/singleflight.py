@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+singleflight_requests = registry.counter(
+    "pdffacil_singleflight_requests_total",
+    "Requests que iniciaram uma conversão (leader) ou aguardaram uma idêntica (coalesced)",
+    ["flight", "role"]
+)
+
+
+class _Flight:
+    """Uma conversão em andamento e os requests que aguardam por ela."""
+
+    def __init__(self):
+        self.task = None
+        self.shares = []
+
+
+class SingleFlight:
+    """
+    Junta conversões idênticas que chegam ao mesmo tempo.
+
+    O primeiro request para uma chave (hash do PDF + opções) faz o trabalho;
+    os que chegam enquanto ele roda aguardam o mesmo resultado, ou a mesma
+    exceção. Vale para qualquer trabalho assíncrono, rode ele no event loop
+    ou nos pools de processos.
+
+    O trabalho roda em uma task própria: se o cliente do primeiro request
+    desconectar, os demais continuam recebendo o resultado. O resultado (ou
+    a cópia) de um request cancelado é passado a discard quando fica pronto,
+    para que os arquivos dele não fiquem sem dono.
+    """
+
+    def __init__(self):
+        self._flights = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def run(self, key, work, share=None, label: str = "conversion", discard=None):
+        """
+        Executa work() uma vez por chave entre os requests simultâneos.
+
+        Args:
+            key: Chave do trabalho (None desativa a junção)
+            work: Função sem argumentos que retorna a corrotina do trabalho
+            share: Função que recebe o resultado e devolve a cópia entregue a
+                este request quando ele não é o primeiro (padrão: o próprio
+                resultado). Roda logo que o trabalho termina, antes de o
+                primeiro request seguir com o resultado dele.
+            label: Rótulo nas métricas
+            discard: Função chamada com o resultado (ou a cópia) que ninguém
+                vai receber porque o request foi cancelado enquanto esperava
+
+        Returns:
+            O resultado de work(), ou a cópia feita por share
+        """
+        if key is None:
+            return await work()
+
+        flight = self._flights.get(key)
+        if flight is not None:
+            index = len(flight.shares)
+            flight.shares.append(share)
+            singleflight_requests.inc(flight=label, role="coalesced")
+            logger.info("Conversão idêntica em andamento (%s), aguardando o resultado", label)
+            try:
+                _, copies = await asyncio.shield(flight.task)
+            except asyncio.CancelledError:
+                self._discard_when_done(flight.task, discard, lambda outcome: outcome[1][index])
+                raise
+            copy = copies[index]
+            if isinstance(copy, Exception):
+                raise copy
+            return copy
+
+        flight = _Flight()
+        self._flights[key] = flight
+        # work() é chamado aqui, antes de qualquer await: ao sair de run, o
+        # trabalho já existe mesmo que este request seja cancelado em seguida
+        flight.task = asyncio.ensure_future(self._lead(key, flight, work()))
+        # Evita o aviso de exceção não lida se o primeiro request for cancelado
+        flight.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        singleflight_requests.inc(flight=label, role="leader")
+        try:
+            result, _ = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            self._discard_when_done(flight.task, discard, lambda outcome: outcome[0])
+            raise
+        return result
+
+    @staticmethod
+    def _discard_when_done(task, discard, pick):
+        """Entrega a discard a parte do resultado de um request que foi cancelado."""
+        if discard is None:
+            return
+
+        def callback(task):
+            if task.cancelled() or task.exception() is not None:
+                return
+            value = pick(task.result())
+            if isinstance(value, Exception):
+                return
+            try:
+                discard(value)
+            except Exception as e:
+                logger.error("Erro ao descartar resultado não entregue: %s", e)
+
+        task.add_done_callback(callback)
+
+    async def _lead(self, key, flight: _Flight, work):
+        try:
+            result = await work
+        finally:
+            # Quem chegar depois daqui começa um trabalho novo
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+        copies = []
+        for share in flight.shares:
+            try:
+                copies.append(result if share is None else share(result))
+            except Exception as e:
+                logger.error("Erro ao entregar resultado compartilhado: %s", e)
+                copies.append(e)
+        return result, copies
+
+
+# Instância global
+single_flight = SingleFlight()
+
+registry.gauge(
+    "pdffacil_singleflight_in_flight", "Conversões em andamento que aceitam requests idênticos",
+    collect=lambda: {(): single_flight.in_flight}
+)
@@ -0,0 +1,259 @@
+"""
+Triagem do PDF antes da conversão: recusa arquivos patológicos (cada
+recusa custa 1 da cota) e escolhe a fila rápida ou pesada do escalonador.
+"""
+import logging
+import time
+from fastapi import HTTPException
+from core.common import get_env_int, select_pages
+from core.executor import extraction_executor
+from core.metrics import registry
+from core.rate_limiter import rate_limiter
+from core.scheduler import estimate_seconds
+
+logger = logging.getLogger(__name__)
+
+# Páginas amostradas para fontes e proporção imagem/texto
+SAMPLE_PAGES = 5
+
+# Página "escaneada": imagens cobrindo boa parte dela e quase nenhum texto
+SCANNED_IMAGE_COVERAGE = 0.5
+SCANNED_MAX_CHARS = 100
+
+PAGES_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+triage_total = registry.counter(
+    "pdffacil_triage_total", "PDFs triados, por tipo de trabalho, fila e classe", ["kind", "lane", "document_class"]
+)
+triage_rejected = registry.counter(
+    "pdffacil_triage_rejected_total", "PDFs recusados pela triagem, por motivo", ["kind", "reason"]
+)
+triage_seconds = registry.histogram(
+    "pdffacil_triage_seconds", "Tempo de leitura da triagem dentro do worker", ["kind"]
+)
+triage_pages = registry.histogram(
+    "pdffacil_triage_pages", "Páginas dos PDFs triados", ["kind"], buckets=PAGES_BUCKETS
+)
+
+
+# Máximo de páginas a converter, por tipo de trabalho
+MAX_PAGES = {
+    "pdf_to_text": get_env_int("PDFFACIL_TRIAGE_TEXT_MAX_PAGES", 5000),
+    "pdf_to_excel": get_env_int("PDFFACIL_TRIAGE_EXCEL_MAX_PAGES", 2000),
+    "pdf_to_docx": get_env_int("PDFFACIL_TRIAGE_DOCX_MAX_PAGES", 500)
+}
+
+# Muitas páginas em poucos bytes: páginas vazias ou repetidas em massa
+DENSITY_MIN_PAGES = get_env_int("PDFFACIL_TRIAGE_DENSITY_MIN_PAGES", 1000)
+MIN_BYTES_PER_PAGE = get_env_int("PDFFACIL_TRIAGE_MIN_BYTES_PER_PAGE", 256)
+
+# Máximo de objetos (xrefs) no arquivo
+MAX_OBJECTS = get_env_int("PDFFACIL_TRIAGE_MAX_OBJECTS", 2_000_000)
+
+# Acima deste tempo estimado (segundos) o documento vai para a fila pesada
+HEAVY_SECONDS = get_env_int("PDFFACIL_TRIAGE_HEAVY_SECONDS", 20)
+
+
+class UnreadablePDF(ValueError):
+    """O PyMuPDF não conseguiu abrir ou interpretar o arquivo (erro do PDF, não do servidor)."""
+
+
+def _sample_indexes(num_pages: int, count: int) -> list:
+    """Até count páginas espalhadas pelo documento, incluindo a primeira e a última."""
+    if num_pages <= count:
+        return list(range(num_pages))
+    return sorted({round(i * (num_pages - 1) / (count - 1)) for i in range(count)})
+
+
+def read_triage(pdf_path, sample_pages: int = SAMPLE_PAGES) -> dict:
+    """
+    Lê as características do PDF (roda no pool de extração).
+
+    Args:
+        pdf_path: Caminho do PDF (só o caminho passa pelo pool, não os bytes)
+        sample_pages: Páginas amostradas para fontes e imagem/texto
+    """
+    import pymupdf
+
+    # Erros do conteúdo do arquivo; os demais (memória, sistema) são do servidor
+    file_errors = (
+        pymupdf.FileDataError, pymupdf.mupdf.FzErrorFormat,
+        pymupdf.mupdf.FzErrorSyntax, pymupdf.mupdf.FzErrorUnsupported
+    )
+
+    start = time.perf_counter()
+    try:
+        doc = pymupdf.open(pdf_path, filetype="pdf")
+        try:
+            info = _read_document(doc, sample_pages)
+        finally:
+            doc.close()
+    except file_errors as e:
+        raise UnreadablePDF(str(e)) from None
+    info["seconds"] = round(time.perf_counter() - start, 6)
+    return info
+
+
+def _read_document(doc, sample_pages: int) -> dict:
+    import pymupdf
+
+    info = {
+        "pages": len(doc),
+        "encrypted": bool(doc.is_encrypted),
+        "needs_password": bool(doc.needs_pass),
+        "objects": doc.xref_length(),
+        "sampled_pages": 0,
+        "fonts": 0,
+        "image_coverage": 0.0,
+        "chars_per_page": 0,
+        "scanned_ratio": 0.0
+    }
+    if doc.needs_pass:
+        return info
+
+    indexes = _sample_indexes(len(doc), sample_pages)
+    fonts = set()
+    coverage = 0.0
+    chars = 0
+    scanned = 0
+    for page_num in indexes:
+        page = doc[page_num]
+        fonts.update(font[3] for font in page.get_fonts())
+
+        page_area = abs(page.rect) or 1.0
+        image_area = sum(abs(pymupdf.Rect(image["bbox"]) & page.rect) for image in page.get_image_info())
+        page_coverage = min(1.0, image_area / page_area)
+        page_chars = len(page.get_text("text").strip())
+
+        coverage += page_coverage
+        chars += page_chars
+        if page_coverage >= SCANNED_IMAGE_COVERAGE and page_chars < SCANNED_MAX_CHARS:
+            scanned += 1
+
+    if indexes:
+        info.update(
+            sampled_pages=len(indexes),
+            fonts=len(fonts),
+            image_coverage=round(coverage / len(indexes), 3),
+            chars_per_page=chars // len(indexes),
+            scanned_ratio=round(scanned / len(indexes), 3)
+        )
+    return info
+
+
+def document_class(scanned_ratio: float) -> str:
+    if scanned_ratio >= 0.5:
+        return "scanned"
+    return "mixed" if scanned_ratio > 0 else "digital"
+
+
+def _reject(kind: str, reason: str, status_code: int, detail: str):
+    triage_rejected.inc(kind=kind, reason=reason)
+    logger.warning("PDF recusado pela triagem (%s, %s): %s", kind, reason, detail)
+    raise HTTPException(status_code=status_code, detail=detail)
+
+
+def classify(info: dict, kind: str, size: int, page_ranges=None) -> dict:
+    """
+    Aplica os limites e escolhe a fila a partir do que read_triage leu.
+
+    Raises:
+        HTTPException 400 (senha, seleção vazia), 413 (páginas demais) ou
+        422 (estrutura patológica)
+    """
+    num_pages = info["pages"]
+    if info["needs_password"]:
+        _reject(kind, "password", 400, "PDF protegido por senha")
+
+    if info["objects"] > MAX_OBJECTS:
+        _reject(kind, "objects", 422, f"PDF com objetos demais ({info['objects']})")
+
+    if num_pages >= DENSITY_MIN_PAGES and size / num_pages < MIN_BYTES_PER_PAGE:
+        _reject(
+            kind, "density", 422,
+            f"PDF com {num_pages} páginas em {size} bytes: estrutura suspeita, recusado"
+        )
+
+    selected = len(select_pages(page_ranges, num_pages))
+    if num_pages and not selected:
+        _reject(kind, "empty_selection", 400, f"Nenhuma das páginas pedidas existe no documento ({num_pages} páginas)")
+
+    max_pages = MAX_PAGES.get(kind)
+    if max_pages and selected > max_pages:
+        _reject(
+            kind, "pages", 413,
+            f"Páginas demais para converter de uma vez ({selected}, máximo {max_pages}); "
+            f"use o parâmetro pages para escolher um trecho"
+        )
+
+    seconds = estimate_seconds(kind, selected, size)
+    scanned = info["scanned_ratio"] >= 0.5
+    heavy = seconds >= HEAVY_SECONDS or (scanned and kind != "pdf_to_text")
+    return {
+        **info,
+        "pages_selected": selected,
+        "size": size,
+        "document_class": document_class(info["scanned_ratio"]),
+        "estimated_seconds": round(seconds, 3),
+        "lane": "heavy" if heavy else "fast"
+    }
+
+
+async def triage_pdf(upload, kind: str, page_ranges=None, request=None) -> dict:
+    """
+    Faz a triagem de um UploadedPDF (uma vez; o resultado fica em upload.triage).
+
+    Uploads em memória são gravados em disco (upload.spool()) e o worker
+    recebe só o caminho; quem chama remove o arquivo com upload.cleanup().
+
+    Args:
+        upload: UploadedPDF recebido
+        kind: Tipo de trabalho (pdf_to_text, pdf_to_docx, pdf_to_excel)
+        page_ranges: Seleção de páginas (core.common.parse_page_ranges) ou None
+        request: Request do cliente; se informado, cada recusa custa 1 da cota
+            (RateLimiter.charge_rejection)
+
+    Returns:
+        dict: Características do PDF, tempo estimado e fila ("fast" ou "heavy")
+    """
+    if upload.triage is not None:
+        return upload.triage
+
+    pdf_path = upload.spool()
+    try:
+        info = await extraction_executor.run(read_triage, pdf_path, kind="page_count", size=upload.size)
+    except UnreadablePDF as e:
+        triage_rejected.inc(kind=kind, reason="unreadable")
+        await _charge_rejection(request, kind)
+        raise HTTPException(status_code=400, detail=f"Não foi possível abrir o PDF: {str(e)}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        # Pool quebrado, falha ao iniciar o worker etc.: problema do servidor, não do arquivo
+        logger.error("Erro na triagem do PDF (%s): %s", kind, e)
+        raise HTTPException(status_code=500, detail=f"Erro ao analisar o PDF: {str(e)}")
+
+    triage_seconds.observe(info["seconds"], kind=kind)
+    triage_pages.observe(info["pages"], kind=kind)
+
+    try:
+        upload.triage = classify(info, kind, upload.size, page_ranges)
+    except HTTPException:
+        await _charge_rejection(request, kind)
+        raise
+    triage_total.inc(kind=kind, lane=upload.triage["lane"], document_class=upload.triage["document_class"])
+    return upload.triage
+
+
+async def _charge_rejection(request, kind: str):
+    if request is not None:
+        await rate_limiter.charge_rejection(request, kind)
+
+
+def triage_header(triage: dict) -> str:
+    """Resumo da triagem para o header X-PDF-Triage das respostas em arquivo."""
+    return (
+        f"lane={triage['lane']}; class={triage['document_class']}; pages={triage['pages']}; "
+        f"scanned={triage['scanned_ratio']}; fonts={triage['fonts']}; objects={triage['objects']}; "
+        f"estimated_seconds={triage['estimated_seconds']}"
+    )
@@ -0,0 +1,96 @@
+import logging
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from core.rate_limiter import rate_limiter
+from core.cache import result_cache
+from core.common import get_env_int
+
+logger = logging.getLogger(__name__)
+
+
+class UploadGuardMiddleware:
+    """
+    Middleware ASGI que protege as rotas de upload antes de o corpo ser lido.
+
+    - Recusa com 413 quando o Content-Length já passa do limite.
+    - Conta os bytes recebidos (inclusive em uploads chunked) e interrompe
+      com 413 assim que o limite é ultrapassado.
+    - Recusa com 429, sem ler o corpo, IPs que já esgotaram a cota diária.
+
+    Args:
+        app: Aplicação ASGI
+        routes: Caminho da rota -> nome da função no rate limiter
+        batch_routes: Rotas de lote, limitadas pelo tamanho total do lote
+    """
+
+    def __init__(self, app, routes: dict, batch_routes=()):
+        self.app = app
+        self.routes = routes
+        self.batch_routes = set(batch_routes)
+
+        # Folga para os cabeçalhos e delimitadores do multipart
+        self.multipart_overhead = get_env_int("PDFFACIL_UPLOAD_OVERHEAD_BYTES", 64 * 1024)
+
+    @property
+    def max_body_bytes(self) -> int:
+        return rate_limiter.max_file_size_bytes + self.multipart_overhead
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        function_name = self.routes.get(scope["path"])
+        if function_name is None:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["path"] in self.batch_routes:
+            max_body_bytes = rate_limiter.max_batch_size_bytes + self.multipart_overhead
+            max_mb = rate_limiter.max_batch_size_mb
+        else:
+            max_body_bytes = self.max_body_bytes
+            max_mb = rate_limiter.max_file_size_mb
+        too_large = HTTPException(
+            status_code=413,
+            detail=f"Arquivo muito grande. Máximo permitido: {max_mb}MB"
+        )
+
+        # 1. Content-Length declarado acima do limite
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_body_bytes:
+            logger.warning("Upload recusado pelo Content-Length: %s bytes em %s", content_length, scope['path'])
+            await self._reject(scope, receive, send, too_large)
+            return
+
+        # 2. Cota diária esgotada (se acertos no cache também contam, nada muda depois)
+        if result_cache.hits_count_against_limit:
+            try:
+                await rate_limiter.check_quota(Request(scope), function_name)
+            except HTTPException as exc:
+                await self._reject(scope, receive, send, exc)
+                return
+
+        # 3. Contar os bytes conforme o corpo chega
+        received = 0
+
+        async def guarded_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_bytes:
+                    logger.warning("Upload interrompido após %s bytes em %s", received, scope['path'])
+                    raise too_large
+            return message
+
+        await self.app(scope, guarded_receive, send)
+
+    async def _reject(self, scope, receive, send, exc: HTTPException):
+        response = JSONResponse(
+            status_code=exc.status_code,
+            content={"detail": exc.detail},
+            headers={"Connection": "close"}
+        )
+        await response(scope, receive, send)
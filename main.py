@@ -1,12 +1,24 @@
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+import os
 import time
 import logging
+from core.lazy import timed_import, preload_in_background, get_startup_report
+from core.executor import conversion_executor, extraction_executor
+from core.cache import result_cache
+from core.rate_limiter import rate_limiter
+from core.jobs import job_store
+from core.scratch import scratch_space
+from core.upload_guard import UploadGuardMiddleware
+from core.compression import CompressionMiddleware
+from core import logs, metrics, profiling, scheduler
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+# Configurar logging (escrita em JSON por uma thread, fora do event loop)
+logs.log_pipeline.start()
 logger = logging.getLogger(__name__)
+access_logger = logging.getLogger("pdffacil.access")
 
 # Criar aplicação FastAPI
 app = FastAPI(
@@ -15,6 +27,23 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Recusar uploads grandes demais ou sem cota antes de ler o corpo. O último
+# middleware adicionado é o mais externo: a guarda entra primeiro para rodar
+# dentro do TrustedHost e do CORS (as recusas 413/429 levam os headers CORS)
+app.add_middleware(
+    UploadGuardMiddleware,
+    routes={
+        "/pdf-to-text/": "pdf_to_text",
+        "/pdf-to-docx/": "pdf_to_docx",
+        "/pdf-to-excel/": "pdf_to_excel",
+        "/jobs/pdf-to-docx": "pdf_to_docx",
+        "/jobs/pdf-to-excel": "pdf_to_excel",
+        "/batch/pdf-to-text/": "pdf_to_text",
+        "/batch/pdf-to-docx/": "pdf_to_docx"
+    },
+    batch_routes=["/batch/pdf-to-text/", "/batch/pdf-to-docx/"]
+)
+
 # Middleware de segurança - hosts confiáveis
 app.add_middleware(
     TrustedHostMiddleware, 
@@ -30,21 +59,78 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Comprimir respostas JSON/NDJSON (gzip, brotli ou zstd) conforme são enviadas
+app.add_middleware(CompressionMiddleware)
+
 # Middleware para logging de requests
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     start_time = time.time()
     
-    # Log request
-    client_ip = request.headers.get("x-forwarded-for", "unknown")
-    logger.info(f"Request: {request.method} {request.url} from {client_ip}")
+    # Etapas medidas pelos processors durante este request
+    timings = metrics.begin_request()
     
-    response = await call_next(request)
+    # Id do request em todas as linhas de log dele (e no header da resposta)
+    request_id = logs.begin_request(request.headers.get(logs.REQUEST_ID_HEADER))
     
-    # Log response
-    process_time = time.time() - start_time
-    logger.info(f"Response: {response.status_code} in {process_time:.2f}s")
+    # Jobs deste request entram na fila justa do cliente (ver core/scheduler.py)
+    client_ip = rate_limiter.get_client_ip(request)
+    scheduler.set_client(client_ip)
     
+    # Profiling pedido com token assinado (ver core/profiling.py); todo
+    # request é contado para o perfil saber se dividiu o event loop
+    profiling.request_started()
+    profile = profiling.begin(request)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        profiling.request_finished()
+        if profile is not None:
+            profiling.abort(profile)
+        raise
+    if profile is not None:
+        response.headers["X-Profile-Id"] = profile.id
+    response.headers["X-Request-ID"] = request_id
+    
+    # Medir também o envio do corpo e registrar tudo quando ele terminar
+    route = metrics.route_label(request.scope)
+    body_iterator = response.body_iterator
+    
+    async def measured_body():
+        sent = 0
+        stream_start = time.perf_counter()
+        try:
+            async for chunk in body_iterator:
+                sent += len(chunk)
+                yield chunk
+        finally:
+            timings.add("response", time.perf_counter() - stream_start)
+            profiling.request_finished()
+            if profile is not None:
+                profiling.finish(profile, response.status_code, timings.stages)
+            
+            # Uma linha por request, com as etapas (erros do servidor sempre saem)
+            duration = time.time() - start_time
+            access_logger.log(
+                logging.WARNING if response.status_code >= 500 else logging.INFO,
+                "%s %s %s %.3fs", request.method, request.url.path, response.status_code, duration,
+                extra={
+                    "method": request.method,
+                    "path": request.url.path,
+                    "route": route,
+                    "status": response.status_code,
+                    "duration_ms": round(duration * 1000, 3),
+                    "bytes": sent,
+                    "client": client_ip,
+                    "stages_ms": timings.totals_ms()
+                }
+            )
+            timings.flush(route)
+            metrics.http_requests.inc(route=route, method=request.method, status=response.status_code)
+            metrics.http_duration.observe(duration, route=route, method=request.method)
+            metrics.http_response_bytes.inc(sent, route=route)
+    
+    response.body_iterator = measured_body()
     return response
 
 @app.get("/")
@@ -57,7 +143,8 @@ async def root():
         "limits": {
             "max_file_size_mb": 10,
             "pdf_to_text": "40 PDFs por dia",
-            "pdf_to_docx": "12 PDFs por dia"
+            "pdf_to_docx": "12 PDFs por dia",
+            "pdf_to_excel": "12 PDFs por dia"
         }
     }
 
@@ -66,23 +153,94 @@ async def health_check():
     """Endpoint de health check."""
     return {"status": "healthy", "timestamp": time.time()}
 
-# Importar módulos funcionais
-from modules.pdf_to_text.routes import router as pdf_to_text_router
-from modules.pdf_to_docx.routes import router as pdf_to_docx_router
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Métricas no formato de exposição de texto do Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/startup-report/")
+async def startup_report():
+    """Tempo gasto em cada import desde o boot (inclusive os carregados sob demanda)."""
+    return get_startup_report()
+
+@app.get("/admin/profiles/")
+async def list_profiles(request: Request):
+    """Perfis gravados, do mais recente ao mais antigo (exige token assinado)."""
+    if not profiling.verify(profiling.request_token(request), "GET", request.url.path):
+        raise HTTPException(status_code=403, detail="Token de profiling inválido")
+    return {"profiles": profiling.store.list()}
+
+@app.get("/admin/profiles/{profile_id}")
+async def get_profile(request: Request, profile_id: str, format: str = "json"):
+    """
+    Resumo JSON de um perfil, ou o arquivo pstats com format=prof
+    (abre com python -m pstats ou snakeviz). Exige token assinado.
+    """
+    if not profiling.verify(profiling.request_token(request), "GET", request.url.path):
+        raise HTTPException(status_code=403, detail="Token de profiling inválido")
+    if format not in ("json", "prof"):
+        raise HTTPException(status_code=400, detail="Formato inválido (use json ou prof)")
+    
+    path = profiling.store.path(profile_id, f".{format}")
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    if format == "prof":
+        return FileResponse(path, filename=f"{profile_id}.prof", media_type="application/octet-stream")
+    return FileResponse(path, media_type="application/json")
+
+@app.get("/cache-status/")
+async def cache_status():
+    """Contadores de acertos, falhas e descartes do cache de resultados."""
+    return result_cache.get_stats()
+
+@app.get("/scratch-status/")
+async def scratch_status():
+    """Uso do espaço temporário das conversões."""
+    return scratch_space.get_stats()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    """Inicia as limpezas periódicas, os workers de jobs e o pré-carregamento."""
+    rate_limiter.start_sweeper()
+    scratch_space.start_janitor()
+    job_store.start()
+    
+    # Carregar os processors pesados depois que a API já responde
+    if os.environ.get("PDFFACIL_PRELOAD", "1") == "1":
+        preload_in_background()
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    """Encerra os pools de processos e as tarefas em segundo plano."""
+    rate_limiter.stop_sweeper()
+    scratch_space.stop_janitor()
+    job_store.stop()
+    conversion_executor.shutdown()
+    extraction_executor.shutdown()
+
+# Importar módulos funcionais (os processors pesados são carregados sob demanda)
+pdf_to_text_router = timed_import("modules.pdf_to_text.routes").router
+pdf_to_docx_router = timed_import("modules.pdf_to_docx.routes").router
+pdf_to_excel_router = timed_import("modules.pdf_to_excel.routes").router
+jobs_router = timed_import("modules.jobs.routes").router
+batch_router = timed_import("modules.batch.routes").router
 
 # Incluir rotas
 app.include_router(pdf_to_text_router)
 app.include_router(pdf_to_docx_router)
+app.include_router(pdf_to_excel_router)
+app.include_router(jobs_router)
+app.include_router(batch_router)
 
 # Handler para rate limiting
 @app.exception_handler(429)
 async def rate_limit_handler(request: Request, exc: HTTPException):
     """Handler customizado para rate limiting."""
     client_ip = request.headers.get("x-forwarded-for", "unknown")
-    logger.warning(f"Rate limit triggered for {client_ip}: {exc.detail}")
+    logger.warning("Rate limit triggered for %s: %s", client_ip, exc.detail)
     
-    return {"error": "Rate limit exceeded", "detail": exc.detail}
+    return JSONResponse(
+        status_code=429,
+        content={"error": "Rate limit exceeded", "detail": exc.detail}
+    )
 
-# TEMPORARIAMENTE DESABILITADO (depende de PyPDF2):
-# from modules.pdf_to_excel.routes import router as pdf_to_excel_router
-# app.include_router(pdf_to_excel_router)
@@ -0,0 +1,335 @@
+import asyncio
+import json
+import logging
+import os
+import zipfile
+from fastapi import APIRouter, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse
+from core.rate_limiter import rate_limiter
+from core.cache import result_cache
+from core.common import get_env_int, link_file, receive_pdf_uploads, parse_page_ranges, format_page_ranges
+from core.executor import conversion_executor, extraction_executor
+from core.pdf_info import quota_cost
+from core.triage import triage_pdf
+from core.lazy import lazy_import
+from core.responses import ndjson_line
+from modules.pdf_to_text.routes import parse_include, select_text_parts
+from modules.pdf_to_docx.routes import parse_parallel_mode
+
+# Processors carregados no primeiro uso (dependências pesadas)
+text_processor = lazy_import("modules.pdf_to_text.processor")
+docx_processor = lazy_import("modules.pdf_to_docx.processor")
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Arquivos de um lote convertidos ao mesmo tempo (padrão: workers do pool)
+TEXT_CONCURRENCY = get_env_int("PDFFACIL_BATCH_TEXT_CONCURRENCY", extraction_executor.max_workers)
+DOCX_CONCURRENCY = get_env_int("PDFFACIL_BATCH_DOCX_CONCURRENCY", conversion_executor.max_workers)
+
+BATCH_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["files"],
+                    "properties": {
+                        "files": {
+                            "type": "array",
+                            "items": {"type": "string", "format": "binary"},
+                            "description": "PDFs ou arquivos .zip com PDFs"
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+
+# Criar router para este módulo
+router = APIRouter()
+
+async def receive_batch(request: Request, function_name: str, page_ranges, cache_lookup):
+    """
+    Recebe os PDFs do lote e cobra a cota de todos de uma vez.
+
+    A cobrança é atômica: ou o lote inteiro cabe na cota, ou nada é
+    registrado e o request recebe 429.
+
+    Args:
+        request: Request com os PDFs no campo "files"
+        function_name: Nome da função no rate limiter
+        page_ranges: Seleção de páginas aplicada a todos os arquivos
+        cache_lookup: Função (arquivo) -> resultado em cache ou None
+
+    Returns:
+        tuple: (arquivos recebidos, resultados em cache de cada um)
+    """
+    files = await receive_pdf_uploads(
+        request,
+        rate_limiter.max_file_size_bytes,
+        spool=True,
+        field_name="files",
+        max_files=rate_limiter.max_batch_files,
+        max_total_bytes=rate_limiter.max_batch_size_bytes,
+        accept_zip=True
+    )
+
+    try:
+        cached = [cache_lookup(file) for file in files]
+
+        # Somar o custo dos arquivos que passam pelo rate limiter
+        charged = [
+            file for file, hit in zip(files, cached)
+            if result_cache.should_check_rate_limit(hit is not None)
+        ]
+        # Triagem antes de cobrar a cota: um arquivo patológico recusa o lote (e custa 1)
+        async def triage_file(file):
+            try:
+                await triage_pdf(file, function_name, page_ranges, request)
+            except HTTPException as e:
+                raise HTTPException(status_code=e.status_code, detail=f"{file.filename}: {e.detail}")
+
+        await asyncio.gather(*[triage_file(file) for file in charged])
+        costs = await asyncio.gather(*[quota_cost(file, page_ranges) for file in charged])
+
+        if charged:
+            largest = max(file.size for file in charged)
+            await rate_limiter.check_rate_limit(request, function_name, largest, cost=sum(costs))
+    except Exception:
+        for file in files:
+            file.cleanup()
+        raise
+
+    logger.info("Lote de %s arquivos aceito para %s", len(files), function_name)
+    return files, cached
+
+async def fan_out(files, concurrency: int, convert):
+    """
+    Converte os arquivos em paralelo (no máximo concurrency de cada vez) e
+    entrega os resultados conforme terminam.
+
+    Yields:
+        tuple: (índice, resultado ou None, mensagem de erro ou None)
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(index, file):
+        async with semaphore:
+            try:
+                return index, await convert(index, file), None
+            except HTTPException as e:
+                return index, None, e.detail
+            except Exception as e:
+                logger.error("Erro no arquivo %s do lote: %s", file.filename, e)
+                return index, None, str(e)
+
+    tasks = [asyncio.ensure_future(run(index, file)) for index, file in enumerate(files)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+@router.post("/batch/pdf-to-text/", openapi_extra=BATCH_UPLOAD_OPENAPI)
+async def batch_pdf_to_text_endpoint(
+    request: Request,
+    pages: str = Query(None, description="Páginas a extrair de cada PDF, ex.: 1-3,5,10-"),
+    include: str = Query("both", description="Texto devolvido: pages (por página), full (corrido) ou both")
+):
+    """
+    Extrai o texto de vários PDFs (ou de um ZIP com PDFs) em um só request.
+
+    A resposta é NDJSON: uma linha por arquivo, na ordem em que terminam
+    (o campo "index" indica a posição no envio), e uma linha final de
+    resumo. Cada arquivo conta como um request de pdf_to_text.
+
+    Args:
+        request: Request com os PDFs no campo "files" (multipart)
+        pages: Seleção de páginas (padrão: todas)
+        include: Partes do texto em cada linha (ver /pdf-to-text/)
+
+    Returns:
+        StreamingResponse: Linhas NDJSON com os resultados
+    """
+    page_ranges = parse_page_ranges(pages)
+    include = parse_include(include)
+    options = {"pages": format_page_ranges(page_ranges)}
+
+    def cache_key(file):
+        return result_cache.make_key_from_digest(file.sha256, "pdf_to_text", options)
+
+    files, cached = await receive_batch(
+        request, "pdf_to_text", page_ranges,
+        lambda file: result_cache.get_json(cache_key(file))
+    )
+
+    async def convert(index, file):
+        if cached[index] is not None:
+            return cached[index]
+        result = await text_processor.convert_pdf_to_text(file, page_ranges)
+        result_cache.put_json(cache_key(file), result)
+        return result
+
+    async def ndjson_lines():
+        succeeded = 0
+        try:
+            async for index, result, error in fan_out(files, TEXT_CONCURRENCY, convert):
+                file = files[index]
+                file.cleanup()
+                if error is None:
+                    succeeded += 1
+                    record = select_text_parts(
+                        {"type": "file", "index": index, **result, "filename": file.filename}, include
+                    )
+                else:
+                    record = {"type": "file", "index": index, "filename": file.filename,
+                              "success": False, "detail": f"Erro na extração: {error}"}
+                yield ndjson_line(record)
+
+            yield ndjson_line({
+                "type": "summary",
+                "files": len(files),
+                "succeeded": succeeded,
+                "failed": len(files) - succeeded,
+                "rate_limit": (await rate_limiter.get_status(request))["pdf_to_text"]
+            })
+        finally:
+            for file in files:
+                file.cleanup()
+
+    return StreamingResponse(ndjson_lines(), media_type=NDJSON_MEDIA_TYPE)
+
+class ZipStream:
+    """
+    Destino de escrita para zipfile que acumula os bytes até serem enviados.
+
+    Sem seek(), o zipfile grava cada entrada com data descriptor, então o
+    ZIP pode ser transmitido enquanto os arquivos ainda estão sendo gerados.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def unique_name(filename: str, extension: str, used: set) -> str:
+    """Nome do arquivo de saída dentro do ZIP, sem repetir nomes."""
+    stem = os.path.splitext(filename)[0] or "documento"
+    name = f"{stem}{extension}"
+    counter = 2
+    while name in used:
+        name = f"{stem} ({counter}){extension}"
+        counter += 1
+    used.add(name)
+    return name
+
+@router.post("/batch/pdf-to-docx/", openapi_extra=BATCH_UPLOAD_OPENAPI)
+async def batch_pdf_to_docx_endpoint(
+    request: Request,
+    pages: str = Query(None, description="Páginas a converter de cada PDF, ex.: 1-3,5,10-"),
+    parallel: str = Query("auto", description="Conversão paralela de cada PDF: auto, on ou off")
+):
+    """
+    Converte vários PDFs (ou um ZIP com PDFs) para DOCX em um só request.
+
+    A resposta é um ZIP transmitido conforme as conversões terminam, com
+    um DOCX por arquivo convertido e um resultado.json com o estado de
+    cada arquivo. Cada arquivo conta como um request de pdf_to_docx.
+
+    Args:
+        request: Request com os PDFs no campo "files" (multipart)
+        pages: Seleção de páginas (padrão: todas)
+        parallel: Modo de conversão de cada PDF (ver /pdf-to-docx/)
+
+    Returns:
+        StreamingResponse: ZIP com os DOCX gerados
+    """
+    page_ranges = parse_page_ranges(pages)
+    parallel = parse_parallel_mode(parallel)
+    options = {"pages": format_page_ranges(page_ranges)}
+
+    def cache_key(file):
+        return result_cache.make_key_from_digest(file.sha256, "pdf_to_docx", options)
+
+    def cache_lookup(file):
+        # Ligar o DOCX em cache ao diretório do arquivo já na consulta: o cache
+        # pode remover a entrada antes de ela entrar no ZIP
+        cached_path = result_cache.get_file(cache_key(file))
+        if cached_path is None:
+            return None
+        docx_path = os.path.join(file.temp_dir, "cached.docx")
+        try:
+            link_file(cached_path, docx_path)
+        except FileNotFoundError:
+            return None
+        return docx_path
+
+    files, cached = await receive_batch(request, "pdf_to_docx", page_ranges, cache_lookup)
+
+    async def convert(index, file):
+        if cached[index] is not None:
+            return cached[index]
+        response = await docx_processor.convert_pdf_to_docx(file, page_ranges, parallel)
+        result_cache.put_file(cache_key(file), response.path, '.docx')
+        return response.path
+
+    async def zip_chunks():
+        stream = ZipStream()
+        archive = zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_STORED)
+        used_names = set()
+        manifest = [None] * len(files)
+        try:
+            async for index, docx_path, error in fan_out(files, DOCX_CONCURRENCY, convert):
+                file = files[index]
+                entry = {"index": index, "filename": file.filename, "success": error is None}
+                if error is None:
+                    # DOCX já é comprimido: guardar sem recomprimir
+                    output = unique_name(file.filename, ".docx", used_names)
+                    try:
+                        await asyncio.to_thread(archive.write, docx_path, output)
+                        entry["output"] = output
+                    except OSError as e:
+                        # O arquivo não é aberto antes de a entrada começar: o ZIP segue válido
+                        logger.error("Erro ao incluir %s no lote: %s", file.filename, e)
+                        used_names.discard(output)
+                        entry["success"] = False
+                        error = str(e)
+                if error is not None:
+                    entry["detail"] = f"Erro na conversão: {error}"
+                manifest[index] = entry
+                file.cleanup()
+                yield stream.drain()
+
+            archive.writestr("resultado.json", json.dumps({
+                "files": manifest,
+                "rate_limit": (await rate_limiter.get_status(request))["pdf_to_docx"]
+            }, ensure_ascii=False, indent=2))
+            archive.close()
+            yield stream.drain()
+        finally:
+            for file in files:
+                file.cleanup()
+
+    return StreamingResponse(
+        zip_chunks(),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": 'attachment; filename="pdffacil-lote.zip"',
+            "X-Batch-Files": str(len(files))
+        }
+    )
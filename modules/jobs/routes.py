@@ -0,0 +1,127 @@
+import os
+import shutil
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse
+from core.rate_limiter import rate_limiter
+from core.jobs import job_store, Job
+from core.common import PDF_UPLOAD_OPENAPI, clean_up_temp_directory, receive_pdf_upload
+from core.triage import triage_pdf
+from core.pdf_info import quota_cost
+from core.lazy import lazy_import
+
+# Processors carregados no primeiro uso (dependências pesadas)
+docx_processor = lazy_import("modules.pdf_to_docx.processor")
+excel_processor = lazy_import("modules.pdf_to_excel.processor")
+
+# Criar router para este módulo
+router = APIRouter()
+
+# Tipo de job -> nome da função no rate limiter
+JOB_KINDS = {
+    "pdf-to-docx": "pdf_to_docx",
+    "pdf-to-excel": "pdf_to_excel"
+}
+
+async def run_processor(job: Job, processor, extension: str):
+    """
+    Executa um processor existente sobre o PDF gravado do job.
+    
+    O processor devolve um FileResponse; se ele gerou o arquivo fora do
+    diretório do job, o arquivo é movido para lá e o diretório temporário
+    do processor é removido.
+    """
+    response = await processor(job.upload)
+    
+    result_path = response.path
+    if os.path.dirname(result_path) != job.work_dir:
+        result_path = os.path.join(job.work_dir, f"output{extension}")
+        shutil.move(response.path, result_path)
+        clean_up_temp_directory(os.path.dirname(response.path))
+    
+    result_filename = job.filename.replace('.pdf', extension)
+    return result_path, result_filename, response.media_type
+
+async def run_docx_job(job: Job):
+    return await run_processor(job, docx_processor.convert_pdf_to_docx, '.docx')
+
+async def run_excel_job(job: Job):
+    return await run_processor(job, excel_processor.convert_pdf_to_excel, '.xlsx')
+
+job_store.register("pdf-to-docx", run_docx_job)
+job_store.register("pdf-to-excel", run_excel_job)
+
+@router.post("/jobs/{kind}", status_code=202, openapi_extra=PDF_UPLOAD_OPENAPI)
+async def submit_job(kind: str, request: Request):
+    """
+    Aceita um PDF para conversão em segundo plano e retorna o id do job.
+    
+    Args:
+        kind: Tipo de conversão ("pdf-to-docx" ou "pdf-to-excel")
+        request: Request com o PDF no campo "file" (multipart)
+        
+    Returns:
+        dict: Id do job e URLs de status e resultado
+    """
+    if kind not in JOB_KINDS:
+        raise HTTPException(status_code=404, detail=f"Tipo de job desconhecido: {kind}")
+    
+    # Receber o PDF direto em disco (tipo e tamanho verificados durante o upload)
+    file = await receive_pdf_upload(request, rate_limiter.max_file_size_bytes, spool=True)
+    
+    try:
+        # Triagem antes de cobrar a cota: recusa arquivos patológicos (cada recusa custa 1) e escolhe a fila
+        triage = await triage_pdf(file, JOB_KINDS[kind], request=request)
+        
+        # A cota é cobrada no envio, como nos endpoints síncronos (pelas páginas,
+        # se ligado), com um lugar na fila já reservado: fila cheia recusa antes de cobrar
+        with job_store.reservation():
+            cost = await quota_cost(file)
+            await rate_limiter.check_rate_limit(request, JOB_KINDS[kind], file.size, cost=cost)
+            job = job_store.create(kind, file, triage["pages"], reserved=True)
+    except Exception:
+        file.cleanup()
+        raise
+    
+    return {
+        **job.to_dict(job_store.queue_position(job)),
+        "triage": triage,
+        "status_url": f"/jobs/{job.id}",
+        "result_url": f"/jobs/{job.id}/result"
+    }
+
+@router.get("/jobs/stats/")
+async def get_jobs_stats():
+    """Quantidade de jobs por estado e capacidade da fila."""
+    return job_store.get_stats()
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """
+    Estado do job: queued, running, done ou failed, com progresso em páginas.
+    
+    O progresso avança a cada página no Excel e a cada parte na conversão
+    DOCX paralela; a conversão DOCX serial só o completa no fim.
+    """
+    job = job_store.get(job_id)
+    return job.to_dict(job_store.queue_position(job))
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Baixa o arquivo gerado por um job concluído."""
+    job = job_store.get(job_id)
+    
+    if job.status == Job.FAILED:
+        raise HTTPException(status_code=422, detail=f"Job falhou: {job.error}")
+    
+    if job.status != Job.DONE:
+        return JSONResponse(
+            status_code=409,
+            content=job.to_dict(job_store.queue_position(job)),
+            headers={"Retry-After": "5"}
+        )
+    
+    return FileResponse(
+        path=job.result_path,
+        filename=job.result_filename,
+        media_type=job.media_type
+    )
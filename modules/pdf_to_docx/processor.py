@@ -1,76 +1,247 @@
+import asyncio
+import io
+import json
 import os
 import logging
+from fastapi import HTTPException
+from starlette.background import BackgroundTask
 from pdf2docx import Converter
-from core.common import create_temp_directory, clean_up_temp_directory, create_file_response
+from core.common import clean_up_temp_directory, create_file_response, get_env_int, select_pages
+from core.executor import conversion_executor
+from core.jobs import report_pages
+from core.pdf_info import get_page_count
+from core.metrics import registry, stage, timed_stage, record_throughput
+from core.scratch import ScratchQuotaExceeded, scratch_space
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def convert_pdf_to_docx(file):
+# Documentos a partir deste número de páginas são convertidos em paralelo
+# (páginas divididas entre os workers do pool) quando o modo é "auto"
+PARALLEL_MIN_PAGES = get_env_int("PDFFACIL_DOCX_PARALLEL_PAGES", 30)
+
+# Máximo de partes de uma conversão paralela (padrão: todos os núcleos)
+PARALLEL_MAX_WORKERS = get_env_int("PDFFACIL_DOCX_PARALLEL_WORKERS", os.cpu_count() or 1)
+
+docx_conversions_total = registry.counter(
+    "pdffacil_docx_conversions_total", "Conversões DOCX por modo (serial ou paralelo)", ["mode"]
+)
+
+
+class ParallelPlanner:
+    """
+    Decide em quantas partes uma conversão DOCX é dividida.
+
+    Cada parte é um job do pool de conversão, com a vaga dada pela fila
+    justa como qualquer outro; dividir só compensa com vagas livres, então
+    o número sai das vagas do pool sem jobs pendentes.
+    """
+
+    def free_slots(self) -> int:
+        return conversion_executor.max_workers - conversion_executor.pending
+
+    def plan(self, mode: str, selected: list) -> int:
+        """
+        Args:
+            mode: "auto", "on" (paralelo mesmo abaixo do limite) ou "off"
+            selected: Índices das páginas a converter
+
+        Returns:
+            int: Partes (1 = conversão serial)
+        """
+        if mode == "off" or len(selected) < 2:
+            return 1
+        if mode == "auto" and len(selected) < PARALLEL_MIN_PAGES:
+            return 1
+        workers = min(PARALLEL_MAX_WORKERS, self.free_slots(), len(selected))
+        return workers if workers >= 2 else 1
+
+
+parallel_planner = ParallelPlanner()
+
+
+def split_pages(selected: list, parts: int) -> list:
+    """Divide as páginas em partes seguidas de tamanhos quase iguais."""
+    size, extra = divmod(len(selected), parts)
+    chunks = []
+    start = 0
+    for index in range(parts):
+        end = start + size + (1 if index < extra else 0)
+        chunks.append(selected[start:end])
+        start = end
+    return chunks
+
+
+def run_converter(pdf_path, docx_path, pages=None):
+    """
+    Executa o pdf2docx de forma síncrona.
+    
+    Roda dentro de um processo do pool de conversão, nunca no event loop.
+    
+    Args:
+        pdf_path: PDF de entrada
+        docx_path: DOCX de saída
+        pages: Índices das páginas a converter (a partir de 0), ou None para todas
+    """
+    # Gerar em memória e só gravar se couber na cota do job
+    output = io.BytesIO()
+    cv = Converter(pdf_path)
+    try:
+        if pages is None:
+            cv.convert(output, start=0, end=None)
+        else:
+            cv.convert(output, pages=pages)
+    finally:
+        cv.close()
+    scratch_space.write_file(docx_path, output.getvalue())
+
+
+def parse_pages_chunk(pdf_path, pages, json_path):
+    """
+    Interpreta uma parte das páginas e grava o resultado em JSON (roda no pool).
+
+    É a etapa por processo do multi_processing do pdf2docx, mas como job do
+    pool de conversão: sem multiprocessing.Pool interno, dentro do timeout e
+    da fila justa como qualquer job.
+    """
+    cv = Converter(pdf_path)
+    try:
+        settings = cv.default_settings
+        cv.load_pages(pages=pages).parse_document(**settings).parse_pages(**settings)
+        data = json.dumps(cv.store()).encode("utf-8")
+    finally:
+        cv.close()
+    scratch_space.write_file(json_path, data)
+
+
+def make_docx_from_chunks(pdf_path, json_paths, docx_path):
+    """Junta as partes interpretadas por parse_pages_chunk em um DOCX (roda no pool)."""
+    output = io.BytesIO()
+    cv = Converter(pdf_path)
+    try:
+        for json_path in json_paths:
+            cv.deserialize(json_path)
+            os.remove(json_path)
+        cv.make_docx(output, **cv.default_settings)
+    finally:
+        cv.close()
+    scratch_space.write_file(docx_path, output.getvalue())
+
+
+async def convert_in_parts(file, pdf_path, docx_path, selected, workers, pdf_size):
+    """Converte dividindo as páginas entre workers do pool e junta o DOCX no fim."""
+    temp_dir = os.path.dirname(docx_path)
+    chunks = split_pages(selected, workers)
+    json_paths = [os.path.join(temp_dir, f"pages-{index}.json") for index in range(len(chunks))]
+
+    async def parse_chunk(chunk, json_path):
+        await conversion_executor.run(
+            parse_pages_chunk, pdf_path, chunk, json_path,
+            kind="pdf_to_docx", pages=len(chunk), size=pdf_size, lane=file.lane
+        )
+        # Progresso do job (se houver um) a cada parte interpretada
+        report_pages(len(chunk))
+
+    # Aguardar todas as partes, mesmo se uma falhar, para nenhuma seguir
+    # gravando no diretório do job depois da limpeza
+    results = await asyncio.gather(*[
+        parse_chunk(chunk, json_path) for chunk, json_path in zip(chunks, json_paths)
+    ], return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+    await conversion_executor.run(
+        make_docx_from_chunks, pdf_path, json_paths, docx_path,
+        kind="pdf_to_docx", pages=len(selected), size=pdf_size, lane=file.lane
+    )
+
+@timed_stage("convert")
+async def convert_pdf_to_docx(file, page_ranges=None, parallel="auto"):
     """
     Converte um arquivo PDF para DOCX usando pdf2docx com debug detalhado.
     
+    Os headers X-Docx-Mode ("serial" ou "parallel") e X-Docx-Workers
+    informam como a conversão foi feita.
+    
     Args:
-        file: Arquivo PDF enviado pelo usuário
+        file: UploadedPDF (de preferência já gravado em disco pelo upload)
+        page_ranges: Seleção de páginas (core.common.parse_page_ranges) ou None
+        parallel: "auto" (paralelo a partir de PARALLEL_MIN_PAGES), "on" ou "off"
         
     Returns:
         FileResponse: Arquivo DOCX para download
     """
     temp_dir = None
     try:
-        # Criar diretório temporário
-        temp_dir = create_temp_directory()
-        logger.info(f"Diretório temporário criado: {temp_dir}")
+        # Usar o PDF já gravado em disco pelo upload (grava agora se veio em memória)
+        pdf_path = file.spool()
+        temp_dir = file.temp_dir
+        logger.debug("Diretório temporário: %s", temp_dir)
         
-        pdf_path = os.path.join(temp_dir, "input.pdf")
         docx_path = os.path.join(temp_dir, "output.docx")
         
-        # Salvar o PDF recebido
-        content = await file.read()
-        logger.info(f"PDF recebido: {len(content)} bytes")
-        
-        with open(pdf_path, "wb") as pdf_file:
-            pdf_file.write(content)
-        
         # Verificar se PDF foi salvo
         if not os.path.exists(pdf_path):
             raise Exception("Erro ao salvar PDF temporário")
         
         pdf_size = os.path.getsize(pdf_path)
-        logger.info(f"PDF salvo: {pdf_path} ({pdf_size} bytes)")
+        logger.debug("PDF salvo: %s (%d bytes)", pdf_path, pdf_size)
+        
+        # Resolver a seleção de páginas
+        with stage("page_count"):
+            num_pages = await get_page_count(file)
+        selected = select_pages(page_ranges, num_pages)
+        if not selected:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Nenhuma das páginas pedidas existe no documento ({num_pages} páginas)"
+            )
+        pages = None if len(selected) == num_pages else selected
+        
+        # Serial ou paralelo, conforme o pedido e os núcleos livres
+        workers = parallel_planner.plan(parallel, selected)
+        mode = "parallel" if workers > 1 else "serial"
+        docx_conversions_total.inc(mode=mode)
         
         # Tentar converter PDF para DOCX
-        logger.info("Iniciando conversão com pdf2docx...")
+        logger.info(
+            "Iniciando conversão com pdf2docx (%d/%d páginas, %s, %d processo(s))...",
+            len(selected), num_pages, mode, workers
+        )
         
         try:
-            cv = Converter(pdf_path)
-            logger.info("Converter inicializado")
-            
-            # Converter com configurações básicas primeiro
-            cv.convert(docx_path, start=0, end=None)
-            logger.info("Conversão executada")
-            
-            cv.close()
-            logger.info("Converter fechado")
+            # Converter no pool de processos, sem bloquear o event loop
+            with stage("pdf2docx"):
+                if workers > 1:
+                    await convert_in_parts(file, pdf_path, docx_path, selected, workers, pdf_size)
+                else:
+                    await conversion_executor.run(
+                        run_converter, pdf_path, docx_path, pages,
+                        kind="pdf_to_docx", pages=len(selected), size=pdf_size, lane=file.lane
+                    )
+            logger.debug("Conversão executada")
             
+        except HTTPException:
+            raise
+        except ScratchQuotaExceeded as quota_error:
+            raise scratch_space.quota_error(quota_error)
         except Exception as conv_error:
-            logger.error(f"Erro na conversão pdf2docx: {str(conv_error)}")
+            logger.error("Erro na conversão pdf2docx: %s", conv_error)
             raise Exception(f"Erro interno pdf2docx: {str(conv_error)}")
         
         # Verificar se o arquivo DOCX foi criado
         if not os.path.exists(docx_path):
-            logger.error(f"Arquivo DOCX não foi criado em: {docx_path}")
+            logger.error("Arquivo DOCX não foi criado em: %s", docx_path)
             
             # Listar arquivos no diretório temp para debug
             temp_files = os.listdir(temp_dir)
-            logger.error(f"Arquivos no temp_dir: {temp_files}")
+            logger.error("Arquivos no temp_dir: %s", temp_files)
             
             raise Exception("pdf2docx falhou em gerar arquivo DOCX")
         
         # Verificar tamanho do arquivo DOCX
         docx_size = os.path.getsize(docx_path)
-        logger.info(f"DOCX criado: {docx_path} ({docx_size} bytes)")
+        logger.info("DOCX criado: %s (%d bytes)", docx_path, docx_size)
         
         if docx_size == 0:
             raise Exception("Arquivo DOCX criado está vazio")
@@ -78,15 +249,26 @@ async def convert_pdf_to_docx(file):
         # Criar resposta com o arquivo
         media_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
         response = create_file_response(docx_path, file.filename, '.docx', media_type)
+        response.headers["X-Pages-Total"] = str(num_pages)
+        response.headers["X-Pages-Processed"] = str(len(selected))
+        response.headers["X-Docx-Mode"] = mode
+        response.headers["X-Docx-Workers"] = str(workers)
         
         # Configurar limpeza após envio
-        response.background = lambda: clean_up_temp_directory(temp_dir)
+        response.background = BackgroundTask(clean_up_temp_directory, temp_dir)
         
-        logger.info("Resposta criada com sucesso")
+        logger.debug("Resposta criada com sucesso")
+        record_throughput("pdf_to_docx", len(selected), pdf_size)
         return response
         
+    except HTTPException:
+        # Fila cheia ou timeout: repassar o status original
+        if temp_dir and os.path.exists(temp_dir):
+            clean_up_temp_directory(temp_dir)
+        raise
+        
     except Exception as e:
-        logger.error(f"Erro na conversão PDF para DOCX: {str(e)}")
+        logger.error("Erro na conversão PDF para DOCX: %s", e)
         
         # Limpar arquivos temporários em caso de erro
         if temp_dir and os.path.exists(temp_dir):
@@ -97,4 +279,4 @@ async def convert_pdf_to_docx(file):
     
     finally:
         # Log final
-        logger.info("Processamento finalizado")
+        logger.debug("Processamento finalizado")
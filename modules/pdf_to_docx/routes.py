@@ -1,48 +1,141 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, Request
-from .processor import convert_pdf_to_docx
+import os
+from fastapi import APIRouter, HTTPException, Request, Query
 from core.rate_limiter import rate_limiter
+from core.cache import result_cache
+from core.common import (
+    PDF_UPLOAD_OPENAPI, cached_file_response, clone_file_response, clean_up_temp_directory,
+    discard_file_response, receive_pdf_upload, parse_page_ranges, format_page_ranges
+)
+from core.pdf_info import quota_cost
+from core.singleflight import single_flight
+from core.triage import triage_pdf, triage_header
+from core.lazy import lazy_import
+
+# Processor carregado no primeiro uso: pdf2docx puxa OpenCV e NumPy
+processor = lazy_import("modules.pdf_to_docx.processor")
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Modos de conversão aceitos em parallel=
+PARALLEL_MODES = ("auto", "on", "off")
 
 # Criar router para este módulo
 router = APIRouter()
 
-@router.post("/pdf-to-docx/")
-async def pdf_to_docx_endpoint(request: Request, file: UploadFile = File(...)):
+def parse_parallel_mode(parallel: str) -> str:
+    """Valida o parâmetro parallel=."""
+    if parallel not in PARALLEL_MODES:
+        raise HTTPException(status_code=400, detail=f"parallel inválido: {parallel} (use auto, on ou off)")
+    return parallel
+
+@router.post("/pdf-to-docx/", openapi_extra=PDF_UPLOAD_OPENAPI)
+async def pdf_to_docx_endpoint(
+    request: Request,
+    pages: str = Query(None, description="Páginas a converter, ex.: 1-3,5,10-"),
+    parallel: str = Query("auto", description="Conversão paralela: auto, on ou off")
+):
     """
     Endpoint para converter PDF para DOCX - LIMITE: 12 PDFs por dia.
     
+    Os headers X-Pages-Total e X-Pages-Processed informam quantas páginas
+    foram convertidas; X-Docx-Mode e X-Docx-Workers, se a conversão foi
+    serial ou paralela e em quantas partes; X-PDF-Triage, o resultado
+    da triagem (core/triage.py).
+    
     Args:
-        request: Request para rate limiting
-        file: Arquivo PDF enviado pelo usuário
+        request: Request com o PDF no campo "file" (multipart)
+        pages: Seleção de páginas (padrão: todas)
+        parallel: "auto" paraleliza documentos grandes conforme as vagas
+            livres do pool; "on" paraleliza também os pequenos; "off" nunca
         
     Returns:
         FileResponse: Arquivo DOCX para download
     """
-    # Validar tipo de arquivo
-    if not file.filename.lower().endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Arquivo deve ser um PDF")
+    page_ranges = parse_page_ranges(pages)
+    parallel = parse_parallel_mode(parallel)
+    
+    # Receber o PDF direto em disco (tipo e tamanho verificados durante o upload)
+    file = await receive_pdf_upload(request, rate_limiter.max_file_size_bytes, spool=True)
+    
+    cached = None
+    try:
+        # Procurar DOCX já gerado para o mesmo PDF
+        cache_key = result_cache.make_key_from_digest(
+            file.sha256, "pdf_to_docx", {"pages": format_page_ranges(page_ranges)}
+        )
+        cached_path = result_cache.get_file(cache_key)
+        if cached_path is not None:
+            # Servir de uma cópia própria: o cache pode remover o arquivo durante o envio
+            cached = cached_file_response(
+                cached_path, file.filename, '.docx', DOCX_MEDIA_TYPE, result_cache.get_file_headers(cache_key)
+            )
+        
+        # Triagem antes de cobrar a cota: recusa arquivos patológicos (cada recusa custa 1) e escolhe a fila
+        if cached is None:
+            await triage_pdf(file, "pdf_to_docx", page_ranges, request)
+        
+        # Verificar rate limiting para pdf_to_docx
+        if result_cache.should_check_rate_limit(cached is not None):
+            cost = await quota_cost(file, page_ranges)
+            await rate_limiter.check_rate_limit(request, "pdf_to_docx", file.size, cost=cost)
+    except BaseException:
+        # Inclui o cancelamento (cliente desconectou durante a triagem ou a cobrança)
+        file.cleanup()
+        if cached is not None:
+            clean_up_temp_directory(os.path.dirname(cached.path))
+        raise
+    
+    if cached is not None:
+        file.cleanup()
+        return cached
+    
+    # Quando este request lidera a conversão, o upload passa a ser dela: a
+    # conversão o remove se falhar, e o single flight se ninguém receber o DOCX
+    handed_over = False
     
-    # Ler conteúdo para verificar tamanho
-    content = await file.read()
-    file_size = len(content)
+    async def converted():
+        try:
+            response = await processor.convert_pdf_to_docx(file, page_ranges, parallel)
+        except BaseException:
+            file.cleanup()
+            raise
+        response.headers["X-PDF-Triage"] = triage_header(file.triage)
+        result_cache.put_file(cache_key, response.path, '.docx', response.headers)
+        return response
     
-    # Verificar rate limiting para pdf_to_docx
-    rate_limiter.check_rate_limit(request, "pdf_to_docx", file_size)
+    def convert():
+        nonlocal handed_over
+        handed_over = True
+        return converted()
     
-    # Resetar ponteiro do arquivo
-    from io import BytesIO
-    file.file = BytesIO(content)
+    def share(response):
+        # Outro request converteu o mesmo PDF: este upload não é mais necessário
+        file.cleanup()
+        return clone_file_response(response, file.filename, '.docx')
     
+    delivered = False
     try:
-        # Processar o PDF
-        return await convert_pdf_to_docx(file)
+        # Uploads idênticos simultâneos aguardam a mesma conversão
+        response = await single_flight.run(
+            cache_key, convert, share, label="pdf_to_docx", discard=discard_file_response
+        )
+        response.headers["X-PDF-Triage"] = triage_header(file.triage)
+        delivered = True
+        return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro na conversão: {str(e)}")
+    finally:
+        # Erro ou cancelamento (inclusive enquanto aguardava outro request)
+        if not delivered and not handed_over:
+            file.cleanup()
 
 @router.get("/pdf-to-docx/status/")
 async def get_docx_rate_limit_status(request: Request):
     """Endpoint para verificar status do rate limiting para PDF-to-DOCX."""
-    full_status = rate_limiter.get_status(request)
+    full_status = await rate_limiter.get_status(request)
     return {
         "ip": full_status["ip"],
         "pdf_to_docx": full_status["pdf_to_docx"]
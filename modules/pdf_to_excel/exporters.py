@@ -0,0 +1,211 @@
+import csv
+import os
+import zipfile
+
+# pandas, xlsxwriter e pyarrow são importados dentro dos exportadores, para
+# que as rotas possam usar as constantes abaixo sem carregar nada pesado
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Formato pedido -> (extensão, media type do arquivo único)
+OUTPUT_FORMATS = {
+    "xlsx": (".xlsx", XLSX_MEDIA_TYPE),
+    "csv": (".csv", "text/csv"),
+    "parquet": (".parquet", "application/vnd.apache.parquet")
+}
+
+ZIP_MEDIA_TYPE = "application/zip"
+
+# Extensão do resultado -> media type (CSV e Parquet com várias tabelas saem em ZIP)
+MEDIA_TYPES = {extension: media_type for extension, media_type in OUTPUT_FORMATS.values()}
+MEDIA_TYPES[".zip"] = ZIP_MEDIA_TYPE
+
+
+def parquet_available() -> bool:
+    """O formato parquet depende do pyarrow, que é opcional."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class TableExport:
+    """
+    Grava as tabelas conforme as páginas são lidas, sem guardar as linhas.
+
+    Uso: start_table() para cada tabela nova, write_rows() para cada página
+    dela e finish() no fim, com as linhas do resumo.
+
+    Args:
+        out_dir: Diretório onde os arquivos de saída são criados
+    """
+
+    def __init__(self, out_dir: str):
+        self.out_dir = out_dir
+
+    def start_table(self, name: str, columns: list, numeric: list):
+        raise NotImplementedError
+
+    def write_rows(self, table):
+        raise NotImplementedError
+
+    def finish(self, summary_rows: list) -> str:
+        """Fecha os arquivos e retorna o caminho do resultado."""
+        raise NotImplementedError
+
+    def close(self):
+        """Fecha os arquivos abertos sem terminar (em caso de erro)."""
+
+
+class XlsxExport(TableExport):
+    """
+    Uma aba por tabela e uma aba Resumo, com o modo constant_memory do
+    xlsxwriter: cada linha vai para o disco assim que a próxima começa.
+    """
+
+    def __init__(self, out_dir: str):
+        import xlsxwriter
+
+        super().__init__(out_dir)
+        self.path = os.path.join(out_dir, "output.xlsx")
+        # Os arquivos temporários das linhas ficam no diretório do job (e contam na cota)
+        self.workbook = xlsxwriter.Workbook(self.path, {"constant_memory": True, "tmpdir": out_dir})
+        self.number_format = self.workbook.add_format({"num_format": "#,##0.##"})
+        self.header_format = self.workbook.add_format({"bold": True})
+        self.worksheet = None
+        self.row = 0
+
+    def start_table(self, name, columns, numeric):
+        self.worksheet = self.workbook.add_worksheet(name)
+        for index, is_numeric in enumerate(numeric):
+            self.worksheet.set_column(index, index, 15 if is_numeric else 20,
+                                      self.number_format if is_numeric else None)
+        self.worksheet.write_row(0, 0, [str(column) for column in columns], self.header_format)
+        self.row = 1
+
+    def write_rows(self, table):
+        # Células vazias viram None (o xlsxwriter não aceita NaN)
+        values = table.astype(object).where(table.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            self.worksheet.write_row(self.row, 0, row)
+            self.row += 1
+
+    def finish(self, summary_rows):
+        worksheet = self.workbook.add_worksheet("Resumo")
+        worksheet.set_column("A:A", 40)
+        worksheet.set_column("B:B", 20)
+        for index, row in enumerate(summary_rows):
+            worksheet.write_row(index, 0, row)
+        self.workbook.close()
+        return self.path
+
+    def close(self):
+        try:
+            self.workbook.close()
+        except Exception:
+            pass
+
+
+class FilePerTableExport(TableExport):
+    """
+    Um arquivo por tabela. Com uma tabela só o arquivo é o resultado;
+    com várias, elas vão para um ZIP junto com um resumo.csv.
+    """
+
+    extension = ""
+
+    def __init__(self, out_dir):
+        super().__init__(out_dir)
+        self.paths = []
+
+    def _next_path(self, name):
+        path = os.path.join(self.out_dir, f"{name.lower().replace(' ', '-')}{self.extension}")
+        self.paths.append(path)
+        return path
+
+    def finish(self, summary_rows):
+        self.close()
+        if len(self.paths) == 1:
+            return self.paths[0]
+
+        summary_path = os.path.join(self.out_dir, "resumo.csv")
+        with open(summary_path, "w", newline="", encoding="utf-8-sig") as summary_file:
+            csv.writer(summary_file, lineterminator="\n").writerows(summary_rows)
+
+        zip_path = os.path.join(self.out_dir, "output.zip")
+        with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for path in self.paths + [summary_path]:
+                archive.write(path, os.path.basename(path))
+                os.remove(path)
+        return zip_path
+
+
+class CsvExport(FilePerTableExport):
+    """CSV em UTF-8 com BOM (o Excel reconhece os acentos)."""
+
+    extension = ".csv"
+
+    def __init__(self, out_dir):
+        super().__init__(out_dir)
+        self.handle = None
+
+    def start_table(self, name, columns, numeric):
+        self.close()
+        self.handle = open(self._next_path(name), "w", newline="", encoding="utf-8-sig")
+        csv.writer(self.handle, lineterminator="\n").writerow(columns)
+
+    def write_rows(self, table):
+        table.to_csv(self.handle, header=False, index=False, float_format="%.15g")
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+
+class ParquetExport(FilePerTableExport):
+    """Parquet com um row group por página; o esquema sai da primeira página."""
+
+    extension = ".parquet"
+
+    def __init__(self, out_dir):
+        super().__init__(out_dir)
+        self.writer = None
+        self.schema = None
+
+    def start_table(self, name, columns, numeric):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.close()
+        self.schema = pa.schema([
+            (str(column), pa.float64() if is_numeric else pa.string())
+            for column, is_numeric in zip(columns, numeric)
+        ])
+        self.writer = pq.ParquetWriter(self._next_path(name), self.schema)
+
+    def write_rows(self, table):
+        import pandas as pd
+        import pyarrow as pa
+
+        table = table.copy()
+        table.columns = self.schema.names
+        for field in self.schema:
+            if pa.types.is_floating(field.type):
+                table[field.name] = pd.to_numeric(table[field.name], errors="coerce").astype("float64")
+            else:
+                table[field.name] = table[field.name].astype("string")
+        self.writer.write_table(pa.Table.from_pandas(table, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+EXPORTERS = {
+    "xlsx": XlsxExport,
+    "csv": CsvExport,
+    "parquet": ParquetExport
+}
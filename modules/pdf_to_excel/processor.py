@@ -1,119 +1,389 @@
 import os
-import re
+import logging
 from datetime import datetime
-from PyPDF2 import PdfReader
+import numpy as np
 import pandas as pd
-from core.common import create_temp_directory, clean_up_temp_directory, create_file_response
+import pymupdf
+from fastapi import HTTPException
+from starlette.background import BackgroundTask
+from core.common import clean_up_temp_directory, create_file_response, get_env_float, get_env_int, select_pages
+from core.executor import conversion_executor
+from core.jobs import progress_path, write_progress
+from core.metrics import stage, timed_stage, record_throughput
+from core.scratch import ScratchQuotaExceeded, scratch_space
+from .exporters import EXPORTERS, OUTPUT_FORMATS, MEDIA_TYPES, parquet_available
 
-async def convert_pdf_to_excel(file):
+logger = logging.getLogger(__name__)
+
+# Tolerâncias relativas à altura mediana das palavras da página
+ROW_TOLERANCE = get_env_float("PDFFACIL_EXCEL_ROW_TOLERANCE", 0.5)
+CELL_GAP = get_env_float("PDFFACIL_EXCEL_CELL_GAP", 0.6)
+
+# Linhas com menos células que isso não fazem parte de tabelas
+MIN_CELLS_PER_ROW = get_env_int("PDFFACIL_EXCEL_MIN_CELLS", 2)
+
+# Fração de valores numéricos para uma coluna virar número
+NUMERIC_RATIO = 0.8
+
+
+class EmptySelection(Exception):
+    """Nenhuma das páginas pedidas existe no documento."""
+
+
+class NoTablesFound(Exception):
+    """O PDF (ou a seleção) não tem nenhuma tabela reconhecível."""
+
+
+def words_to_cells(words):
+    """
+    Agrupa as palavras de uma página em células.
+
+    Linhas: centros verticais ordenados, nova linha quando o salto passa de
+    ROW_TOLERANCE alturas. Células: dentro da linha, nova célula quando o
+    espaço entre palavras passa de CELL_GAP alturas.
+
+    Args:
+        words: Saída de page.get_text("words")
+
+    Returns:
+        tuple: (linha, x0, x1, texto) de cada célula como arrays, e a altura mediana
+    """
+    coords = np.array([word[:4] for word in words], dtype=float)
+    texts = [word[4] for word in words]
+
+    height = float(np.median(coords[:, 3] - coords[:, 1])) or 1.0
+    y_center = (coords[:, 1] + coords[:, 3]) / 2
+
+    # Linhas: cluster 1D dos centros verticais
+    order = np.argsort(y_center, kind="stable")
+    row_breaks = np.diff(y_center[order], prepend=y_center[order][0]) > height * ROW_TOLERANCE
+    rows = np.empty(len(words), dtype=int)
+    rows[order] = np.cumsum(row_breaks)
+
+    # Células: palavras próximas na mesma linha, da esquerda para a direita
+    order = np.lexsort((coords[:, 0], rows))
+    x0 = coords[order, 0]
+    x1 = coords[order, 2]
+    row_sorted = rows[order]
+    same_row = np.concatenate(([False], row_sorted[1:] == row_sorted[:-1]))
+    previous_end = np.concatenate(([-np.inf], x1[:-1]))
+    starts = np.flatnonzero(~same_row | (x0 - previous_end > height * CELL_GAP))
+    ends = np.append(starts[1:], len(order))
+
+    sorted_texts = [texts[index] for index in order]
+    cell_texts = np.array([" ".join(sorted_texts[a:b]) for a, b in zip(starts, ends)], dtype=object)
+    return (
+        row_sorted[starts],
+        np.minimum.reduceat(x0, starts),
+        np.maximum.reduceat(x1, starts),
+        cell_texts
+    ), height
+
+
+def detect_columns(x0, x1, in_table, height):
+    """
+    Encontra as colunas como a união dos intervalos horizontais das células.
+
+    Só células de linhas de tabela entram na detecção, para que títulos
+    largos não juntem todas as colunas. Células que se sobrepõem na
+    horizontal (alinhadas à esquerda ou à direita) caem na mesma coluna.
+
+    Returns:
+        numpy.ndarray com o x inicial de cada coluna, ou vazio se não há tabela
+    """
+    if not in_table.any():
+        return np.array([])
+
+    order = np.argsort(x0[in_table], kind="stable")
+    starts = x0[in_table][order]
+    reach = np.maximum.accumulate(x1[in_table][order])
+    column_breaks = np.concatenate(([True], starts[1:] > reach[:-1] + height * 0.1))
+    return starts[column_breaks]
+
+
+def page_table(words):
+    """
+    Monta a grade de células de uma página a partir das coordenadas das palavras.
+
+    Returns:
+        numpy.ndarray de objetos (linhas x colunas, None nas células vazias),
+        ou None se a página não tem tabela
+    """
+    if not words:
+        return None
+
+    (rows, x0, x1, texts), height = words_to_cells(words)
+    cells_per_row = np.bincount(rows)[rows]
+    in_table = cells_per_row >= MIN_CELLS_PER_ROW
+
+    column_starts = detect_columns(x0, x1, in_table, height)
+    if len(column_starts) < MIN_CELLS_PER_ROW:
+        return None
+
+    # Atribuir cada célula à coluna cujo início fica à esquerda do seu centro
+    columns = np.clip(np.searchsorted(column_starts, (x0 + x1) / 2, side="right") - 1, 0, None)
+    rows, columns, texts = rows[in_table], columns[in_table], texts[in_table]
+    _, rows = np.unique(rows, return_inverse=True)
+
+    grid = np.full((rows.max() + 1, len(column_starts)), None, dtype=object)
+    grid[rows, columns] = texts
+
+    # Duas células na mesma posição (raro): juntar os textos
+    slots = rows * len(column_starts) + columns
+    unique_slots, counts = np.unique(slots, return_counts=True)
+    for slot in unique_slots[counts > 1]:
+        row, column = divmod(slot, len(column_starts))
+        grid[row, column] = " ".join(texts[slots == slot])
+    return grid
+
+
+def parse_numbers(grid):
+    """
+    Converte a grade inteira para números de uma vez, nos formatos 1.234,56 e 1,234.56.
+
+    Returns:
+        tuple: (valores no formato brasileiro, valores no formato inglês), NaN onde não é número
+    """
+    text = pd.Series(grid.ravel(), dtype="string").str.replace(r"[\s%R$€]", "", regex=True)
+    brazilian = pd.to_numeric(
+        text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False), errors="coerce"
+    )
+    english = pd.to_numeric(text.str.replace(",", "", regex=False), errors="coerce")
+    return (
+        brazilian.to_numpy(dtype=float, na_value=np.nan).reshape(grid.shape),
+        english.to_numpy(dtype=float, na_value=np.nan).reshape(grid.shape)
+    )
+
+
+def generic_columns(count):
+    """Nomes de coluna usados quando a tabela não tem cabeçalho."""
+    return [f"Coluna {index + 1}" for index in range(count)]
+
+
+def grid_to_frame(grid):
+    """
+    Transforma a grade de uma página em DataFrame, com cabeçalho e colunas numéricas.
+
+    A primeira linha vira cabeçalho quando é só texto e o resto tem números.
+    Uma coluna vira número quando pelo menos NUMERIC_RATIO das células
+    preenchidas são números; o resto continua como texto.
+    """
+    brazilian, english = parse_numbers(grid)
+    filled = np.not_equal(grid, None)
+
+    def numeric_columns(first_row):
+        rows = slice(first_row, None)
+        brazilian_count = np.isfinite(brazilian[rows]).sum(axis=0)
+        english_count = np.isfinite(english[rows]).sum(axis=0)
+        values = np.where(brazilian_count >= english_count, brazilian[rows], english[rows])
+        is_numeric = (np.maximum(brazilian_count, english_count) >= NUMERIC_RATIO * filled[rows].sum(axis=0)) \
+            & filled[rows].any(axis=0)
+        return values, is_numeric
+
+    values, is_numeric = numeric_columns(1)
+    header_is_text = not (np.isfinite(brazilian[0]) | np.isfinite(english[0])).any()
+    has_header = len(grid) > 1 and is_numeric.any() and header_is_text
+
+    if has_header:
+        names = []
+        for index, name in enumerate(grid[0]):
+            name = name.strip() if name and name.strip() else f"Coluna {index + 1}"
+            while name in names:
+                name = f"{name} ({index + 1})"
+            names.append(name)
+        body = grid[1:]
+    else:
+        values, is_numeric = numeric_columns(0)
+        names = generic_columns(grid.shape[1])
+        body = grid
+
+    frame = pd.DataFrame(body, columns=names)
+    for index in np.flatnonzero(is_numeric):
+        frame[names[index]] = pd.array(values[:, index], dtype="Float64")
+    return frame
+
+
+class TableProgress:
+    """Estado da tabela sendo gravada: colunas, páginas, linhas e totais parciais."""
+
+    def __init__(self, name, columns, numeric):
+        self.name = name
+        self.columns = columns
+        self.numeric = numeric
+        self.pages = []
+        self.rows = 0
+        self.totals = {column: 0.0 for column, is_numeric in zip(columns, numeric) if is_numeric}
+
+    def add(self, page_label, table):
+        self.pages.append(page_label)
+        self.rows += len(table)
+        for column in self.totals:
+            self.totals[column] += float(pd.to_numeric(table[column], errors="coerce").sum())
+
+    def continues_with(self, page_label, table) -> bool:
+        """
+        Indica se a tabela da página continua esta: página seguinte e mesmas
+        colunas, ou o mesmo número de colunas sem repetir o cabeçalho.
+        """
+        return (
+            self.pages[-1] == page_label - 1
+            and len(self.columns) == len(table.columns)
+            and list(table.columns) in (self.columns, generic_columns(len(table.columns)))
+        )
+
+    def summary_rows(self):
+        first, last = self.pages[0], self.pages[-1]
+        pages_label = f"{first}-{last}" if last != first else str(first)
+        rows = [[f"{self.name}: linhas (páginas {pages_label})", self.rows]]
+        rows.extend([f"{self.name}: total de {column}", total] for column, total in self.totals.items())
+        return rows
+
+
+def table_name(index):
+    """Nome da aba/arquivo: "Dados", "Dados 2", "Dados 3"..."""
+    return "Dados" if index == 0 else f"Dados {index + 1}"
+
+
+def run_extraction(pdf_path, out_dir, page_ranges=None, output_format="xlsx", progress_file=None):
     """
-    Converte um arquivo PDF para Excel, extraindo tabelas.
-    
+    Extrai as tabelas página a página e grava o resultado (dentro de um processo do pool).
+
+    Só a página atual fica em memória: as linhas vão direto para o arquivo
+    de saída e o resumo é somado conforme as páginas passam. A cota de
+    espaço temporário do job é conferida a cada página gravada.
+
     Args:
-        file: Arquivo PDF enviado pelo usuário
-        
+        pdf_path: PDF de entrada
+        out_dir: Diretório dos arquivos de saída
+        page_ranges: Seleção de páginas (core.common.parse_page_ranges) ou None
+        output_format: "xlsx", "csv" ou "parquet"
+        progress_file: Onde gravar as páginas concluídas (core.jobs), ou None
+
     Returns:
-        FileResponse: Arquivo Excel para download
+        dict: Caminho do resultado e resumo com páginas, tabelas e linhas
+
+    Raises:
+        EmptySelection, NoTablesFound, ScratchQuotaExceeded
     """
-    # Criar diretório temporário
-    temp_dir = create_temp_directory()
-    pdf_path = os.path.join(temp_dir, "input.pdf")
-    excel_path = os.path.join(temp_dir, "output.xlsx")
-    
+    doc = pymupdf.open(pdf_path, filetype="pdf")
+    export = EXPORTERS[output_format](out_dir)
     try:
-        # Salvar o PDF recebido
-        content = await file.read()
-        with open(pdf_path, "wb") as pdf_file:
-            pdf_file.write(content)
-        
-        # Ler o PDF
-        pdf = PdfReader(pdf_path)
-        
-        # Criar um escritor Excel
-        with pd.ExcelWriter(excel_path, engine='xlsxwriter') as writer:
-            # Lista para armazenar dados de todas as páginas
-            all_table_data = []
-            
-            for i, page in enumerate(pdf.pages):
-                page_text = page.extract_text() or ""
-                
-                # Melhorar detecção de tabelas
-                lines = page_text.split('\n')
-                structured_rows = []
-                
-                for line in lines:
-                    # Remover linhas de cabeçalho ou rodapé
-                    if any(header in line for header in ['U.S. Department', 'Table 1.', 'Footnotes:', 'Total Apportionment']):
-                        continue
-                    
-                    # Dividir linha usando regex para lidar com múltiplos espaços
-                    cols = [col.strip() for col in re.split(r'\s{2,}', line) if col.strip()]
-                    
-                    # Validar se a linha parece ser uma linha de dados
-                    if len(cols) >= 4:
-                        try:
-                            # Tentar converter dados numéricos
-                            population = int(cols[1].replace(',', ''))
-                            representatives = int(cols[2].replace(',', ''))
-                            change = int(cols[3].replace(',', '')) if len(cols) > 3 else 0
-                            
-                            structured_rows.append([
-                                cols[0],  # Estado
-                                population,
-                                representatives,
-                                change
-                            ])
-                        except (ValueError, IndexError):
-                            # Pular linhas que não podem ser convertidas
-                            continue
-                
-                # Adicionar dados da página à lista geral
-                all_table_data.extend(structured_rows)
-            
-            # Criar DataFrame principal
-            if all_table_data:
-                df = pd.DataFrame(all_table_data, 
-                                  columns=['Estado', 'População', 'Representantes', 'Mudança 2010'])
-                
-                # Salvar planilha principal
-                df.to_excel(writer, sheet_name='Dados', index=False)
-                
-                # Adicionar planilha de resumo
-                summary_data = [
-                    ['Total de Estados', len(df)],
-                    ['População Total', df['População'].sum()],
-                    ['Total de Representantes', df['Representantes'].sum()],
-                    ['Data de Processamento', datetime.now().strftime("%Y-%m-%d %H:%M:%S")]
-                ]
-                
-                df_summary = pd.DataFrame(summary_data)
-                df_summary.to_excel(writer, sheet_name='Resumo', index=False, header=False)
-                
-                # Ajustar largura das colunas
-                workbook = writer.book
-                worksheet_dados = writer.sheets['Dados']
-                worksheet_resumo = writer.sheets['Resumo']
-                
-                # Formatação para planilha de dados
-                formato_numero = workbook.add_format({'num_format': '#,##0'})
-                worksheet_dados.set_column('A:A', 20)  # Estado
-                worksheet_dados.set_column('B:B', 15, formato_numero)  # População
-                worksheet_dados.set_column('C:C', 15, formato_numero)  # Representantes
-                worksheet_dados.set_column('D:D', 15, formato_numero)  # Mudança
-                
-                # Formatação para planilha de resumo
-                worksheet_resumo.set_column('A:A', 25)
-                worksheet_resumo.set_column('B:B', 20)
-        
+        num_pages = len(doc)
+        pages = select_pages(page_ranges, num_pages)
+        if num_pages and not pages:
+            raise EmptySelection(f"Nenhuma das páginas pedidas existe no documento ({num_pages} páginas)")
+
+        tables = []
+        for done, page_num in enumerate(pages, start=1):
+            if progress_file is not None:
+                write_progress(progress_file, done - 1)
+            grid = page_table(doc[page_num].get_text("words"))
+            if grid is None:
+                continue
+            table = grid_to_frame(grid)
+            page_label = page_num + 1
+
+            if tables and tables[-1].continues_with(page_label, table):
+                table.columns = tables[-1].columns
+            else:
+                numeric = [table[column].dtype == "Float64" for column in table.columns]
+                tables.append(TableProgress(table_name(len(tables)), list(table.columns), numeric))
+                export.start_table(tables[-1].name, tables[-1].columns, numeric)
+
+            export.write_rows(table)
+            tables[-1].add(page_label, table)
+            scratch_space.enforce_quota(out_dir)
+
+        if not tables:
+            raise NoTablesFound("Nenhuma tabela encontrada no PDF")
+
+        total_rows = sum(progress.rows for progress in tables)
+        summary_rows = [["Tabelas encontradas", len(tables)]]
+        for progress in tables:
+            summary_rows.extend(progress.summary_rows())
+        summary_rows.append(["Total de linhas", total_rows])
+        summary_rows.append(["Data de Processamento", datetime.now().strftime("%Y-%m-%d %H:%M:%S")])
+
+        output_path = export.finish(summary_rows)
+        scratch_space.enforce_quota(out_dir)
+    except Exception:
+        export.close()
+        raise
+    finally:
+        doc.close()
+
+    return {
+        "path": output_path,
+        "pages": num_pages,
+        "pages_processed": len(pages),
+        "tables": len(tables),
+        "rows": total_rows
+    }
+
+
+@timed_stage("convert")
+async def convert_pdf_to_excel(file, page_ranges=None, output_format="xlsx"):
+    """
+    Converte um arquivo PDF para Excel, detectando as tabelas pela posição das palavras.
+
+    Args:
+        file: UploadedPDF (de preferência já gravado em disco pelo upload)
+        page_ranges: Seleção de páginas (core.common.parse_page_ranges) ou None
+        output_format: "xlsx" (padrão), "csv" ou "parquet"; CSV e Parquet com
+                       mais de uma tabela saem em um ZIP
+
+    Returns:
+        FileResponse: Arquivo para download
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato inválido: {output_format} (use xlsx, csv ou parquet)")
+    if output_format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="Formato parquet indisponível neste servidor")
+
+    temp_dir = None
+    try:
+        # Usar o PDF já gravado em disco pelo upload (grava agora se veio em memória)
+        pdf_path = file.spool()
+        temp_dir = file.temp_dir
+
+        # Extrair as tabelas e gravar a saída em um processo do pool
+        with stage("tables"):
+            try:
+                summary = await conversion_executor.run(
+                    run_extraction, pdf_path, temp_dir, page_ranges, output_format, progress_path(),
+                    kind="pdf_to_excel", size=file.size, lane=file.lane
+                )
+            except EmptySelection as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            except NoTablesFound as e:
+                raise HTTPException(status_code=422, detail=str(e))
+            except ScratchQuotaExceeded as e:
+                raise scratch_space.quota_error(e)
+
+        logger.info("Planilha (%s) criada: %s tabelas, %s linhas", output_format, summary['tables'], summary['rows'])
+        record_throughput("pdf_to_excel", summary["pages_processed"], file.size)
+
         # Criar resposta com o arquivo
-        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        response = create_file_response(excel_path, file.filename, '.xlsx', media_type)
-        
+        extension = os.path.splitext(summary["path"])[1]
+        response = create_file_response(summary["path"], file.filename, extension, MEDIA_TYPES[extension])
+        response.headers["X-Pages-Total"] = str(summary["pages"])
+        response.headers["X-Pages-Processed"] = str(summary["pages_processed"])
+        response.headers["X-Tables-Found"] = str(summary["tables"])
+        response.headers["X-Rows-Extracted"] = str(summary["rows"])
+
         # Configurar limpeza após envio
-        response.background = lambda: clean_up_temp_directory(temp_dir)
-        
+        response.background = BackgroundTask(clean_up_temp_directory, temp_dir)
+
         return response
+
+    except HTTPException:
+        if temp_dir:
+            clean_up_temp_directory(temp_dir)
+        raise
     except Exception as e:
+        logger.error("Erro na conversão PDF para Excel: %s", e)
+
         # Limpar arquivos temporários em caso de erro
-        clean_up_temp_directory(temp_dir)
-        raise e
+        if temp_dir:
+            clean_up_temp_directory(temp_dir)
+        raise Exception(f"Erro ao converter PDF para Excel: {str(e)}")
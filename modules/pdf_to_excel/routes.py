@@ -1,24 +1,105 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException
-from .processor import convert_pdf_to_excel
+import os
+from fastapi import APIRouter, HTTPException, Request, Query
+from core.rate_limiter import rate_limiter
+from core.cache import result_cache
+from core.common import (
+    PDF_UPLOAD_OPENAPI, cached_file_response, clean_up_temp_directory, receive_pdf_upload,
+    parse_page_ranges, format_page_ranges
+)
+from core.pdf_info import quota_cost
+from core.triage import triage_pdf, triage_header
+from core.lazy import lazy_import
+from .exporters import OUTPUT_FORMATS, MEDIA_TYPES, parquet_available
+
+# Processor carregado no primeiro uso: pandas e NumPy só quando necessário
+processor = lazy_import("modules.pdf_to_excel.processor")
 
 # Criar router para este módulo
 router = APIRouter()
 
-@router.post("/pdf-to-excel/")
-async def pdf_to_excel_endpoint(file: UploadFile = File(...)):
+@router.post("/pdf-to-excel/", openapi_extra=PDF_UPLOAD_OPENAPI)
+async def pdf_to_excel_endpoint(
+    request: Request,
+    pages: str = Query(None, description="Páginas a converter, ex.: 1-3,5,10-"),
+    format: str = Query("xlsx", description="Formato de saída: xlsx, csv ou parquet")
+):
     """
-    Endpoint para converter PDF para Excel.
+    Endpoint para converter PDF para Excel - LIMITE: 12 PDFs por dia.
+
+    As tabelas são detectadas pela posição das palavras em cada página;
+    os headers X-Tables-Found e X-Rows-Extracted informam o que foi encontrado,
+    e X-PDF-Triage o resultado da triagem (core/triage.py).
     
+    Em CSV ou Parquet cada tabela vira um arquivo; com mais de uma tabela
+    a resposta é um ZIP com os arquivos e um resumo.csv.
+
     Args:
-        file: Arquivo PDF enviado pelo usuário
-        
+        request: Request com o PDF no campo "file" (multipart)
+        pages: Seleção de páginas (padrão: todas)
+        format: Formato de saída (padrão: xlsx)
+
     Returns:
-        FileResponse: Arquivo Excel para download
+        FileResponse: Arquivo para download
     """
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Arquivo não é um PDF")
-    
+    page_ranges = parse_page_ranges(pages)
+    if format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato inválido: {format} (use xlsx, csv ou parquet)")
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="Formato parquet indisponível neste servidor")
+
+    # Receber o PDF direto em disco (tipo e tamanho verificados durante o upload)
+    file = await receive_pdf_upload(request, rate_limiter.max_file_size_bytes, spool=True)
+
+    cached = None
     try:
-        return await convert_pdf_to_excel(file)
+        # Procurar planilha já gerada para o mesmo PDF
+        cache_key = result_cache.make_key_from_digest(
+            file.sha256, "pdf_to_excel", {"pages": format_page_ranges(page_ranges), "format": format}
+        )
+        cached_path = result_cache.get_file(cache_key)
+        if cached_path is not None:
+            # Servir de uma cópia própria: o cache pode remover o arquivo durante o envio
+            extension = os.path.splitext(cached_path)[1]
+            cached = cached_file_response(
+                cached_path, file.filename, extension, MEDIA_TYPES[extension],
+                result_cache.get_file_headers(cache_key)
+            )
+
+        # Triagem antes de cobrar a cota: recusa arquivos patológicos (cada recusa custa 1) e escolhe a fila
+        if cached is None:
+            await triage_pdf(file, "pdf_to_excel", page_ranges, request)
+
+        # Verificar rate limiting para pdf_to_excel
+        if result_cache.should_check_rate_limit(cached is not None):
+            cost = await quota_cost(file, page_ranges)
+            await rate_limiter.check_rate_limit(request, "pdf_to_excel", file.size, cost=cost)
+    except Exception:
+        file.cleanup()
+        if cached is not None:
+            clean_up_temp_directory(os.path.dirname(cached.path))
+        raise
+
+    if cached is not None:
+        file.cleanup()
+        return cached
+
+    try:
+        # Processar o PDF
+        response = await processor.convert_pdf_to_excel(file, page_ranges, format)
+        response.headers["X-PDF-Triage"] = triage_header(file.triage)
+        result_cache.put_file(cache_key, response.path, os.path.splitext(response.path)[1], response.headers)
+        return response
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro na conversão: {str(e)}")
+
+@router.get("/pdf-to-excel/status/")
+async def get_excel_rate_limit_status(request: Request):
+    """Endpoint para verificar status do rate limiting para PDF-to-Excel."""
+    full_status = await rate_limiter.get_status(request)
+    return {
+        "ip": full_status["ip"],
+        "pdf_to_excel": full_status["pdf_to_excel"]
+    }
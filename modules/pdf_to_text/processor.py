@@ -1,77 +1,274 @@
+import asyncio
+import time
+from collections import deque
 import pymupdf
 import logging
+from fastapi import HTTPException
+from core.executor import extraction_executor
+from core.common import get_env_int, select_pages
+from core.metrics import stage, timed_stage, record_throughput
+from core import profiling
 
 logger = logging.getLogger(__name__)
 
-async def convert_pdf_to_text(file):
+# Documentos acima deste número de páginas são divididos em faixas
+PARALLEL_PAGE_THRESHOLD = get_env_int("PDFFACIL_TEXT_PARALLEL_PAGES", 32)
+
+# Tamanho mínimo de cada faixa de páginas enviada a um worker
+MIN_PAGES_PER_RANGE = get_env_int("PDFFACIL_TEXT_MIN_RANGE_PAGES", 16)
+
+# Páginas por faixa no modo streaming (limita a memória a poucas páginas)
+STREAM_RANGE_PAGES = get_env_int("PDFFACIL_TEXT_STREAM_RANGE_PAGES", 4)
+
+def page_texts(doc, page_numbers):
+    """
+    Extrai o texto das páginas e mede quanto cada uma levou.
+    
+    Returns:
+        tuple: (textos, segundos por página)
+    """
+    texts = []
+    seconds = []
+    for page_num in page_numbers:
+        start = time.perf_counter()
+        texts.append(doc[page_num].get_text())
+        seconds.append(time.perf_counter() - start)
+    return texts, seconds
+
+def extract_pages(pdf_path, page_numbers):
+    """
+    Extrai o texto das páginas indicadas (índices a partir de 0) de um PDF.
+    
+    Roda em um processo do pool de extração; cada worker abre o
+    próprio pymupdf.Document a partir do PDF em disco (só o caminho
+    passa pelo pool, não os bytes do documento).
+    
+    Returns:
+        tuple: (textos, segundos por página)
+    """
+    doc = pymupdf.open(pdf_path, filetype="pdf")
+    try:
+        return page_texts(doc, page_numbers)
+    finally:
+        doc.close()
+
+def extract_document(pdf_path, max_inline_pages, page_ranges=None):
+    """
+    Lê informações básicas do PDF, resolve a seleção de páginas e, se
+    a seleção for pequena, já extrai o texto.
+    
+    Returns:
+        tuple: (num_pages, metadata, páginas selecionadas, (textos, segundos por página) ou None)
+    """
+    doc = pymupdf.open(pdf_path, filetype="pdf")
+    try:
+        num_pages = len(doc)
+        metadata = doc.metadata or {}
+        selected = select_pages(page_ranges, num_pages)
+        
+        pages = None
+        if len(selected) <= max_inline_pages:
+            pages = page_texts(doc, selected)
+        
+        return num_pages, metadata, selected, pages
+    finally:
+        doc.close()
+
+def split_page_numbers(page_numbers, workers):
+    """Divide as páginas em blocos contíguos, um ou mais por worker."""
+    size = max(MIN_PAGES_PER_RANGE, -(-len(page_numbers) // max(1, workers)))
+    return [page_numbers[start:start + size] for start in range(0, len(page_numbers), size)]
+
+def check_selection(selected, num_pages):
+    """Recusa seleções que não incluem nenhuma página do documento."""
+    if num_pages and not selected:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Nenhuma das páginas pedidas existe no documento ({num_pages} páginas)"
+        )
+
+def format_metadata(metadata):
+    """Converte os metadados do PyMuPDF para o formato da resposta."""
+    return {
+        "title": metadata.get("title", ""),
+        "author": metadata.get("author", ""),
+        "subject": metadata.get("subject", ""),
+        "creator": metadata.get("creator", ""),
+        "producer": metadata.get("producer", ""),
+        "creation_date": metadata.get("creationDate", ""),
+        "modification_date": metadata.get("modDate", "")
+    }
+
+@timed_stage("convert")
+async def convert_pdf_to_text(file, page_ranges=None):
     """
     Extrai texto de um arquivo PDF usando PyMuPDF.
     
+    O PDF é gravado em disco (file.spool()) e cada job do pool recebe só o
+    caminho; quem chama remove o arquivo com file.cleanup().
+    
     Args:
-        file: Arquivo PDF enviado pelo usuário
-        
+        file: UploadedPDF recebido pelo upload
+        page_ranges: Seleção de páginas (core.common.parse_page_ranges) ou None
+    
     Returns:
         dict: Dados extraídos do PDF
     """
     try:
-        # Ler o conteúdo do arquivo
-        content = await file.read()
-        logger.info(f"PDF recebido: {len(content)} bytes")
+        # Gravar o PDF em disco uma vez; os workers abrem pelo caminho
+        pdf_path = file.spool()
+        logger.info("PDF recebido: %s bytes", file.size)
         
-        # Abrir PDF com PyMuPDF
-        doc = pymupdf.open(stream=content, filetype="pdf")
+        # Abrir PDF no pool de extração (seleções pequenas saem prontas daqui)
+        with stage("open"):
+            num_pages, metadata, selected, pages = await extraction_executor.run(
+                extract_document, pdf_path, PARALLEL_PAGE_THRESHOLD, page_ranges,
+                kind="pdf_to_text", size=file.size, lane=file.lane
+            )
+        check_selection(selected, num_pages)
         
-        # Extrair informações básicas
-        num_pages = len(doc)
-        metadata = doc.metadata
-        
-        # Extrair texto de todas as páginas
-        full_text = ""
-        pages_text = []
-        
-        for page_num in range(num_pages):
-            page = doc[page_num]
-            page_text = page.get_text()
-            pages_text.append({
-                "page": page_num + 1,
-                "text": page_text.strip(),
-                "char_count": len(page_text)
-            })
-            full_text += page_text + "\n"
-        
-        # Fechar documento
-        doc.close()
+        if pages is None:
+            # Documento grande: extrair blocos de páginas em paralelo
+            blocks = split_page_numbers(selected, extraction_executor.max_workers)
+            logger.info("Extraindo %s páginas em %s blocos", len(selected), len(blocks))
+            
+            with stage("extract"):
+                chunks = await asyncio.gather(*[
+                    extraction_executor.run(
+                        extract_pages, pdf_path, block, kind="pdf_to_text", pages=len(block), lane=file.lane
+                    )
+                    for block in blocks
+                ])
+            pages = (
+                [page_text for texts, _ in chunks for page_text in texts],
+                [seconds for _, timings in chunks for seconds in timings]
+            )
+        
+        pages, page_seconds = pages
+        profiling.record_pages(selected, page_seconds)
+        
+        # Montar o texto das páginas, na ordem original (um join só, tempo linear)
+        with stage("assemble"):
+            pages_text = [
+                {
+                    "page": page_num + 1,
+                    "text": page_text.strip(),
+                    "char_count": len(page_text)
+                }
+                for page_num, page_text in zip(selected, pages)
+            ]
+            full_text = "\n".join(pages)
+        
+        # Cada página conta com a quebra de linha que a separa da próxima
+        total_characters = sum(len(page_text) for page_text in pages) + len(pages)
         
         # Preparar resposta
         result = {
             "success": True,
             "filename": file.filename,
             "pages": num_pages,
-            "total_characters": len(full_text),
-            "metadata": {
-                "title": metadata.get("title", ""),
-                "author": metadata.get("author", ""),
-                "subject": metadata.get("subject", ""),
-                "creator": metadata.get("creator", ""),
-                "producer": metadata.get("producer", ""),
-                "creation_date": metadata.get("creationDate", ""),
-                "modification_date": metadata.get("modDate", "")
-            },
+            "pages_processed": len(selected),
+            "total_characters": total_characters,
+            "metadata": format_metadata(metadata),
             "full_text": full_text.strip(),
             "pages_text": pages_text
         }
         
-        logger.info(f"Texto extraído: {num_pages} páginas, {len(full_text)} caracteres")
+        logger.info("Texto extraído: %s/%s páginas, %s caracteres", len(selected), num_pages, total_characters)
+        record_throughput("pdf_to_text", len(selected), file.size)
         return result
+    
+    except HTTPException:
+        # Fila cheia ou timeout do pool: repassar o status original
+        raise
+    except Exception as e:
+        logger.error("Erro ao extrair texto do PDF: %s", e)
+        raise Exception(f"Erro ao processar PDF: {str(e)}")
+
+
+@timed_stage("open")
+async def stream_pdf_to_text(file, page_ranges=None):
+    """
+    Prepara a extração de texto página a página, para respostas em streaming.
+    
+    O PDF é aberto antes de retornar, então erros de leitura aparecem aqui
+    (antes de a resposta começar) e não no meio do stream. Como em
+    convert_pdf_to_text, os workers recebem o caminho do PDF gravado em
+    disco, que quem chama remove com file.cleanup() ao fim do stream.
+    
+    Args:
+        file: UploadedPDF recebido pelo upload
+        page_ranges: Seleção de páginas (core.common.parse_page_ranges) ou None
         
+    Returns:
+        AsyncIterator[dict]: Um registro por página e um registro final de resumo
+    """
+    try:
+        pdf_path = file.spool()
+        logger.info("PDF recebido para streaming: %s bytes", file.size)
+        
+        num_pages, metadata, selected, _ = await extraction_executor.run(
+            extract_document, pdf_path, 0, page_ranges, kind="pdf_to_text", size=file.size, lane=file.lane
+        )
+        check_selection(selected, num_pages)
+        
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Erro ao extrair texto do PDF: {str(e)}")
+        logger.error("Erro ao abrir PDF para streaming: %s", e)
         raise Exception(f"Erro ao processar PDF: {str(e)}")
     
-    finally:
-        # Garantir que o documento seja fechado
+    async def records():
+        blocks = iter([
+            selected[start:start + STREAM_RANGE_PAGES]
+            for start in range(0, len(selected), STREAM_RANGE_PAGES)
+        ])
+        pending = deque()
+        
+        def submit_next():
+            block = next(blocks, None)
+            if block is not None:
+                pending.append((block, asyncio.ensure_future(
+                    extraction_executor.run(
+                        extract_pages, pdf_path, block, kind="pdf_to_text", pages=len(block), lane=file.lane
+                    )
+                )))
+        
+        # Manter alguns blocos adiantados, mas entregar sempre em ordem
+        for _ in range(max(1, extraction_executor.max_workers)):
+            submit_next()
+        
+        total_characters = 0
         try:
-            if 'doc' in locals():
-                doc.close()
-        except:
-            pass
+            while pending:
+                block, task = pending.popleft()
+                with stage("extract"):
+                    texts, page_seconds = await task
+                submit_next()
+                profiling.record_pages(block, page_seconds)
+                
+                for page_num, page_text in zip(block, texts):
+                    total_characters += len(page_text) + 1
+                    yield {
+                        "type": "page",
+                        "page": page_num + 1,
+                        "text": page_text.strip(),
+                        "char_count": len(page_text)
+                    }
+        finally:
+            for _, task in pending:
+                task.cancel()
+        
+        logger.info("Texto transmitido: %s/%s páginas, %s caracteres", len(selected), num_pages, total_characters)
+        record_throughput("pdf_to_text", len(selected), file.size)
+        yield {
+            "type": "summary",
+            "success": True,
+            "filename": file.filename,
+            "pages": num_pages,
+            "pages_processed": len(selected),
+            "total_characters": total_characters,
+            "metadata": format_metadata(metadata)
+        }
+    
+    return records()
@@ -1,51 +1,175 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, Request
-from .processor import convert_pdf_to_text  # ← CORRIGIDO: nome correto da função
+import logging
+from fastapi import APIRouter, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse
 from core.rate_limiter import rate_limiter
+from core.cache import result_cache
+from core.common import PDF_UPLOAD_OPENAPI, UploadedPDF, receive_pdf_upload, parse_page_ranges, format_page_ranges
+from core.pdf_info import quota_cost
+from core.triage import triage_pdf
+from core.lazy import lazy_import
+from core.responses import FastJSONResponse, ndjson_line
+from core.singleflight import single_flight
+
+# Processor carregado no primeiro uso (import pesado fora do cold start)
+processor = lazy_import("modules.pdf_to_text.processor")
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Partes do texto devolvidas: por página, o texto corrido, ou as duas (padrão)
+INCLUDE_OPTIONS = ("pages", "full", "both")
+
+def parse_include(include: str) -> str:
+    """Valida o parâmetro include=."""
+    if include not in INCLUDE_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"include inválido: {include} (use pages, full ou both)")
+    return include
+
+def select_text_parts(result: dict, include: str) -> dict:
+    """
+    Remove do resultado a parte do texto que não foi pedida.
+    
+    O resultado completo fica no cache; só a resposta muda de forma.
+    Com include=pages ou include=full o texto não sai duplicado.
+    """
+    if include == "pages":
+        result.pop("full_text", None)
+    elif include == "full":
+        result.pop("pages_text", None)
+    return result
 
 # Criar router para este módulo
 router = APIRouter()
 
-@router.post("/pdf-to-text/")
-async def pdf_to_text_endpoint(request: Request, file: UploadFile = File(...)):
+@router.post("/pdf-to-text/", openapi_extra=PDF_UPLOAD_OPENAPI)
+async def pdf_to_text_endpoint(
+    request: Request,
+    stream: bool = Query(False, description="Retornar NDJSON, uma linha por página"),
+    pages: str = Query(None, description="Páginas a extrair, ex.: 1-3,5,10-"),
+    include: str = Query("both", description="Texto devolvido: pages (por página), full (corrido) ou both")
+):
     """
     Endpoint para extrair texto de PDF - LIMITE: 40 PDFs por dia.
     
+    Com ?stream=1 (ou Accept: application/x-ndjson) a resposta é NDJSON:
+    uma linha por página, na ordem, seguida de uma linha de resumo com
+    metadados e rate limit.
+    
+    O campo triage traz o resultado da triagem (core/triage.py): páginas,
+    classe do documento (digital ou escaneado), fila e tempo estimado.
+    
+    include=pages ou include=full devolve só uma das formas do texto
+    (pages_text ou full_text), sem repetir o documento inteiro na resposta.
+    
+    Com a cobrança por páginas ligada, o request custa pelas páginas
+    efetivamente processadas (ver RateLimiter.pages_per_unit).
+    
     Args:
-        request: Request para rate limiting
-        file: Arquivo PDF enviado pelo usuário
+        request: Request com o PDF no campo "file" (multipart)
+        stream: Ativa o modo streaming
+        pages: Seleção de páginas (padrão: todas)
+        include: Partes do texto na resposta (padrão: both; ignorado no streaming)
         
     Returns:
-        dict: Dados extraídos do PDF
+        FastJSONResponse ou StreamingResponse: Dados extraídos do PDF
     """
-    # Validar tipo de arquivo
-    if not file.filename.lower().endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Arquivo deve ser um PDF")
+    page_ranges = parse_page_ranges(pages)
+    include = parse_include(include)
+    
+    # Receber o PDF (tipo e tamanho verificados durante o upload, uma cópia em memória)
+    file = await receive_pdf_upload(request, rate_limiter.max_file_size_bytes)
+    
+    # O modo streaming não usa o cache (o resultado nunca fica inteiro em memória)
+    streaming = stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
     
-    # Ler conteúdo para verificar tamanho
-    content = await file.read()
-    file_size = len(content)
+    cache_key = result_cache.make_key_from_digest(
+        file.sha256, "pdf_to_text", {"pages": format_page_ranges(page_ranges)}
+    )
+    cached = None if streaming else result_cache.get_json(cache_key)
     
-    # Verificar rate limiting para pdf_to_text
-    rate_limiter.check_rate_limit(request, "pdf_to_text", file_size)
+    try:
+        # Triagem antes de cobrar a cota: recusa arquivos patológicos (cada recusa custa 1) e escolhe a fila
+        if cached is None:
+            await triage_pdf(file, "pdf_to_text", page_ranges, request)
+        
+        # Verificar rate limiting para pdf_to_text
+        if result_cache.should_check_rate_limit(cached is not None):
+            if cached is not None:
+                cost = rate_limiter.cost_for_pages(cached["pages_processed"])
+            else:
+                cost = await quota_cost(file, page_ranges)
+            await rate_limiter.check_rate_limit(request, "pdf_to_text", file.size, cost=cost)
+    except Exception:
+        # A triagem grava o PDF em disco para o worker
+        file.cleanup()
+        raise
     
-    # Resetar ponteiro do arquivo
-    from io import BytesIO
-    file.file = BytesIO(content)
+    if streaming:
+        return await stream_text_response(request, file, page_ranges)
     
     try:
-        # Processar o PDF - CORRIGIDO: nome da função
-        result = await convert_pdf_to_text(file)
+        if cached is not None:
+            # Mesmo PDF já processado: devolver o resultado em cache
+            result = cached
+            result["filename"] = file.filename
+        else:
+            # Processar o PDF; uploads idênticos simultâneos aguardam a mesma extração
+            result = await single_flight.run(
+                cache_key, lambda: extract_text(file, page_ranges, cache_key), dict, label="pdf_to_text"
+            )
+            result["filename"] = file.filename
+            result["triage"] = file.triage
         
         # Adicionar info de rate limiting na resposta
-        rate_status = rate_limiter.get_status(request)
+        rate_status = await rate_limiter.get_status(request)
         result["rate_limit"] = rate_status["pdf_to_text"]
         
-        return result
+        return FastJSONResponse(select_text_parts(result, include))
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro na extração: {str(e)}")
+    finally:
+        # A extração grava o PDF em disco para os workers
+        file.cleanup()
+
+async def extract_text(file: UploadedPDF, page_ranges, cache_key: str) -> dict:
+    """Extrai o texto e guarda o resultado no cache."""
+    result = await processor.convert_pdf_to_text(file, page_ranges)
+    result_cache.put_json(cache_key, result)
+    return result
+
+async def stream_text_response(request: Request, file: UploadedPDF, page_ranges=None):
+    """Monta a resposta NDJSON do modo streaming."""
+    try:
+        records = await processor.stream_pdf_to_text(file, page_ranges)
+    except HTTPException:
+        file.cleanup()
+        raise
     except Exception as e:
+        file.cleanup()
         raise HTTPException(status_code=500, detail=f"Erro na extração: {str(e)}")
+    
+    async def ndjson_lines():
+        try:
+            async for record in records:
+                if record["type"] == "summary":
+                    record["triage"] = file.triage
+                    record["rate_limit"] = (await rate_limiter.get_status(request))["pdf_to_text"]
+                yield ndjson_line(record)
+        except Exception as e:
+            # Cabeçalhos já enviados: sinalizar o erro como última linha
+            logger.error("Erro durante streaming de texto: %s", e)
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            yield ndjson_line({"type": "error", "success": False, "detail": f"Erro na extração: {detail}"})
+        finally:
+            file.cleanup()
+    
+    return StreamingResponse(ndjson_lines(), media_type=NDJSON_MEDIA_TYPE)
 
 @router.get("/rate-limit-status/")
 async def get_rate_limit_status(request: Request):
     """Endpoint para verificar status do rate limiting."""
-    return rate_limiter.get_status(request)
+    return await rate_limiter.get_status(request)
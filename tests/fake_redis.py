@@ -0,0 +1,176 @@
+"""
+Servidor RESP mínimo, em processo, para testar o RedisStore sem Redis.
+
+Implementa só o que o RedisStore usa (AUTH, SELECT, GET, MGET, INCRBY,
+DECRBY, EXPIRE, TTL, EVAL e EVALSHA), com TTL medido por um relógio que o
+teste controla. Não há interpretador Lua: cada script é registrado com
+uma função Python equivalente (register_script), e EVALSHA de um script
+que ainda não passou por EVAL responde NOSCRIPT, como o Redis.
+"""
+import hashlib
+import socketserver
+import threading
+
+
+class FakeRedisServer:
+    """
+    Inicie com start() e use a url; feche com stop().
+
+    Attributes:
+        now: Relógio do servidor, em segundos (avance para expirar chaves)
+        commands: Comandos recebidos, em ordem
+        drop_after: Nome de um comando após o qual a conexão é fechada sem
+            resposta (o comando é aplicado), uma única vez
+    """
+
+    def __init__(self, password: str = None):
+        self.password = password
+        self.now = 0.0
+        self.commands = []
+        self.drop_after = None
+        self._data = {}
+        self._expires = {}
+        self._scripts = {}
+        self._known = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}{host}:{port}/0"
+
+    def start(self):
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                fake._serve(self.rfile, self.wfile)
+
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def register_script(self, source: str, function):
+        """function(server, keys, args) faz o papel do script Lua source."""
+        self._scripts[source] = function
+
+    def get(self, key):
+        """Valor atual de uma chave (None se não existe ou expirou)."""
+        with self._lock:
+            return self._get(key)
+
+    # Armazenamento (sempre com self._lock)
+
+    def _get(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= self.now:
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return self._data.get(key)
+
+    def _incrby(self, key, amount: int) -> int:
+        value = int(self._get(key) or 0) + amount
+        self._data[key] = str(value)
+        return value
+
+    def _expire(self, key, seconds: int) -> int:
+        if self._get(key) is None:
+            return 0
+        self._expires[key] = self.now + seconds
+        return 1
+
+    # Protocolo
+
+    def _serve(self, rfile, wfile):
+        authenticated = self.password is None
+        while True:
+            command = self._read_command(rfile)
+            if command is None:
+                return
+            name = command[0].upper()
+            self.commands.append(command)
+
+            if name == "AUTH":
+                authenticated = command[1] == self.password
+                reply = "+OK" if authenticated else "-WRONGPASS invalid password"
+            elif not authenticated:
+                reply = "-NOAUTH Authentication required."
+            else:
+                with self._lock:
+                    reply = self._execute(name, command[1:])
+
+            if self.drop_after == name:
+                self.drop_after = None
+                return
+            wfile.write(self._encode(reply))
+            wfile.flush()
+
+    @staticmethod
+    def _read_command(rfile):
+        line = rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(rfile.readline()[1:])
+            args.append(rfile.read(length + 2)[:-2].decode())
+        return args
+
+    def _execute(self, name, args):
+        if name in ("SELECT", "PING"):
+            return "+OK"
+        if name == "GET":
+            return self._get(args[0])
+        if name == "MGET":
+            return [self._get(key) for key in args]
+        if name == "INCRBY":
+            return self._incrby(args[0], int(args[1]))
+        if name == "DECRBY":
+            return self._incrby(args[0], -int(args[1]))
+        if name == "EXPIRE":
+            return self._expire(args[0], int(args[1]))
+        if name == "TTL":
+            if self._get(args[0]) is None:
+                return -2
+            expires = self._expires.get(args[0])
+            return -1 if expires is None else int(expires - self.now)
+        if name in ("EVAL", "EVALSHA"):
+            return self._eval(name, args)
+        return f"-ERR unknown command '{name}'"
+
+    def _eval(self, name, args):
+        script, num_keys = args[0], int(args[1])
+        if name == "EVALSHA":
+            source = self._known.get(script)
+            if source is None:
+                return "-NOSCRIPT No matching script. Please use EVAL."
+        else:
+            source = script
+            self._known[hashlib.sha1(source.encode()).hexdigest()] = source
+
+        function = self._scripts.get(source)
+        if function is None:
+            return "-ERR script not registered in the fake server"
+        keys, script_args = args[2:2 + num_keys], args[2 + num_keys:]
+        return function(self, keys, script_args)
+
+    def _encode(self, reply) -> bytes:
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, bool):
+            reply = int(reply)
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, list):
+            return b"*%d\r\n" % len(reply) + b"".join(self._encode(item) for item in reply)
+        if reply.startswith(("+", "-")):
+            return reply.encode() + b"\r\n"
+        data = reply.encode()
+        return b"$%d\r\n%s\r\n" % (len(data), data)
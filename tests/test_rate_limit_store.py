@@ -0,0 +1,111 @@
+"""RedisStore contra o servidor RESP falso de tests/fake_redis.py."""
+import pytest
+from core.rate_limit_store import CHECK_AND_INCREMENT_SCRIPT, RedisStore
+from tests.fake_redis import FakeRedisServer
+
+BUCKET_SECONDS = 3600
+NUM_BUCKETS = 24
+LIMIT = 10
+
+
+def check_and_increment(server, keys, args):
+    """Equivalente Python de CHECK_AND_INCREMENT_SCRIPT."""
+    amount, limit, ttl = (int(arg) for arg in args)
+    used = sum(int(server._get(key) or 0) for key in keys)
+    if used + amount > limit:
+        return [0, used]
+    server._incrby(keys[0], amount)
+    server._expire(keys[0], ttl)
+    return [1, used]
+
+
+@pytest.fixture
+def server():
+    fake = FakeRedisServer(password="secret")
+    fake.register_script(CHECK_AND_INCREMENT_SCRIPT, check_and_increment)
+    fake.start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def store(server):
+    store = RedisStore(BUCKET_SECONDS, NUM_BUCKETS, server.url, timeout=1.0)
+    yield store
+    store.close()
+
+
+def bucket_key(store, ip, function_name, current_time):
+    return f"{store.prefix}:{function_name}:{ip}:{store.bucket(current_time)}"
+
+
+def test_increment_counts_in_current_bucket(server, store):
+    assert store.check_and_increment("1.1.1.1", "pdf_to_text", LIMIT, 100.0) == (True, 0)
+    assert store.check_and_increment("1.1.1.1", "pdf_to_text", LIMIT, 200.0, amount=3) == (True, 1)
+
+    assert store.get_usage("1.1.1.1", "pdf_to_text", 300.0) == 4
+    assert store.get_usage("1.1.1.1", "pdf_to_docx", 300.0) == 0
+    assert server.get(bucket_key(store, "1.1.1.1", "pdf_to_text", 300.0)) == "4"
+
+
+def test_evalsha_falls_back_to_eval_once(server, store):
+    store.check_and_increment("1.1.1.1", "pdf_to_text", LIMIT, 100.0)
+    store.check_and_increment("1.1.1.1", "pdf_to_text", LIMIT, 100.0)
+
+    names = [command[0] for command in server.commands if command[0].startswith("EVAL")]
+    assert names == ["EVALSHA", "EVAL", "EVALSHA"]
+
+
+def test_over_limit_is_rejected_without_charging(server, store):
+    assert store.check_and_increment("1.1.1.1", "pdf_to_text", LIMIT, 100.0, amount=8) == (True, 0)
+
+    # Não cabe: nada é registrado
+    assert store.check_and_increment("1.1.1.1", "pdf_to_text", LIMIT, 100.0, amount=3) == (False, 8)
+    assert store.get_usage("1.1.1.1", "pdf_to_text", 100.0) == 8
+
+    # O que ainda cabe continua sendo aceito
+    assert store.check_and_increment("1.1.1.1", "pdf_to_text", LIMIT, 100.0, amount=2) == (True, 8)
+    assert store.check_and_increment("1.1.1.1", "pdf_to_text", LIMIT, 100.0) == (False, 10)
+
+
+def test_window_slides_and_keys_expire(server, store):
+    store.check_and_increment("1.1.1.1", "pdf_to_text", LIMIT, 100.0, amount=LIMIT)
+    later = 100.0 + 5 * BUCKET_SECONDS
+    assert store.check_and_increment("1.1.1.1", "pdf_to_text", LIMIT, later) == (False, LIMIT)
+
+    # Um dia depois o balde saiu da janela
+    next_day = 100.0 + NUM_BUCKETS * BUCKET_SECONDS
+    assert store.get_usage("1.1.1.1", "pdf_to_text", next_day) == 0
+
+    # E a chave expira no servidor pelo TTL
+    key = bucket_key(store, "1.1.1.1", "pdf_to_text", 100.0)
+    server.now = BUCKET_SECONDS * (NUM_BUCKETS + 1) - 1
+    assert server.get(key) == str(LIMIT)
+    server.now += 1
+    assert server.get(key) is None
+
+
+def test_write_is_not_resent_after_connection_drop(server, store):
+    store.check_and_increment("1.1.1.1", "pdf_to_text", LIMIT, 100.0)
+
+    # O servidor aplica o script e cai antes de responder
+    server.drop_after = "EVALSHA"
+    with pytest.raises((OSError, ConnectionError)):
+        store.check_and_increment("1.1.1.1", "pdf_to_text", LIMIT, 100.0)
+
+    # Cobrado uma vez só, e a próxima chamada usa uma conexão nova
+    assert store.get_usage("1.1.1.1", "pdf_to_text", 100.0) == 2
+
+
+def test_read_is_retried_after_connection_drop(server, store):
+    store.check_and_increment("1.1.1.1", "pdf_to_text", LIMIT, 100.0)
+
+    server.drop_after = "MGET"
+    assert store.get_usage("1.1.1.1", "pdf_to_text", 100.0) == 1
+
+
+def test_wrong_password_is_reported(server):
+    store = RedisStore(BUCKET_SECONDS, NUM_BUCKETS, server.url.replace("secret", "wrong"), timeout=1.0)
+    with pytest.raises(Exception, match="WRONGPASS"):
+        store.get_usage("1.1.1.1", "pdf_to_text", 100.0)
+    store.close()